@@ -1,5 +1,8 @@
+import os
 from pathlib import Path
 
+import django
+
 BASE_DIR = Path(__file__).resolve().parent.parent
 
 SECRET_KEY = 'django-insecure-change-this-secret-key'
@@ -54,13 +57,73 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'alx_backend_graphql.wsgi.application'
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# Database profile, chosen with CRM_DB_PROFILE ("sqlite" by default, or
+# "postgres"). See crm/db.py for the per-connection SQLite pragmas.
+CRM_DB_PROFILE = os.environ.get('CRM_DB_PROFILE', 'sqlite')
+
+if CRM_DB_PROFILE == 'postgres':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('POSTGRES_DB', 'crm'),
+            'USER': os.environ.get('POSTGRES_USER', 'crm'),
+            'PASSWORD': os.environ.get('POSTGRES_PASSWORD', ''),
+            'HOST': os.environ.get('POSTGRES_HOST', 'localhost'),
+            'PORT': os.environ.get('POSTGRES_PORT', '5432'),
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {},
+        }
+    }
+    if django.VERSION >= (5, 1):
+        # psycopg 3 pool (pip install "psycopg[pool]"); requires CONN_MAX_AGE = 0.
+        DATABASES['default']['OPTIONS']['pool'] = {
+            'min_size': int(os.environ.get('CRM_DB_POOL_MIN', 2)),
+            'max_size': int(os.environ.get('CRM_DB_POOL_MAX', 10)),
+            'timeout': 10,
+        }
+        DATABASES['default']['CONN_MAX_AGE'] = 0
+    else:
+        # No built-in pool: keep connections open per thread (or use PgBouncer).
+        DATABASES['default']['CONN_MAX_AGE'] = int(os.environ.get('CRM_DB_CONN_MAX_AGE', 60))
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': BASE_DIR / 'db.sqlite3',
+            # Reuse a thread's connection (and its pragmas) across requests.
+            # Set CRM_DB_CONN_MAX_AGE=0 under ASGI, where Django recommends
+            # against persistent connections.
+            'CONN_MAX_AGE': int(os.environ.get('CRM_DB_CONN_MAX_AGE', 600)),
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {},
+        }
     }
+    if django.VERSION >= (5, 1):
+        # BEGIN IMMEDIATE: transactions take the write lock up front, so they
+        # wait (busy_timeout) rather than fail when upgrading a read lock.
+        DATABASES['default']['OPTIONS']['transaction_mode'] = 'IMMEDIATE'
+
+# Read replicas (see crm/routing.py): GraphQL query operations read from one
+# of these aliases; mutations, jobs and commands use the primary. Replicas are
+# listed in CRM_DB_REPLICAS as comma-separated SQLite files or Postgres hosts.
+# Under `manage.py test` they mirror the test database.
+for index, replica in enumerate(filter(None, os.environ.get('CRM_DB_REPLICAS', '').split(','))):
+    DATABASES[f'replica{index + 1}'] = {
+        **DATABASES['default'],
+        **({'HOST': replica} if CRM_DB_PROFILE == 'postgres' else {'NAME': replica}),
+        'TEST': {'MIRROR': 'default'},
+    }
+DATABASE_ROUTERS = ['crm.routing.ReplicaRouter']
+CRM_DB_ROUTING = {
+    'REPLICAS': [alias for alias in DATABASES if alias != 'default'],
 }
 
+# SQLite connections get crm/db.py's DEFAULT_SQLITE_PRAGMAS (NORMAL sync, mmap,
+# 64 MiB cache, 5s busy timeout). Override single pragmas with
+# CRM_SQLITE_PRAGMAS = {'name': value}; None keeps SQLite's own default.
+# WAL is stored in the database file, so it is switched once per database:
+# python manage.py sqlite_journal_mode wal
+
 AUTH_PASSWORD_VALIDATORS = []
 LANGUAGE_CODE = 'en-us'
 TIME_ZONE = 'UTC'
@@ -69,12 +132,95 @@ USE_TZ = True
 STATIC_URL = 'static/'
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Backend for the ranked `search` filter argument (see crm/search.py):
+# "auto", "sqlite_fts", "postgres_trgm" or "like".
+CRM_SEARCH_BACKEND = 'auto'
+
+# Parsed/validated GraphQL documents kept in memory (LRU, per process), and
+# how long Automatic Persisted Query texts stay in the Django cache (seconds,
+# None = forever).
+CRM_DOCUMENT_CACHE_SIZE = 500
+CRM_PERSISTED_QUERY_TIMEOUT = 7 * 24 * 3600
+
+# Django cache used for persisted queries and the response cache. LocMem is
+# per process; point this at a shared backend (FileBasedCache, or Redis via
+# django.core.cache.backends.redis.RedisCache) when running several workers,
+# or cache invalidation will not reach the other processes.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
+# Opt-in cache for read-only GraphQL responses (see crm/response_cache.py).
+# MAX_AGE holds per-root-field cacheControl hints in seconds. Responses read
+# from a CRM_DB_REPLICAS replica are never stored, so with replicas the cache
+# stores next to nothing.
+CRM_RESPONSE_CACHE = {
+    'ENABLED': False,
+    'CACHE': 'default',
+    'DEFAULT_MAX_AGE': 0,
+    'MAX_AGE': {
+        'allProducts': 300,
+        'allCustomers': 300,
+    },
+}
+
+# Static query cost limits enforced during validation (see crm/query_cost.py).
+# Cost = objects a document can return; FAN_OUT estimates nested connections
+# queried without first/last.
+CRM_QUERY_COST = {
+    'MAX_COST': 50000,
+    'MAX_DEPTH': 15,
+    'FAN_OUT': {
+        'CustomerType.orders': 10,
+        'OrderType.products': 5,
+    },
+}
+
+# GraphQL tracing (see crm/tracing.py): per-operation histograms at /metrics,
+# one "crm.tracing" log record per operation, and extensions.tracing for
+# requests sending "X-CRM-Trace: 1" (DEBUG or staff users only). /metrics is
+# likewise DEBUG or staff only, unless the scraper sends
+# "Authorization: Bearer <CRM_METRICS_TOKEN>".
+CRM_TRACING = {
+    'HEADER': 'HTTP_X_CRM_TRACE',
+    'BUCKETS': (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5),
+    'METRICS_TOKEN': os.environ.get('CRM_METRICS_TOKEN'),
+}
+
+# Transport-level batching: a JSON array POSTed to /graphql runs in one request
+# (one middleware pass, shared DataLoaders and DB connection). PARALLEL_READS
+# runs consecutive queries of a batch concurrently (see crm/views.py).
+CRM_GRAPHQL_BATCH = {
+    'ENABLED': True,
+    'MAX_SIZE': 20,
+    'PARALLEL_READS': False,
+}
+
 GRAPHENE = {
     'SCHEMA': 'alx_backend_graphql.schema.schema'
 }
 
+# Periodic jobs (see crm/jobs.py). Run them with the long-lived
+# `manage.py run_jobs`; the django_crontab entries below go through the same
+# lock and interval guard, so enabling both never runs a job twice.
+CRM_JOBS = {
+    'heartbeat': {'callable': 'crm.cron.log_crm_heartbeat', 'interval': 5 * 60},
+    'low_stock': {'callable': 'crm.cron.update_low_stock', 'interval': 12 * 3600},
+}
+
+# Background task types (see crm/tasks.py), run by `manage.py run_worker`.
+# "concurrency" caps running tasks of a type across all workers; failures are
+# retried after "backoff" seconds, doubling, up to "max_attempts".
+CRM_TASKS = {
+    'restock_low_stock': {'callable': 'crm.tasks.restock_low_stock', 'concurrency': 1},
+    'bulk_create_customers': {'callable': 'crm.tasks.bulk_create_customers', 'concurrency': 2},
+    'cleanup_inactive_customers': {'callable': 'crm.tasks.cleanup_inactive_customers', 'concurrency': 1},
+}
+
 # Cron job definitions
 CRONJOBS = [
-    ('*/5 * * * *', 'crm.cron.log_crm_heartbeat'),  # Every 5 minutes
-    ('0 */12 * * *', 'crm.cron.update_low_stock'),  # Every 12 hours
+    ('*/5 * * * *', 'crm.cron.run_heartbeat_job'),  # Every 5 minutes
+    ('0 */12 * * *', 'crm.cron.run_low_stock_job'),  # Every 12 hours
 ]
\ No newline at end of file
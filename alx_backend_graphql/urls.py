@@ -1,9 +1,11 @@
 from django.contrib import admin
 from django.urls import path
-from graphene_django.views import GraphQLView
 from django.views.decorators.csrf import csrf_exempt
+from crm.views import CRMGraphQLView, export_orders_view, metrics_view
 
 urlpatterns = [
     path('admin/', admin.site.urls),
-    path("graphql", csrf_exempt(GraphQLView.as_view(graphiql=True))),
+    path("graphql", csrf_exempt(CRMGraphQLView.as_view(graphiql=True))),
+    path("metrics", metrics_view),
+    path("exports/orders.<str:fmt>", export_orders_view),
 ]
@@ -0,0 +1,84 @@
+"""Compare the analytics queries served from rollups with aggregating orders.
+
+    python -m benchmarks.analytics_rollups [orders] [days]
+
+Orders are spread over ``days`` days (a year by default); the rollups are
+built with ``rebuild_analytics``'s one-pass rebuild, which is timed too.
+"""
+import datetime
+import random
+import sys
+import time
+
+from benchmarks.utils import setup_django, teardown, timed
+
+QUERY = """
+{
+  revenueByDay { day orderCount revenue }
+  topProducts(first: 10) { product { name } units revenue }
+}
+"""
+
+
+def main(orders=50000, days=365):
+    old_name = setup_django()
+    try:
+        from django.db.models import Count, Sum
+        from django.db.models.functions import TruncDate
+        from django.utils import timezone
+        from alx_backend_graphql.schema import schema
+        from crm import analytics
+        from crm.models import Customer, Order, Product
+
+        rng = random.Random(0)
+        customers = Customer.objects.bulk_create(
+            Customer(name=f"Customer {i}", email=f"c{i}@example.com") for i in range(2000)
+        )
+        products = Product.objects.bulk_create(
+            Product(name=f"Product {i}", price=rng.randint(1, 500), stock=0) for i in range(200)
+        )
+        now = timezone.now()
+        created = Order.objects.bulk_create(
+            Order(customer=rng.choice(customers)) for _ in range(orders)
+        )
+        for order in created:
+            order.order_date = now - datetime.timedelta(seconds=rng.randint(0, days * 86400))
+        Order.objects.bulk_update(created, ["order_date"], batch_size=5000)
+        through = Order.products.through
+        through.objects.bulk_create(
+            (through(order_id=order.pk, product_id=product.pk)
+             for order in created for product in rng.sample(products, 3)),
+            batch_size=5000,
+        )
+        Order.objects.recompute_totals()
+
+        results = {}
+        with timed(results, "rebuild"):
+            analytics.rebuild()
+
+        def from_orders():
+            list(Order.objects.annotate(day=TruncDate("order_date")).values("day")
+                 .annotate(n=Count("pk"), revenue=Sum("total_amount")).order_by("day"))
+            list(through.objects.values("product_id")
+                 .annotate(units=Count("pk"), revenue=Sum("product__price")).order_by("-revenue")[:10])
+
+        def from_rollups():
+            result = schema.execute(QUERY, context_value=type("Context", (), {})())
+            assert not result.errors, result.errors
+
+        for label, call in (("orders", from_orders), ("rollups", from_rollups)):
+            call()
+            start = time.perf_counter()
+            for _ in range(10):
+                call()
+            results[label] = (time.perf_counter() - start) / 10
+
+        for label, seconds in results.items():
+            print(f"{label:>8}: {seconds * 1000:9.2f}ms")
+        print(f" speedup: {results['orders'] / results['rollups']:.1f}x")
+    finally:
+        teardown(old_name)
+
+
+if __name__ == "__main__":
+    main(*(int(arg) for arg in sys.argv[1:]))
@@ -0,0 +1,61 @@
+"""Compare the legacy per-row BulkCreateCustomers loop with the batched path.
+
+    python -m benchmarks.bulk_create_customers [count] [chunk_size]
+"""
+import json
+import sys
+
+from benchmarks.utils import setup_django, teardown, timed
+
+
+def legacy_bulk_create(entries):
+    """The original implementation: one exists() and one create() per entry."""
+    import re
+    from django.db import transaction
+    from crm.models import Customer
+
+    with transaction.atomic():
+        for entry in entries:
+            if Customer.objects.filter(email=entry["email"]).exists():
+                continue
+            if entry["phone"] and not re.match(r"^\+?\d[\d\-]{7,}$", entry["phone"]):
+                continue
+            Customer.objects.create(**entry)
+
+
+def main(count=5000, chunk_size=500):
+    old_name = setup_django()
+    try:
+        from alx_backend_graphql.schema import schema
+        from crm.models import Customer
+
+        entries = [
+            {"name": f"Customer {i}", "email": f"customer{i}@example.com", "phone": "+1234567890"}
+            for i in range(count)
+        ]
+        mutation = """
+        mutation ($input: [JSONString]!, $chunkSize: Int) {
+          bulkCreateCustomers(input: $input, chunkSize: $chunkSize) { errors }
+        }
+        """
+        results = {}
+        with timed(results, "legacy"):
+            legacy_bulk_create(entries)
+        Customer.objects.all().delete()
+        with timed(results, "batched"):
+            result = schema.execute(mutation, variable_values={
+                "input": [json.dumps(entry) for entry in entries],
+                "chunkSize": chunk_size,
+            })
+        assert not result.errors, result.errors
+        assert Customer.objects.count() == count
+
+        for label, seconds in results.items():
+            print(f"{label:>8}: {seconds:8.3f}s  {count / seconds:10.0f} rows/s")
+        print(f" speedup: {results['legacy'] / results['batched']:.1f}x")
+    finally:
+        teardown(old_name)
+
+
+if __name__ == "__main__":
+    main(*(int(arg) for arg in sys.argv[1:]))
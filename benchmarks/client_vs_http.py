@@ -0,0 +1,90 @@
+"""Compare HTTP and in-process (crm.client) latency for updateLowStockProducts.
+
+    python -m benchmarks.client_vs_http [iterations] [products]
+
+The HTTP side posts JSON to a real socket served by a WSGI server in a
+background thread (one connection per request, as the old gql transport
+did); the in-process side calls GraphQLClient.execute.
+"""
+import json
+import sys
+import threading
+import time
+import urllib.request
+from wsgiref.simple_server import WSGIRequestHandler, make_server
+
+from benchmarks.utils import setup_django, teardown
+
+MUTATION = """
+mutation ($threshold: Int, $increment: Int) {
+  updateLowStockProducts(threshold: $threshold, increment: $increment) {
+    updatedProducts { name stock }
+    message
+  }
+}
+"""
+# Every product is below the threshold on every run, so each call does the same work.
+VARIABLES = {"threshold": 10 ** 9, "increment": 1}
+
+
+class QuietHandler(WSGIRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+def percentile(latencies, fraction):
+    latencies = sorted(latencies)
+    return latencies[min(len(latencies) - 1, int(len(latencies) * fraction))]
+
+
+def measure(label, call, iterations):
+    call()  # warm up caches and connections
+    latencies = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        call()
+        latencies.append(time.perf_counter() - start)
+    print(
+        f"{label:>10}: p50 {percentile(latencies, 0.5) * 1000:7.2f}ms"
+        f"  p99 {percentile(latencies, 0.99) * 1000:7.2f}ms"
+    )
+    return percentile(latencies, 0.5)
+
+
+def main(iterations=200, products=20):
+    old_name = setup_django()
+    try:
+        from django.conf import settings
+        from django.core.wsgi import get_wsgi_application
+        from crm.client import GraphQLClient
+        from crm.models import Product
+
+        Product.objects.bulk_create(Product(name=f"Product {i}", price=5, stock=0) for i in range(products))
+
+        settings.ALLOWED_HOSTS = [*settings.ALLOWED_HOSTS, "127.0.0.1"]
+        server = make_server("127.0.0.1", 0, get_wsgi_application(), handler_class=QuietHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        url = f"http://127.0.0.1:{server.server_port}/graphql"
+        body = json.dumps({"query": MUTATION, "variables": VARIABLES}).encode()
+
+        def over_http():
+            request = urllib.request.Request(url, body, {"Content-Type": "application/json"})
+            with urllib.request.urlopen(request) as response:
+                data = json.loads(response.read())
+            assert "errors" not in data, data
+
+        client = GraphQLClient()
+
+        def in_process():
+            client.execute(MUTATION, VARIABLES)
+
+        http = measure("http", over_http, iterations)
+        local = measure("in-process", in_process, iterations)
+        print(f"   speedup: {http / local:.1f}x")
+        server.shutdown()
+    finally:
+        teardown(old_name)
+
+
+if __name__ == "__main__":
+    main(*(int(arg) for arg in sys.argv[1:]))
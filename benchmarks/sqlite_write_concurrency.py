@@ -0,0 +1,115 @@
+"""Write throughput of concurrent GraphQL mutations on a SQLite file, with
+SQLite's defaults and with the tuned profile from settings.
+
+    python -m benchmarks.sqlite_write_concurrency [seconds] [writers] [readers]
+
+Each profile gets a fresh database file. Writer threads run createOrder and
+createCustomer mutations through crm.client while reader threads page
+through allOrders; failed mutations (e.g. "database is locked" after
+place_order's retries) are counted, not retried again.
+"""
+import os
+import sys
+import tempfile
+import threading
+import time
+
+from benchmarks.utils import BASE_DIR
+
+PROFILES = {
+    # journal_mode=DELETE, synchronous=FULL, deferred transactions, no busy
+    # timeout beyond the sqlite3 module's default 5s. Pragmas are filled in
+    # main() as None overrides of every tuned one.
+    "default": {"pragmas": None, "journal_mode": "DELETE", "options": {}, "conn_max_age": 0},
+    "tuned": None,  # filled from settings in main()
+}
+
+ORDER = 'mutation ($c: ID!, $p: [ID]!) { createOrder(customerId: $c, productIds: $p) { order { id } } }'
+CUSTOMER = 'mutation ($n: String!, $e: String!) { createCustomer(name: $n, email: $e) { customer { id } } }'
+READ = "{ allOrders(first: 20) { edges { node { totalAmount customer { name } } } } }"
+
+
+def run_profile(name, profile, seconds, writers, readers):
+    from django.conf import settings
+    from django.core.management import call_command
+    from django.db import connection, connections
+    from crm.client import GraphQLClient, GraphQLClientError
+    from crm.db import set_journal_mode
+    from crm.models import Customer, Product
+
+    path = os.path.join(tempfile.mkdtemp(), f"{name}.sqlite3")
+    connections.close_all()
+    settings_dict = connections["default"].settings_dict
+    settings_dict.update(NAME=path, CONN_MAX_AGE=profile["conn_max_age"], OPTIONS=dict(profile["options"]))
+    settings.CRM_SQLITE_PRAGMAS = profile["pragmas"]
+    call_command("migrate", verbosity=0)
+    set_journal_mode(connection, profile["journal_mode"])
+    customers = [Customer.objects.create(name=f"C{i}", email=f"c{i}@example.com").pk for i in range(50)]
+    products = [Product.objects.create(name=f"P{i}", price=5, stock=10 ** 6).pk for i in range(20)]
+    journal = connection.cursor().execute("PRAGMA journal_mode").fetchone()[0]
+    connections.close_all()
+
+    client = GraphQLClient()
+    counts = {"writes": 0, "failed": 0, "reads": 0}
+    lock = threading.Lock()
+    deadline = time.perf_counter() + seconds
+
+    def count(key):
+        with lock:
+            counts[key] += 1
+
+    def writer(n):
+        i = 0
+        while time.perf_counter() < deadline:
+            i += 1
+            try:
+                if i % 5:
+                    client.execute(ORDER, {"c": customers[(n + i) % 50], "p": [products[(n * i) % 20]]})
+                else:
+                    client.execute(CUSTOMER, {"n": "New", "e": f"w{n}-{i}@example.com"})
+                count("writes")
+            except GraphQLClientError:
+                count("failed")
+        connection.close()
+
+    def reader():
+        while time.perf_counter() < deadline:
+            client.execute(READ)
+            count("reads")
+        connection.close()
+
+    threads = [threading.Thread(target=writer, args=(n,)) for n in range(writers)]
+    threads += [threading.Thread(target=reader) for _ in range(readers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    print(
+        f"{name:>8} ({journal}): {counts['writes'] / seconds:7.1f} writes/s"
+        f"  {counts['failed']:5d} failed  {counts['reads'] / seconds:7.1f} reads/s"
+    )
+
+
+def main(seconds=5, writers=8, readers=2):
+    sys.path.insert(0, BASE_DIR)
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "alx_backend_graphql.settings")
+    import django
+    django.setup()
+    from django.conf import settings
+
+    from crm.db import DEFAULT_SQLITE_PRAGMAS
+
+    default = settings.DATABASES["default"]
+    PROFILES["default"]["pragmas"] = dict.fromkeys(DEFAULT_SQLITE_PRAGMAS)
+    PROFILES["tuned"] = {
+        "pragmas": getattr(settings, "CRM_SQLITE_PRAGMAS", {}),
+        "journal_mode": "WAL",
+        "options": default.get("OPTIONS", {}),
+        "conn_max_age": default.get("CONN_MAX_AGE", 0),
+    }
+    for name, profile in PROFILES.items():
+        run_profile(name, profile, seconds, writers, readers)
+
+
+if __name__ == "__main__":
+    main(*(int(arg) for arg in sys.argv[1:]))
@@ -0,0 +1,182 @@
+"""Fixed GraphQL benchmark suite; writes the results as JSON.
+
+    python -m benchmarks.suite [--orders N] [--iterations N] [--output FILE] [--baseline FILE]
+
+Seeds a throwaway database with ``manage.py seed_db`` (deterministic from
+--seed), then runs every document in DOCUMENTS against
+``alx_backend_graphql.schema.schema`` and records, per document:
+
+- latency percentiles (p50/p90/p99) and mean, in milliseconds;
+- SQL queries issued by one execution;
+- peak Python memory allocated by one execution (tracemalloc), in KiB.
+
+The JSON has sorted keys and one document per entry, so results from two
+commits can be diffed directly or compared with --baseline.
+"""
+import argparse
+import json
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+from types import SimpleNamespace
+
+from benchmarks.utils import BASE_DIR, setup_django, teardown
+
+DOCUMENTS = {
+    "orders_page": """
+    {
+      allOrders(first: 50) {
+        edges { node { totalAmount orderDate customer { name email } products { edges { node { name price } } } } }
+      }
+    }
+    """,
+    "customers_with_orders": """
+    {
+      allCustomers(first: 50) { edges { node { name email orders { edges { node { totalAmount } } } } } }
+    }
+    """,
+    "customers_keyset": """
+    { allCustomersKeyset(first: 100) { totalCount edges { cursor node { name email } } } }
+    """,
+    "orders_filtered": """
+    {
+      allOrders(first: 50, totalAmount_Gte: 100, customerName: "Customer 1") {
+        edges { node { totalAmount customer { name } } }
+      }
+    }
+    """,
+    "product_search": """
+    { allProducts(first: 20, search: "Product 1") { edges { node { name price stock } } } }
+    """,
+    "low_stock_products": """
+    { allProducts(first: 50, stock_Lte: 10) { edges { node { name stock orders { edges { node { id } } } } } } }
+    """,
+    "analytics": """
+    {
+      revenueByDay { day orderCount revenue }
+      topProducts(first: 10) { product { name } units revenue }
+    }
+    """,
+}
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BASE_DIR, text=True, stderr=subprocess.DEVNULL
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def percentile(sorted_values, fraction):
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))]
+
+
+def measure(schema, document, iterations):
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+
+    def run():
+        # A fresh context per execution, as a request would have.
+        result = schema.execute(document, context_value=SimpleNamespace())
+        assert not result.errors, result.errors
+
+    run()  # warm up the document and connection
+
+    with CaptureQueriesContext(connection) as queries:
+        run()
+    tracemalloc.start()
+    run()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    latencies = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        run()
+        latencies.append((time.perf_counter() - start) * 1000)
+    latencies.sort()
+    return {
+        "p50_ms": round(percentile(latencies, 0.5), 3),
+        "p90_ms": round(percentile(latencies, 0.9), 3),
+        "p99_ms": round(percentile(latencies, 0.99), 3),
+        "mean_ms": round(statistics.fmean(latencies), 3),
+        "sql_queries": len(queries.captured_queries),
+        "peak_memory_kib": round(peak / 1024, 1),
+    }
+
+
+def compare(results, baseline, out=sys.stderr):
+    print(f"{'document':<24}{'p50 ms':>18}{'queries':>14}{'peak KiB':>22}", file=out)
+    for name, current in results["documents"].items():
+        old = baseline.get("documents", {}).get(name)
+        if old is None:
+            continue
+        print(
+            f"{name:<24}"
+            f"{old['p50_ms']:>8.2f} -> {current['p50_ms']:<7.2f}"
+            f"{old['sql_queries']:>5} -> {current['sql_queries']:<5}"
+            f"{old['peak_memory_kib']:>9.1f} -> {current['peak_memory_kib']:<9.1f}",
+            file=out,
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--customers", type=int, default=2000)
+    parser.add_argument("--products", type=int, default=500)
+    parser.add_argument("--orders", type=int, default=20000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--iterations", type=int, default=50)
+    parser.add_argument("--output", help="JSON file to write (default: stdout).")
+    parser.add_argument("--baseline", help="Earlier results to compare against.")
+    args = parser.parse_args()
+
+    old_name = setup_django()
+    try:
+        import django
+        from django.core.management import call_command
+        from alx_backend_graphql.schema import schema
+
+        dataset = {
+            "customers": args.customers, "products": args.products, "orders": args.orders, "seed": args.seed,
+            # A fixed end date keeps the data, and so the results, identical between runs.
+            "until": "2025-01-01",
+        }
+        start = time.perf_counter()
+        call_command("seed_db", **dataset, stdout=sys.stderr)
+        seed_seconds = time.perf_counter() - start
+
+        documents = {}
+        for name, document in DOCUMENTS.items():
+            documents[name] = measure(schema, document, args.iterations)
+            print(f"{name}: {documents[name]}", file=sys.stderr)
+        results = {
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "django": django.get_version(),
+            "iterations": args.iterations,
+            "dataset": dataset,
+            "seed_seconds": round(seed_seconds, 2),
+            "documents": documents,
+        }
+    finally:
+        teardown(old_name)
+
+    encoded = json.dumps(results, indent=2, sort_keys=True) + "\n"
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(encoded)
+    else:
+        sys.stdout.write(encoded)
+    if args.baseline:
+        with open(args.baseline) as f:
+            compare(results, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,37 @@
+import os
+import sys
+import time
+from contextlib import contextmanager
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def setup_django():
+    """Configure Django and switch to a throwaway test database.
+
+    Benchmarks never touch db.sqlite3; call ``teardown()`` with the returned
+    name when done.
+    """
+    sys.path.insert(0, BASE_DIR)
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'alx_backend_graphql.settings')
+    import django
+    django.setup()
+
+    from django.db import connection
+    from django.test.utils import setup_test_environment
+    setup_test_environment()
+    old_name = connection.settings_dict['NAME']
+    connection.creation.create_test_db(verbosity=0)
+    return old_name
+
+
+def teardown(old_name):
+    from django.db import connection
+    connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+@contextmanager
+def timed(results, label):
+    start = time.perf_counter()
+    yield
+    results[label] = time.perf_counter() - start
@@ -0,0 +1,293 @@
+"""Sales rollups behind the analytics fields of crm.schema.Query.
+
+Three tables, keyed by what the queries group on:
+
+- DailySales: orders and revenue per day (``revenueByDay``);
+- ProductDailySales: units and revenue per product and day (``topProducts``);
+- CustomerSales: lifetime orders and revenue per customer
+  (``customerLifetimeValue``).
+
+Revenue is the sum of Order.total_amount; product revenue is the sum of the
+product's price over its order lines. Days are calendar days in the current
+time zone.
+
+crm.signals keeps the rollups current inside the writing transaction, at a
+cost bounded by the rows written rather than by the size of a day or of a
+customer's history:
+
+- a new order, or new lines of an order, add ``F()`` deltas to the rows of
+  their keys (``record_order``, ``record_lines``, ``record_revenue``), one
+  UPDATE (or INSERT) per key;
+- removed lines, deleted orders and orders moved to another day or customer
+  recompute the rows of the affected keys from their orders (``refresh``, an
+  index range scan per key), as a delta cannot undo ``first_order_at`` and
+  ``last_order_at``.
+
+``rebuild`` recomputes everything with one GROUP BY per table.
+
+Prices feed the rollups too. A Product.price change refreshes that product's
+rows (``refresh_products``) once the change commits, outside the request's
+transaction, as a popular product spans many days. Day and customer revenue
+follow Order.total_amount, which keeps the price of the time of the order until
+``recompute_order_totals`` runs; that command refreshes the rollups of the
+orders it recomputes, so they are never staler than the totals themselves.
+"""
+import datetime
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Max, Min, Q, Sum, Value
+from django.db.models.functions import Greatest, Least, TruncDate
+from django.utils import timezone
+
+from crm.models import CustomerSales, DailySales, Order, Product, ProductDailySales
+
+REBUILD_BATCH_SIZE = 1000
+CENTS = Decimal("0.01")
+
+
+def day_bounds(day):
+    start = timezone.make_aware(datetime.datetime.combine(day, datetime.time.min))
+    return start, start + datetime.timedelta(days=1)
+
+
+def on_days(days, field="order_date"):
+    """Q matching ``field`` within any of the days, as index-friendly ranges."""
+    q = Q(pk__in=[])
+    for day in days:
+        start, end = day_bounds(day)
+        q |= Q(**{f"{field}__gte": start, f"{field}__lt": end})
+    return q
+
+
+def rollup_keys(order_ids):
+    """Return the ``(days, customer_ids, product_ids)`` the orders count towards."""
+    days, customer_ids = set(), set()
+    orders = Order.objects.filter(pk__in=order_ids).annotate(day=TruncDate("order_date"))
+    for day, customer_id in orders.values_list("day", "customer_id"):
+        days.add(day)
+        customer_ids.add(customer_id)
+    through = Order.products.through
+    product_ids = set(through.objects.filter(order_id__in=order_ids).values_list("product_id", flat=True))
+    return days, customer_ids, product_ids
+
+
+def add(model, key, deltas, extremes=None):
+    """Add ``deltas`` to the row of ``key``, inserting it if missing.
+
+    ``extremes`` maps a field to ``(Least or Greatest, value)``.
+    """
+    extremes = extremes or {}
+    updates = {field: F(field) + value for field, value in deltas.items()}
+    for field, (func, value) in extremes.items():
+        updates[field] = func(field, Value(value, output_field=model._meta.get_field(field)))
+    if model.objects.filter(**key).update(**updates):
+        return
+    try:
+        with transaction.atomic():
+            model.objects.create(**key, **deltas, **{field: value for field, (_, value) in extremes.items()})
+    except IntegrityError:
+        # Inserted by a concurrent writer meanwhile.
+        model.objects.filter(**key).update(**updates)
+
+
+def record_order(order):
+    """Count a new order (with its current total) towards its day and customer."""
+    total = Order._meta.get_field("total_amount").to_python(order.total_amount)
+    add(DailySales, {"day": timezone.localdate(order.order_date)}, {"order_count": 1, "revenue": total})
+    add(
+        CustomerSales, {"customer_id": order.customer_id}, {"order_count": 1, "revenue": total},
+        {"first_order_at": (Least, order.order_date), "last_order_at": (Greatest, order.order_date)},
+    )
+
+
+def record_revenue(order, delta):
+    """Add a change of an order's total to its day and customer."""
+    if delta:
+        add(DailySales, {"day": timezone.localdate(order.order_date)}, {"revenue": delta})
+        add(CustomerSales, {"customer_id": order.customer_id}, {"revenue": delta})
+
+
+def record_lines(lines, order_revenue=True):
+    """Count new order lines (a queryset of the Order.products through table).
+
+    Product rows always get the lines; with ``order_revenue`` their prices
+    are also added to the orders' days and customers, for lines added after
+    the order was counted with its earlier total.
+    """
+    products = defaultdict(lambda: [0, 0])
+    days, customers = defaultdict(int), defaultdict(int)
+    rows = lines.annotate(day=TruncDate("order__order_date")).values_list(
+        "day", "order__customer_id", "product_id", "product__price"
+    )
+    for day, customer_id, product_id, price in rows:
+        product = products[(day, product_id)]
+        product[0] += 1
+        product[1] += price
+        days[day] += price
+        customers[customer_id] += price
+    for (day, product_id), (units, revenue) in products.items():
+        add(ProductDailySales, {"day": day, "product_id": product_id}, {"units": units, "revenue": revenue})
+    if order_revenue:
+        for day, revenue in days.items():
+            add(DailySales, {"day": day}, {"revenue": revenue})
+        for customer_id, revenue in customers.items():
+            add(CustomerSales, {"customer_id": customer_id}, {"revenue": revenue})
+
+
+def refresh(days=(), customer_ids=(), product_ids=()):
+    """Recompute the rollup rows of the given keys."""
+    days, customer_ids, product_ids = set(days), set(customer_ids), set(product_ids)
+    if days:
+        refresh_days(days)
+        if product_ids:
+            refresh_product_days(product_ids, days)
+    if customer_ids:
+        refresh_customers(customer_ids)
+
+
+def refresh_orders(order_ids, product_ids=()):
+    days, customer_ids, linked = rollup_keys(order_ids)
+    refresh(days, customer_ids, linked | set(product_ids))
+
+
+def refresh_products(product_ids):
+    """Recompute every ProductDailySales row of the products, over all days."""
+    lines = Order.products.through.objects.filter(product_id__in=product_ids)
+    rows = upsert(ProductDailySales, product_daily_rows(lines), ["day", "product"])
+    fresh = {(row.product_id, row.day) for row in rows}
+    stale = [
+        pk for pk, product_id, day in ProductDailySales.objects.filter(product_id__in=product_ids)
+        .values_list("pk", "product_id", "day")
+        if (product_id, day) not in fresh
+    ]
+    if stale:
+        ProductDailySales.objects.filter(pk__in=stale).delete()
+
+
+def upsert(model, rows, unique_fields):
+    objs = [model(**row) for row in rows]
+    update_fields = [
+        f.name for f in model._meta.concrete_fields if not f.primary_key and f.name not in unique_fields
+    ]
+    model.objects.bulk_create(
+        objs, update_conflicts=True, unique_fields=unique_fields, update_fields=update_fields
+    )
+    return objs
+
+
+def daily_rows(orders):
+    return (
+        orders.annotate(day=TruncDate("order_date")).values("day")
+        .annotate(order_count=Count("pk"), revenue=Sum("total_amount"))
+        .order_by("day")
+    )
+
+
+def product_daily_rows(lines):
+    return (
+        lines.annotate(day=TruncDate("order__order_date")).values("product_id", "day")
+        .annotate(units=Count("pk"), revenue=Sum("product__price"))
+        .order_by("day", "product_id")
+    )
+
+
+def customer_rows(orders):
+    return (
+        orders.values("customer_id")
+        .annotate(
+            order_count=Count("pk"), revenue=Sum("total_amount"),
+            first_order_at=Min("order_date"), last_order_at=Max("order_date"),
+        )
+        .order_by("customer_id")
+    )
+
+
+def refresh_days(days):
+    fresh = upsert(DailySales, daily_rows(Order.objects.filter(on_days(days))), ["day"])
+    DailySales.objects.filter(day__in=days).exclude(day__in=[row.day for row in fresh]).delete()
+
+
+def refresh_product_days(product_ids, days):
+    lines = Order.products.through.objects.filter(
+        on_days(days, "order__order_date"), product_id__in=product_ids
+    )
+    rows = upsert(ProductDailySales, product_daily_rows(lines), ["day", "product"])
+    fresh = {(row.product_id, row.day) for row in rows}
+    stale = [
+        pk for pk, product_id, day in ProductDailySales.objects.filter(day__in=days, product_id__in=product_ids)
+        .values_list("pk", "product_id", "day")
+        if (product_id, day) not in fresh
+    ]
+    if stale:
+        ProductDailySales.objects.filter(pk__in=stale).delete()
+
+
+def refresh_customers(customer_ids):
+    orders = Order.objects.filter(customer_id__in=customer_ids)
+    fresh = upsert(CustomerSales, customer_rows(orders), ["customer"])
+    CustomerSales.objects.filter(pk__in=customer_ids).exclude(pk__in=[row.customer_id for row in fresh]).delete()
+
+
+def rebuild():
+    """Recompute every rollup from scratch; return the row counts per table."""
+    through = Order.products.through
+    counts = {}
+    with transaction.atomic():
+        for model, rows in (
+            (DailySales, daily_rows(Order.objects.all())),
+            (ProductDailySales, product_daily_rows(through.objects.all())),
+            (CustomerSales, customer_rows(Order.objects.all())),
+        ):
+            model.objects.all().delete()
+            created = model.objects.bulk_create(
+                (model(**row) for row in rows.iterator(chunk_size=REBUILD_BATCH_SIZE)),
+                batch_size=REBUILD_BATCH_SIZE,
+            )
+            counts[model._meta.model_name] = len(created)
+    return counts
+
+
+# -----------------
+# QUERIES
+# -----------------
+def revenue_by_day(since=None, until=None):
+    """DailySales rows for days in ``[since, until)``, oldest first."""
+    rows = DailySales.objects.order_by("day")
+    if since is not None:
+        rows = rows.filter(day__gte=since)
+    if until is not None:
+        rows = rows.filter(day__lt=until)
+    return rows
+
+
+def top_products(since=None, until=None, limit=10):
+    """Best-selling products by revenue over ``[since, until)``.
+
+    Returns dicts with ``product`` (a Product), ``units`` and ``revenue``.
+    """
+    rows = ProductDailySales.objects.all()
+    if since is not None:
+        rows = rows.filter(day__gte=since)
+    if until is not None:
+        rows = rows.filter(day__lt=until)
+    rows = list(
+        rows.values("product_id")
+        .annotate(units=Sum("units"), revenue=Sum("revenue"))
+        .order_by("-revenue", "-units", "product_id")[:limit]
+    )
+    products = Product.objects.in_bulk([row["product_id"] for row in rows])
+    return [
+        {
+            "product": products[row["product_id"]],
+            "units": row["units"],
+            "revenue": row["revenue"].quantize(CENTS),
+        }
+        for row in rows
+        if row["product_id"] in products
+    ]
+
+
+def customer_lifetime_value(customer_id):
+    return CustomerSales.objects.select_related("customer").filter(pk=customer_id).first()
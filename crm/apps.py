@@ -1,6 +1,5 @@
 # crm/apps.py
 from django.apps import AppConfig
-import os
 
 
 class CrmConfig(AppConfig):
@@ -8,8 +7,11 @@ class CrmConfig(AppConfig):
     name = 'crm'
 
     def ready(self):
-        # Only start the scheduler when running the development server or in a worker
-        if os.environ.get('RUN_MAIN') or 'runserver' in os.sys.argv:
-            # Avoid running twice in development (due to auto-reload)
-            from .scheduler import start_scheduler
-            start_scheduler()
\ No newline at end of file
+        from django.db.backends.signals import connection_created
+        from . import signals  # noqa: F401
+        from .db import apply_sqlite_pragmas
+        from .tracing import install_sql_wrapper
+
+        # Attribute SQL to the GraphQL operation (and field) that ran it.
+        connection_created.connect(install_sql_wrapper, dispatch_uid="crm.tracing")
+        connection_created.connect(apply_sqlite_pragmas, dispatch_uid="crm.db")
\ No newline at end of file
@@ -0,0 +1,59 @@
+"""In-process GraphQL client for internal callers (jobs, scripts, tests).
+
+Runs documents straight against ``alx_backend_graphql.schema.schema``: no
+JSON encoding, no socket, no dependency on a running server. Documents may be
+strings or parsed ``DocumentNode``s such as those built by ``gql.gql()``, and
+are parsed and validated once through crm.documents.document_cache.
+"""
+from types import SimpleNamespace
+
+from graphql import DocumentNode, execute, print_ast
+
+from .documents import document_cache
+
+
+class GraphQLClientError(Exception):
+    """Raised when a document fails validation or execution."""
+
+    def __init__(self, errors, data=None):
+        super().__init__("; ".join(str(error) for error in errors))
+        self.errors = errors
+        self.data = data
+
+
+class GraphQLClient:
+    def __init__(self, schema=None):
+        if schema is None:
+            from alx_backend_graphql.schema import schema
+        self.schema = schema
+
+    def execute(self, document, variable_values=None, operation_name=None, context_value=None):
+        """Execute a document and return its ``data``; raise GraphQLClientError on errors."""
+        if isinstance(document, DocumentNode):
+            document = document.loc.source.body if document.loc else print_ast(document)
+        graphql_schema = self.schema.graphql_schema
+        parsed, errors = document_cache.get(graphql_schema, document)
+        if errors:
+            raise GraphQLClientError(errors)
+        result = execute(
+            graphql_schema,
+            parsed,
+            variable_values=variable_values,
+            operation_name=operation_name,
+            # A fresh context per call, so DataLoader caches never go stale.
+            context_value=context_value if context_value is not None else SimpleNamespace(),
+        )
+        if result.errors:
+            raise GraphQLClientError(result.errors, result.data)
+        return result.data
+
+
+_client = None
+
+
+def get_client():
+    """Return the process-wide GraphQLClient."""
+    global _client
+    if _client is None:
+        _client = GraphQLClient()
+    return _client
@@ -1,8 +1,14 @@
 # crm/cron.py
 import os
 import datetime
-from gql import gql, Client
-from gql.transport.requests import RequestsHTTPTransport
+
+from crm.client import get_client
+from crm.jobs import run_job
+
+
+def execute(query, variables=None):
+    """Run a GraphQL document against the schema in this process."""
+    return get_client().execute(query, variables)
 
 
 def log_crm_heartbeat():
@@ -11,10 +17,7 @@ def log_crm_heartbeat():
     message = f"{timestamp} CRM is alive"
 
     try:
-        transport = RequestsHTTPTransport(url='http://localhost:8000/graphql', verify=False)
-        client = Client(transport=transport, fetch_schema=False)
-        query = gql('{ __typename }')
-        client.execute(query)
+        execute('{ __typename }')
         message += " (GraphQL alive)"
     except Exception as e:
         message += f" (GraphQL down: {e})"
@@ -26,20 +29,22 @@ def log_crm_heartbeat():
 def update_low_stock():
     """Runs every 12 hours to restock low-stock products."""
     timestamp = datetime.datetime.now().isoformat()
-    transport = RequestsHTTPTransport(url='http://localhost:8000/graphql', verify=False)
-    client = Client(transport=transport, fetch_schema=False)
-
-    mutation = gql('''
-    mutation {
-      updateLowStockProducts {
+    mutation = '''
+    mutation ($threshold: Int, $increment: Int) {
+      updateLowStockProducts(threshold: $threshold, increment: $increment) {
         updatedProducts { name stock }
         message
       }
     }
-    ''')
+    '''
 
     try:
-        result = client.execute(mutation)
+        # Tunable per run from the crontab environment, no redeploy needed.
+        variables = {
+            'threshold': int(os.environ.get('CRM_LOW_STOCK_THRESHOLD', 10)),
+            'increment': int(os.environ.get('CRM_LOW_STOCK_INCREMENT', 10)),
+        }
+        result = execute(mutation, variables)
         products = result['updateLowStockProducts']['updatedProducts']
 
         with open('/tmp/low_stock_updates_log.txt', 'a', encoding='utf-8') as f:  # ✅ fixed path
@@ -48,3 +53,14 @@ def update_low_stock():
     except Exception as e:
         with open('/tmp/low_stock_updates_log.txt', 'a', encoding='utf-8') as f:  # ✅ fixed path
             f.write(f"{timestamp} - ERROR: {e}\n")
+        raise
+
+
+# django_crontab entry points: same lock, interval guard and JobRun records
+# as `manage.py run_jobs`, so running both never doubles a job.
+def run_heartbeat_job():
+    run_job("heartbeat")
+
+
+def run_low_stock_job():
+    run_job("low_stock")
@@ -5,21 +5,15 @@
 # Logs deletions with timestamps to /tmp/customer_cleanup_log.txt
 # ---------------------------------------------------------------------------
 
+set -o pipefail
+
 cd "$(dirname "$0")/../.." || exit
 
-timestamp=$(date '+%Y-%m-%d %H:%M:%S')
 log_file="/tmp/customer_cleanup_log.txt"
 
-deleted_count=$(python3 manage.py shell -c "
-from crm.models import Customer
-from datetime import timedelta
-from django.utils import timezone
-
-cutoff_date = timezone.now() - timedelta(days=365)
-inactive_customers = Customer.objects.exclude(order__order_date__gte=cutoff_date)
-count = inactive_customers.count()
-inactive_customers.delete()
-print(count)
-")
-
-echo "[$timestamp] Deleted $deleted_count inactive customers" >> $log_file
+# Chunked set-based delete (see crm/management/commands/cleanup_inactive_customers.py);
+# every progress line is stamped with the time it was written. With pipefail
+# the script exits with the command's status, not the loop's.
+python3 manage.py cleanup_inactive_customers --chunk-size 500 2>&1 | while IFS= read -r line; do
+    echo "[$(date '+%Y-%m-%d %H:%M:%S')] $line"
+done >> "$log_file"
@@ -0,0 +1,56 @@
+"""Customer creation shared by the mutations and the background tasks."""
+import re
+
+from django.db import transaction
+
+from crm.models import Customer
+from crm.response_cache import bump_versions
+from crm.search import get_search_backend
+
+PHONE_RE = re.compile(r"^\+?\d[\d\-]{7,}$")
+BULK_CHUNK_SIZE = 500
+
+
+@transaction.atomic
+def bulk_create_customers(entries, chunk_size=BULK_CHUNK_SIZE):
+    """Validate and insert customer dicts; return ``(customers, errors)``.
+
+    Invalid entries are reported in ``errors`` and skipped; the rest are
+    inserted in chunks of ``chunk_size``.
+    """
+    customers = []
+    errors = []
+    seen_emails = set()
+    for start in range(0, len(entries), chunk_size):
+        chunk = entries[start:start + chunk_size]
+        # One email__in query per chunk instead of one exists() per entry.
+        emails = [entry.get("email") for entry in chunk if isinstance(entry, dict)]
+        existing = set(
+            Customer.objects.filter(email__in=[e for e in emails if e])
+            .values_list("email", flat=True)
+        )
+        pending = []
+        for entry in chunk:
+            if not isinstance(entry, dict):
+                errors.append(f"Invalid entry: {entry}")
+                continue
+            name = entry.get("name")
+            email = entry.get("email")
+            phone = entry.get("phone")
+            if not name or not email:
+                errors.append(f"Missing name or email: {entry}")
+            elif email in existing or email in seen_emails:
+                errors.append(f"Duplicate email: {email}")
+            elif phone and not PHONE_RE.match(phone):
+                errors.append(f"Invalid phone: {phone}")
+            else:
+                seen_emails.add(email)
+                pending.append(Customer(name=name, email=email, phone=phone))
+        created = Customer.objects.bulk_create(pending)
+        # bulk_create sends no post_save, so index the rows here.
+        get_search_backend().index(Customer, [customer.pk for customer in created])
+        customers.extend(created)
+    if customers:
+        # Nor does it reach invalidate_model: drop cached customer responses.
+        bump_versions("customer")
+    return customers, errors
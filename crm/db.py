@@ -0,0 +1,48 @@
+"""Per-connection database tuning (the settings side is in settings.DATABASES).
+
+For SQLite, ``DEFAULT_SQLITE_PRAGMAS`` is applied to every new connection
+(connected in CrmConfig.ready). ``settings.CRM_SQLITE_PRAGMAS`` overrides
+single pragmas; a value of None leaves that pragma at SQLite's default.
+
+- ``synchronous=NORMAL``: fsync at checkpoints only, safe under WAL;
+- ``mmap_size`` / ``cache_size``: keep hot pages in memory;
+- ``busy_timeout``: wait for the write lock instead of failing at once with
+  "database is locked".
+
+The journal mode is not among them: WAL is a property of the database file,
+stored in its header, so setting it on every connection would rewrite the
+file on first use. Switch it once per database with ``set_journal_mode``
+(``manage.py sqlite_journal_mode wal``); readers then no longer block the
+writer or vice versa.
+
+Other vendors are left alone.
+"""
+from django.conf import settings
+
+DEFAULT_SQLITE_PRAGMAS = {
+    "synchronous": "NORMAL",
+    "mmap_size": 256 * 1024 * 1024,
+    # Negative: size in KiB (64 MiB) rather than in pages.
+    "cache_size": -64 * 1024,
+    # Milliseconds.
+    "busy_timeout": 5000,
+}
+
+
+def sqlite_pragmas():
+    pragmas = {**DEFAULT_SQLITE_PRAGMAS, **getattr(settings, "CRM_SQLITE_PRAGMAS", {})}
+    return {name: value for name, value in pragmas.items() if value is not None}
+
+
+def apply_sqlite_pragmas(sender, connection, **kwargs):
+    if connection.vendor != "sqlite":
+        return
+    with connection.cursor() as cursor:
+        for name, value in sqlite_pragmas().items():
+            cursor.execute(f"PRAGMA {name} = {value}")
+
+
+def set_journal_mode(connection, mode="WAL"):
+    """Switch a SQLite database's journal mode; return the mode now in effect."""
+    with connection.cursor() as cursor:
+        return cursor.execute(f"PRAGMA journal_mode = {mode}").fetchone()[0]
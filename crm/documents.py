@@ -0,0 +1,106 @@
+"""Parsed/validated GraphQL document cache and persisted-query storage."""
+import hashlib
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from graphql import parse, validate
+from graphql.error import GraphQLError
+
+
+def query_hash(query):
+    return hashlib.sha256(query.encode("utf-8")).hexdigest()
+
+
+class DocumentCache:
+    """Thread-safe LRU of ``(document, errors)`` keyed by query hash and rules.
+
+    Parse and validation errors are cached too, so a client repeating a bad
+    document does not pay for parsing it again.
+    """
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = 0
+
+    def get(self, schema, query, rules=None):
+        key = (query_hash(query), tuple(rules or ()))
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry
+            self.misses += 1
+
+        try:
+            document = parse(query)
+        except GraphQLError as error:
+            entry = (None, [error])
+        else:
+            entry = (document, validate(schema, document, rules))
+
+        with self._lock:
+            self._entries[key] = entry
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return entry
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = self.evictions = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+document_cache = DocumentCache(getattr(settings, "CRM_DOCUMENT_CACHE_SIZE", 500))
+
+
+# -----------------
+# AUTOMATIC PERSISTED QUERIES
+# -----------------
+class PersistedQueryError(Exception):
+    def __init__(self, message, code):
+        super().__init__(message)
+        self.code = code
+
+    def as_error(self):
+        return {"message": str(self), "extensions": {"code": self.code}}
+
+
+def resolve_persisted_query(query, extensions):
+    """Apply the Apollo APQ protocol and return the query text to run.
+
+    A request carrying only ``extensions.persistedQuery.sha256Hash`` is looked
+    up in the Django cache; a request carrying both the text and the hash
+    registers the text after checking the hash.
+    """
+    persisted = (extensions or {}).get("persistedQuery")
+    if not persisted:
+        return query
+    if persisted.get("version") != 1:
+        raise PersistedQueryError("Unsupported persisted query version", "PERSISTED_QUERY_NOT_SUPPORTED")
+    digest = persisted.get("sha256Hash")
+    key = f"crm:apq:{digest}"
+    if query:
+        if query_hash(query) != digest:
+            raise PersistedQueryError("provided sha does not match query", "INVALID_SHA256_HASH")
+        cache.set(key, query, getattr(settings, "CRM_PERSISTED_QUERY_TIMEOUT", None))
+        return query
+    query = cache.get(key)
+    if query is None:
+        raise PersistedQueryError("PersistedQueryNotFound", "PERSISTED_QUERY_NOT_FOUND")
+    return query
@@ -0,0 +1,83 @@
+"""Streaming order export (NDJSON or CSV).
+
+Rows are read with ``values_list().iterator(chunk_size)`` in
+``(order_date, id)`` order, which crm_order_date_id_idx serves directly, and
+encoded one line at a time, so memory stays flat for any number of orders.
+Used by the export_orders command and the /exports/orders.<format> view.
+"""
+import csv
+import datetime
+import io
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from crm.models import Order
+
+CHUNK_SIZE = 2000
+
+# (output column, ORM lookup)
+ORDER_COLUMNS = (
+    ("id", "pk"),
+    ("order_date", "order_date"),
+    ("total_amount", "total_amount"),
+    ("customer_id", "customer_id"),
+    ("customer_name", "customer__name"),
+    ("customer_email", "customer__email"),
+)
+
+FORMATS = ("ndjson", "csv")
+
+
+def parse_moment(value):
+    """Parse an ISO date or datetime argument; dates mean midnight."""
+    if value is None:
+        return None
+    moment = parse_datetime(value)
+    if moment is None:
+        day = parse_date(value)
+        if day is None:
+            raise ValueError(f"Invalid date: {value}")
+        moment = datetime.datetime.combine(day, datetime.time.min)
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
+
+
+def order_rows(since=None, until=None, chunk_size=CHUNK_SIZE):
+    orders = Order.objects.order_by("order_date", "pk")
+    if since is not None:
+        orders = orders.filter(order_date__gte=since)
+    if until is not None:
+        orders = orders.filter(order_date__lt=until)
+    return orders.values_list(*(lookup for _, lookup in ORDER_COLUMNS)).iterator(chunk_size=chunk_size)
+
+
+def ndjson_lines(rows):
+    columns = [name for name, _ in ORDER_COLUMNS]
+    encoder = DjangoJSONEncoder()
+    for row in rows:
+        yield encoder.encode(dict(zip(columns, row))) + "\n"
+
+
+def csv_lines(rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    def flush():
+        line = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        return line
+
+    writer.writerow([name for name, _ in ORDER_COLUMNS])
+    yield flush()
+    for row in rows:
+        writer.writerow(value.isoformat() if hasattr(value, "isoformat") else value for value in row)
+        yield flush()
+
+
+def export_lines(fmt, since=None, until=None, chunk_size=CHUNK_SIZE):
+    rows = order_rows(since, until, chunk_size)
+    return ndjson_lines(rows) if fmt == "ndjson" else csv_lines(rows)
@@ -0,0 +1,170 @@
+import base64
+import json
+from functools import partial
+
+import graphene
+from django.core.exceptions import ValidationError
+from django.db.models import F, Q
+from graphene.types.utils import get_type
+from graphene_django.filter import DjangoFilterConnectionField
+
+from .loaders import get_loaders
+
+# Connection arguments that are handled by slicing, not by the filterset.
+PAGINATION_ARGS = {"first", "last", "before", "after", "offset"}
+# Page size of a keyset connection queried without first/last and without a
+# max limit (RELAY_CONNECTION_MAX_LIMIT = None).
+DEFAULT_PAGE_SIZE = 100
+
+
+def has_filter_args(args):
+    return any(value is not None for key, value in args.items() if key not in PAGINATION_ARGS)
+
+
+class BatchedFilterConnectionField(DjangoFilterConnectionField):
+    """DjangoFilterConnectionField that cooperates with the request DataLoaders.
+
+    Resolvers may return a plain list coming from a loader; it is paginated as
+    is instead of being pushed through the filterset. Every resolved page primes
+    the loaders so the nodes' relations are fetched in one batch.
+    """
+
+    @classmethod
+    def resolve_queryset(cls, connection, iterable, info, args, filtering_args, filterset_class):
+        if isinstance(iterable, list):
+            return iterable
+        return super().resolve_queryset(
+            connection, iterable, info, args, filtering_args, filterset_class
+        )
+
+    @classmethod
+    def connection_resolver(cls, resolver, connection, default_manager, queryset_resolver,
+                            max_limit, enforce_first_or_last, root, info, **args):
+        result = super().connection_resolver(
+            resolver, connection, default_manager, queryset_resolver,
+            max_limit, enforce_first_or_last, root, info, **args
+        )
+        get_loaders(info.context).prime(edge.node for edge in result.edges)
+        return result
+
+class KeysetConnection(graphene.relay.Connection):
+    """Connection for KeysetConnectionField.
+
+    ``totalCount`` is resolved lazily, so the COUNT(*) only runs when a client
+    selects it.
+    """
+
+    class Meta:
+        abstract = True
+
+    total_count = graphene.Int()
+
+    def resolve_total_count(self, info):
+        return self.iterable.count()
+
+
+class KeysetConnectionField(DjangoFilterConnectionField):
+    """Cursor-based (keyset) pagination over ``(key, id)``.
+
+    Cursors encode the key and id of the edge's node, and pages are fetched
+    with a seek predicate ``key < value OR (key = value AND id < pk)`` plus a
+    LIMIT, so page N costs the same as page 1 on an index over ``(key, id)``.
+    """
+
+    def __init__(self, type_, key, descending=True, **kwargs):
+        self.key = key
+        self.descending = descending
+        super().__init__(type_, **kwargs)
+        # Offsets are what keyset pagination replaces.
+        self._base_args.pop("offset", None)
+
+    @property
+    def type(self):
+        return get_type(self._type)
+
+    def encode_cursor(self, node):
+        value = node._keyset_value
+        if hasattr(value, "isoformat"):
+            # Full precision: DjangoJSONEncoder would drop microseconds.
+            value = value.isoformat()
+        payload = json.dumps([value, node.pk], default=str)
+        return base64.urlsafe_b64encode(payload.encode()).decode()
+
+    def decode_cursor(self, cursor):
+        try:
+            value, pk = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+            field = self.model._meta.get_field(self.key)
+            return field.to_python(value), int(pk)
+        except (ValueError, TypeError, ValidationError):
+            raise ValidationError(f"Invalid cursor: {cursor}")
+
+    def seek(self, cursor, forward):
+        value, pk = self.decode_cursor(cursor)
+        lookup = "lt" if forward == self.descending else "gt"
+        return Q(**{f"{self.key}__{lookup}": value}) | Q(**{self.key: value, f"pk__{lookup}": pk})
+
+    def paginate(self, queryset, first=None, last=None, after=None, before=None):
+        ordering = [self.key, "pk"]
+        if self.descending:
+            ordering = [f"-{name}" for name in ordering]
+        filtered = queryset
+        queryset = queryset.annotate(_keyset_value=F(self.key)).order_by(*ordering)
+        if after:
+            queryset = queryset.filter(self.seek(after, forward=True))
+        if before:
+            queryset = queryset.filter(self.seek(before, forward=False))
+
+        backward = last is not None and first is None
+        limit = last if backward else first
+        if backward:
+            queryset = queryset.reverse()
+        if limit is None:
+            nodes, has_more = list(queryset), False
+        else:
+            # One extra row tells whether another page exists, without a COUNT.
+            nodes = list(queryset[:limit + 1])
+            has_more = len(nodes) > limit
+            nodes = nodes[:limit]
+        if backward:
+            nodes.reverse()
+
+        connection_type = self.connection_type
+        edges = [connection_type.Edge(node=node, cursor=self.encode_cursor(node)) for node in nodes]
+        page_info = graphene.relay.PageInfo(
+            start_cursor=edges[0].cursor if edges else None,
+            end_cursor=edges[-1].cursor if edges else None,
+            has_previous_page=has_more if backward else bool(after),
+            has_next_page=bool(before) if backward else has_more,
+        )
+        connection = connection_type(edges=edges, page_info=page_info)
+        connection.iterable = filtered
+        return connection
+
+    def keyset_resolver(self, resolver, default_manager, queryset_resolver, root, info, **args):
+        first = args.get("first")
+        last = args.get("last")
+        for name, value in (("first", first), ("last", last)):
+            if value is None:
+                continue
+            if self.max_limit and not 0 <= value <= self.max_limit:
+                raise ValidationError(f"`{name}` must be between 0 and {self.max_limit}.")
+            if value < 0:
+                raise ValidationError(f"`{name}` must not be negative.")
+        if first is None and last is None:
+            first = self.max_limit or DEFAULT_PAGE_SIZE
+
+        iterable = resolver(root, info, **args)
+        if iterable is None:
+            iterable = default_manager
+        queryset = queryset_resolver(self.connection_type, iterable, info, args)
+        connection = self.paginate(queryset, first, last, args.get("after"), args.get("before"))
+        get_loaders(info.context).prime(edge.node for edge in connection.edges)
+        return connection
+
+    def wrap_resolve(self, parent_resolver):
+        return partial(
+            self.keyset_resolver,
+            self.resolver or parent_resolver,
+            self.get_manager(),
+            self.get_queryset_resolver(),
+        )
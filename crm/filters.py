@@ -1,7 +1,18 @@
 import django_filters
+from django.db import connections
 from .models import Customer, Product, Order
+from .search import get_search_backend
 
-class CustomerFilter(django_filters.FilterSet):
+
+class SearchFilterMixin(django_filters.FilterSet):
+    """Adds a ranked ``search`` argument served by crm.search."""
+    search = django_filters.CharFilter(method="filter_search")
+
+    def filter_search(self, queryset, name, value):
+        return get_search_backend().search(queryset, value)
+
+
+class CustomerFilter(SearchFilterMixin, django_filters.FilterSet):
     name = django_filters.CharFilter(field_name="name", lookup_expr="icontains")
     email = django_filters.CharFilter(field_name="email", lookup_expr="icontains")
     created_at__gte = django_filters.DateFilter(field_name="created_at", lookup_expr="gte")
@@ -9,14 +20,21 @@ class CustomerFilter(django_filters.FilterSet):
     phone_pattern = django_filters.CharFilter(method="filter_phone_pattern")
 
     def filter_phone_pattern(self, queryset, name, value):
+        if connections[queryset.db].vendor == "sqlite":
+            # Prefix match as a range so it can use crm_customer_phone_idx
+            # (SQLite never uses an index for LIKE 'x%' ESCAPE '\'). Only
+            # safe under SQLite's binary collation.
+            return queryset.filter(phone__gte=value, phone__lt=value + "\uffff")
+        # PostgreSQL serves LIKE 'x%' from crm_customer_phone_like_idx
+        # (varchar_pattern_ops) under any collation.
         return queryset.filter(phone__startswith=value)
 
     class Meta:
         model = Customer
-        fields = ['name', 'email', 'created_at__gte', 'created_at__lte', 'phone_pattern']
+        fields = ['name', 'email', 'created_at__gte', 'created_at__lte', 'phone_pattern', 'search']
 
 
-class ProductFilter(django_filters.FilterSet):
+class ProductFilter(SearchFilterMixin, django_filters.FilterSet):
     name = django_filters.CharFilter(field_name="name", lookup_expr="icontains")
     price__gte = django_filters.NumberFilter(field_name="price", lookup_expr="gte")
     price__lte = django_filters.NumberFilter(field_name="price", lookup_expr="lte")
@@ -25,10 +43,10 @@ class ProductFilter(django_filters.FilterSet):
 
     class Meta:
         model = Product
-        fields = ['name', 'price__gte', 'price__lte', 'stock__gte', 'stock__lte']
+        fields = ['name', 'price__gte', 'price__lte', 'stock__gte', 'stock__lte', 'search']
 
 
-class OrderFilter(django_filters.FilterSet):
+class OrderFilter(SearchFilterMixin, django_filters.FilterSet):
     total_amount__gte = django_filters.NumberFilter(field_name="total_amount", lookup_expr="gte")
     total_amount__lte = django_filters.NumberFilter(field_name="total_amount", lookup_expr="lte")
     order_date__gte = django_filters.DateFilter(field_name="order_date", lookup_expr="gte")
@@ -41,5 +59,5 @@ class OrderFilter(django_filters.FilterSet):
         fields = [
             'total_amount__gte', 'total_amount__lte',
             'order_date__gte', 'order_date__lte',
-            'customer_name', 'product_name'
+            'customer_name', 'product_name', 'search'
         ]
@@ -0,0 +1,110 @@
+"""Job runner for the periodic crm.cron tasks.
+
+Jobs are declared in ``settings.CRM_JOBS``. ``run_job(name)`` is the single
+entry point used by the ``run_jobs`` command and django_crontab alike:
+
+- a job whose last run started less than ~one interval ago is skipped, so
+  several schedulers pointed at the same database run it once per interval;
+- a ``running`` JobRun row acts as the lock (unique per job name); rows older
+  than the job's timeout are marked abandoned. Whether the job is due is
+  checked again once the lock is held, as another scheduler may have run it
+  between the first check and the lock;
+- every run records its duration, outcome and error in JobRun.
+
+``run_jobs`` keeps one process (and its database connection) alive, so a
+heartbeat costs a function call rather than a process start.
+"""
+import datetime
+import logging
+import os
+import socket
+import time
+import traceback
+
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from crm.models import JobRun
+
+logger = logging.getLogger(__name__)
+
+NODE = socket.gethostname()
+
+DEFAULT_JOB = {
+    "interval": 300,
+    # A running row older than this is considered dead.
+    "timeout": 3600,
+}
+
+
+def get_jobs():
+    return {name: {**DEFAULT_JOB, **job} for name, job in getattr(settings, "CRM_JOBS", {}).items()}
+
+
+def last_started(name, exclude=None):
+    return (
+        JobRun.objects.filter(name=name)
+        .exclude(status=JobRun.ABANDONED)
+        .exclude(pk=exclude)
+        .order_by("-started_at")
+        .values_list("started_at", flat=True)
+        .first()
+    )
+
+
+def is_due(name, job, now=None, exclude=None):
+    last = last_started(name, exclude)
+    # 10% slack: schedulers never fire at exactly the same second.
+    return last is None or ((now or timezone.now()) - last).total_seconds() >= job["interval"] * 0.9
+
+
+def run_job(name, force=False):
+    """Run one job unless it is locked or not due; return its JobRun or None."""
+    job = get_jobs()[name]
+    # Long-lived runner: reuse the connection, but drop it if it went stale.
+    if connection.connection is not None and not connection.is_usable():
+        connection.close()
+
+    now = timezone.now()
+    JobRun.objects.filter(
+        name=name, status=JobRun.RUNNING,
+        started_at__lt=now - datetime.timedelta(seconds=job["timeout"]),
+    ).update(status=JobRun.ABANDONED, finished_at=now)
+    # Cheap check first, so a job that is not due takes no lock.
+    if not force and not is_due(name, job, now):
+        return None
+    try:
+        with transaction.atomic():
+            run = JobRun.objects.create(name=name, node=NODE, pid=os.getpid())
+    except IntegrityError:
+        logger.info("Job %s is already running; skipped.", name)
+        return None
+    if not force and not is_due(name, job, now, exclude=run.pk):
+        # Another scheduler ran it since the first check.
+        run.delete()
+        return None
+
+    start = time.perf_counter()
+    try:
+        import_string(job["callable"])()
+        run.status, run.error = JobRun.SUCCESS, ""
+    except Exception:
+        run.status, run.error = JobRun.FAILED, traceback.format_exc()
+        logger.exception("Job %s failed.", name)
+    run.duration_ms = (time.perf_counter() - start) * 1000
+    run.finished_at = timezone.now()
+    run.save(update_fields=["status", "error", "duration_ms", "finished_at"])
+    return run
+
+
+def seconds_until_due(jobs):
+    """Seconds until the next job is due (0 if one is due now)."""
+    now = timezone.now()
+    waits = []
+    for name, job in jobs.items():
+        last = last_started(name)
+        elapsed = (now - last).total_seconds() if last else job["interval"]
+        waits.append(max(0.0, job["interval"] - elapsed))
+    return min(waits, default=60.0)
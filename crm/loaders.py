@@ -0,0 +1,142 @@
+from collections import defaultdict
+
+from django.db.models import F
+from crm.models import Customer, Product, Order
+
+
+class DataLoader:
+    """Synchronous batching loader with a per-request cache.
+
+    Keys are queued with ``prime()`` as soon as the parent objects are known
+    (e.g. when a connection page is resolved). The first ``load()`` that misses
+    the cache fetches every queued key with one ``batch_load()`` call, so
+    sibling lookups cost a single ``IN (...)`` query.
+    """
+
+    def __init__(self, loaders):
+        self.loaders = loaders
+        self._cache = {}
+        self._queue = {}
+
+    def batch_load(self, keys):
+        """Return a dict mapping keys to values for the given keys."""
+        raise NotImplementedError
+
+    def default(self):
+        return None
+
+    def prime(self, keys):
+        for key in keys:
+            if key not in self._cache:
+                self._queue[key] = None
+
+    def load(self, key):
+        if key not in self._cache:
+            self._queue[key] = None
+            self.dispatch()
+        return self._cache[key]
+
+    def dispatch(self):
+        keys = list(self._queue)
+        self._queue.clear()
+        if not keys:
+            return
+        results = self.batch_load(keys)
+        for key in keys:
+            self._cache[key] = results.get(key, self.default())
+
+
+class ListLoader(DataLoader):
+    def default(self):
+        return []
+
+
+class CustomerLoader(DataLoader):
+    """customer_id -> Customer"""
+
+    def batch_load(self, keys):
+        customers = Customer.objects.in_bulk(keys)
+        self.loaders.prime(customers.values())
+        return customers
+
+
+class OrdersByCustomerLoader(ListLoader):
+    """customer_id -> [Order]"""
+
+    def batch_load(self, keys):
+        orders = list(Order.objects.filter(customer_id__in=keys).order_by("pk"))
+        self.loaders.prime(orders)
+        grouped = defaultdict(list)
+        for order in orders:
+            grouped[order.customer_id].append(order)
+        return grouped
+
+
+class ProductsByOrderLoader(ListLoader):
+    """order_id -> [Product], read through the Order.products through table."""
+
+    def batch_load(self, keys):
+        products = list(
+            Product.objects.filter(orders__id__in=keys)
+            .annotate(_order_id=F("orders__id"))
+            .order_by("pk")
+        )
+        self.loaders.prime(products)
+        grouped = defaultdict(list)
+        for product in products:
+            grouped[product._order_id].append(product)
+        return grouped
+
+
+class OrdersByProductLoader(ListLoader):
+    """product_id -> [Order], read through the Order.products through table."""
+
+    def batch_load(self, keys):
+        orders = list(
+            Order.objects.filter(products__id__in=keys)
+            .annotate(_product_id=F("products__id"))
+            .order_by("pk")
+        )
+        self.loaders.prime(orders)
+        grouped = defaultdict(list)
+        for order in orders:
+            grouped[order._product_id].append(order)
+        return grouped
+
+
+class Loaders:
+    """All relation loaders for one GraphQL request."""
+
+    def __init__(self):
+        self.customer = CustomerLoader(self)
+        self.orders_by_customer = OrdersByCustomerLoader(self)
+        self.products_by_order = ProductsByOrderLoader(self)
+        self.orders_by_product = OrdersByProductLoader(self)
+
+    def prime(self, instances):
+        """Queue the relation keys of freshly resolved objects.
+
+        Priming is free: nothing is fetched until a resolver actually asks for
+        one of the relations.
+        """
+        for instance in instances:
+            if isinstance(instance, Order):
+                # Reading a column pruned by only() would cost a query per row.
+                if "customer_id" not in instance.get_deferred_fields():
+                    self.customer.prime([instance.customer_id])
+                self.products_by_order.prime([instance.pk])
+            elif isinstance(instance, Product):
+                self.orders_by_product.prime([instance.pk])
+            elif isinstance(instance, Customer):
+                self.orders_by_customer.prime([instance.pk])
+
+
+def get_loaders(context):
+    """Return the Loaders attached to the GraphQL context, creating them once."""
+    if context is None:
+        return Loaders()
+    loaders = getattr(context, "loaders", None)
+    if loaders is None:
+        loaders = Loaders()
+        setattr(context, "loaders", loaders)
+    return loaders
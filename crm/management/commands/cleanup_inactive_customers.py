@@ -0,0 +1,83 @@
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+
+from crm import analytics
+from crm.models import Customer, Order
+from crm.response_cache import bump_versions
+from crm.search import get_search_backend
+
+
+def delete_customers(ids):
+    """Delete customers, their orders and order-product links with three
+    set-based DELETEs; returns the deleted order ids.
+
+    Bypasses the ORM collector (and therefore signals), so the search index,
+    response-cache versions and analytics rollups are maintained here.
+    """
+    order_ids = list(Order.objects.filter(customer_id__in=ids).values_list("pk", flat=True))
+    rollup_keys = analytics.rollup_keys(order_ids)
+    through = Order.products.through._meta
+    qn = connection.ops.quote_name
+    order_table, customer_column = qn(Order._meta.db_table), qn(Order._meta.get_field("customer").column)
+    placeholders = ", ".join(["%s"] * len(ids))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"DELETE FROM {qn(through.db_table)} WHERE {qn(through.get_field('order').column)} IN "
+            f"(SELECT {qn(Order._meta.pk.column)} FROM {order_table} WHERE {customer_column} IN ({placeholders}))",
+            ids,
+        )
+        cursor.execute(f"DELETE FROM {order_table} WHERE {customer_column} IN ({placeholders})", ids)
+        cursor.execute(
+            f"DELETE FROM {qn(Customer._meta.db_table)} WHERE {qn(Customer._meta.pk.column)} IN ({placeholders})",
+            ids,
+        )
+    backend = get_search_backend()
+    backend.remove(Order, order_ids)
+    backend.remove(Customer, ids)
+    analytics.refresh(*rollup_keys)
+    bump_versions("customer", "order")
+    return order_ids
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete customers with no orders in the last --days days (and created "
+        "before that), in chunks of --chunk-size, each in its own short "
+        "transaction."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--days", type=int, default=365)
+        parser.add_argument("--chunk-size", type=int, default=500)
+        parser.add_argument("--dry-run", action="store_true", help="Only count inactive customers.")
+
+    def handle(self, *args, days, chunk_size, dry_run, **options):
+        if days < 1 or chunk_size < 1:
+            raise CommandError("--days and --chunk-size must be positive.")
+        cutoff = timezone.now() - datetime.timedelta(days=days)
+        inactive = Customer.objects.inactive(cutoff).order_by("pk")
+
+        if dry_run:
+            self.stdout.write(f"{inactive.count()} inactive customers would be deleted.")
+            return
+
+        customers = orders = last_pk = 0
+        while True:
+            with transaction.atomic():
+                # Locks the chunk so no order can be added to it meanwhile
+                # (a no-op on SQLite, where the write lock covers it).
+                ids = list(
+                    inactive.filter(pk__gt=last_pk).select_for_update()
+                    .values_list("pk", flat=True)[:chunk_size]
+                )
+                if not ids:
+                    break
+                orders += len(delete_customers(ids))
+            customers += len(ids)
+            last_pk = ids[-1]
+            self.stdout.write(f"Deleted {customers} customers and {orders} orders so far...")
+
+        self.stdout.write(self.style.SUCCESS(f"Deleted {customers} inactive customers and {orders} orders."))
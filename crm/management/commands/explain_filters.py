@@ -0,0 +1,76 @@
+import datetime
+import re
+import warnings
+
+import django_filters
+from django.core.management.base import BaseCommand, CommandError
+
+from crm.filters import CustomerFilter, ProductFilter, OrderFilter
+
+# Values used to exercise each filter type; only the plan matters.
+SAMPLE_VALUES = (
+    (django_filters.DateFilter, datetime.date(2025, 1, 1)),
+    (django_filters.NumberFilter, 10),
+    (django_filters.CharFilter, "a"),
+)
+
+# SQLite: "SCAN crm_order" (no index); PostgreSQL: "Seq Scan on crm_order".
+FULL_SCAN = re.compile(r"\bSCAN (?!.*\bUSING\b.*\bINDEX\b)(\w+)|Seq Scan on (\w+)")
+
+# Orderings used by the connections (keyset pagination, reminders).
+ORDERINGS = (
+    (CustomerFilter, ("-created_at", "-id")),
+    (OrderFilter, ("-order_date", "-id")),
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Run EXPLAIN (QUERY PLAN on SQLite) for every CustomerFilter, ProductFilter "
+        "and OrderFilter field and flag full table scans."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--strict", action="store_true",
+            help="Exit with an error if any plan contains a full table scan.",
+        )
+        parser.add_argument("--verbose-plans", action="store_true", help="Print every plan.")
+
+    def sample_value(self, filter_):
+        for filter_class, value in SAMPLE_VALUES:
+            if isinstance(filter_, filter_class):
+                return value
+        return "a"
+
+    def plans(self):
+        for filterset_class in (CustomerFilter, ProductFilter, OrderFilter):
+            queryset = filterset_class._meta.model._default_manager.all()
+            for name, filter_ in filterset_class.base_filters.items():
+                filterset = filterset_class(data={name: self.sample_value(filter_)}, queryset=queryset)
+                if not filterset.is_valid():
+                    raise CommandError(f"{filterset_class.__name__}.{name}: {filterset.errors}")
+                yield f"{filterset_class.__name__}.{name}", filterset.qs.explain()
+        for filterset_class, ordering in ORDERINGS:
+            queryset = filterset_class._meta.model._default_manager.order_by(*ordering)
+            yield f"{filterset_class.__name__} order_by{ordering}", queryset[:20].explain()
+
+    def handle(self, *args, strict=False, verbose_plans=False, **options):
+        scans = 0
+        with warnings.catch_warnings():
+            # DateFilter values are naive dates; the resulting warning is noise here.
+            warnings.simplefilter("ignore", RuntimeWarning)
+            plans = list(self.plans())
+        for label, plan in plans:
+            tables = sorted({t for match in FULL_SCAN.findall(plan) for t in match if t})
+            if tables:
+                scans += 1
+                self.stdout.write(self.style.WARNING(f"FULL SCAN  {label}: {', '.join(tables)}"))
+            else:
+                self.stdout.write(f"ok         {label}")
+            if verbose_plans or tables:
+                for line in plan.splitlines():
+                    self.stdout.write(f"           {line}")
+        if scans and strict:
+            raise CommandError(f"{scans} filter(s) need a full table scan.")
+        self.stdout.write(f"{scans} filter(s) with full table scans.")
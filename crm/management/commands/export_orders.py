@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from crm.export import CHUNK_SIZE, FORMATS, export_lines, parse_moment
+
+
+class Command(BaseCommand):
+    help = (
+        "Stream orders as NDJSON or CSV, oldest first, without loading the "
+        "result set into memory."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--since", help="Only orders placed at or after this ISO date/datetime.")
+        parser.add_argument("--until", help="Only orders placed before this ISO date/datetime.")
+        parser.add_argument("--format", choices=FORMATS, default="ndjson")
+        parser.add_argument("--output", help="File to write (default: stdout).")
+        parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+
+    def handle(self, *args, since, until, format, output, chunk_size, **options):
+        try:
+            since, until = parse_moment(since), parse_moment(until)
+        except ValueError as e:
+            raise CommandError(e)
+        if chunk_size < 1:
+            raise CommandError("--chunk-size must be positive.")
+
+        lines = export_lines(format, since, until, chunk_size)
+        if output:
+            with open(output, "w", encoding="utf-8", newline="") as f:
+                f.writelines(lines)
+        else:
+            for line in lines:
+                self.stdout.write(line, ending="")
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from crm import analytics
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild the sales rollups behind the analytics queries from scratch "
+        "(e.g. after recompute_order_totals or raw SQL writes)."
+    )
+
+    def handle(self, *args, **options):
+        counts = analytics.rebuild()
+        summary = ", ".join(f"{count} {name}" for name, count in counts.items())
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt analytics rollups ({summary})."))
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from crm.models import Customer, Product, Order
+from crm.search import get_search_backend
+
+
+class Command(BaseCommand):
+    help = "Rebuild the search shadow tables from scratch (e.g. after raw SQL writes)."
+
+    def handle(self, *args, **options):
+        backend = get_search_backend()
+        with transaction.atomic():
+            for model in (Customer, Product, Order):
+                backend.rebuild(model)
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt search index ({type(backend).__name__})."))
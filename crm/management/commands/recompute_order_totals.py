@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+
+from crm import analytics
+from crm.models import Order
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute Order.total_amount from current product prices. Run after "
+        "changing prices; orders are updated in bulk through the Order.products "
+        "through table, then the sales rollups of those orders are refreshed."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--product", type=int, action="append", dest="products", default=[],
+            help="Only orders containing this product id (repeatable). Default: all orders.",
+        )
+
+    def handle(self, *args, products, **options):
+        orders = Order.objects.all()
+        if products:
+            orders = orders.for_products(products)
+            order_ids = list(orders.values_list("pk", flat=True))
+            updated = orders.recompute_totals()
+            analytics.refresh_orders(order_ids)
+        else:
+            updated = orders.recompute_totals()
+            analytics.rebuild()
+        self.stdout.write(self.style.SUCCESS(f"Recomputed totals for {updated} orders."))
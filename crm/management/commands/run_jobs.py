@@ -0,0 +1,40 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from crm.jobs import get_jobs, run_job, seconds_until_due
+
+
+class Command(BaseCommand):
+    help = (
+        "Run the jobs in settings.CRM_JOBS from one long-lived process, each "
+        "once per interval (see crm/jobs.py). Replaces per-run process starts "
+        "from cron."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--job", action="append", dest="names", default=[],
+                            help="Only this job (repeatable). Default: all jobs.")
+        parser.add_argument("--once", action="store_true", help="Run due jobs once and exit.")
+        parser.add_argument("--force", action="store_true", help="With --once: run even if not due.")
+        parser.add_argument("--max-sleep", type=float, default=60.0)
+
+    def handle(self, *args, names, once, force, max_sleep, **options):
+        jobs = get_jobs()
+        unknown = set(names) - set(jobs)
+        if unknown:
+            raise CommandError(f"Unknown jobs: {', '.join(sorted(unknown))}")
+        if names:
+            jobs = {name: jobs[name] for name in names}
+
+        while True:
+            for name in jobs:
+                run = run_job(name, force=once and force)
+                if run is not None:
+                    self.stdout.write(f"{name}: {run.status} in {run.duration_ms:.1f}ms")
+            if once:
+                return
+            try:
+                time.sleep(min(max(seconds_until_due(jobs), 1.0), max_sleep))
+            except KeyboardInterrupt:
+                return
@@ -0,0 +1,90 @@
+import multiprocessing
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from crm.tasks import HEARTBEAT_INTERVAL, claim, get_task_types, heartbeat, requeue_lost, run_task
+
+
+class Command(BaseCommand):
+    help = (
+        "Run queued background tasks (settings.CRM_TASKS) in a pool of "
+        "--processes worker processes (see crm/tasks.py). With --processes 0 "
+        "tasks run in this process and send no heartbeat while they run, so "
+        "each must finish within its type's timeout."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--processes", type=int, default=os.cpu_count() or 1,
+                            help="Pool size; 0 runs tasks in this process.")
+        parser.add_argument("--type", action="append", dest="names", default=[],
+                            help="Only this task type (repeatable). Default: all types.")
+        parser.add_argument("--once", action="store_true", help="Exit once no task is due.")
+        parser.add_argument("--poll-interval", type=float, default=1.0)
+
+    def handle(self, *args, processes, names, once, poll_interval, **options):
+        if processes < 0:
+            raise CommandError("--processes cannot be negative.")
+        task_types = get_task_types()
+        unknown = set(names) - set(task_types)
+        if unknown:
+            raise CommandError(f"Unknown task types: {', '.join(sorted(unknown))}")
+        names = names or list(task_types)
+
+        executor = self.start_pool(processes) if processes else None
+        running = {}
+        last_beat = time.monotonic()
+        try:
+            while True:
+                if running and time.monotonic() - last_beat >= HEARTBEAT_INTERVAL:
+                    heartbeat([task.pk for task in running.values()])
+                    last_beat = time.monotonic()
+                requeue_lost(names)
+                while len(running) < max(processes, 1):
+                    task = claim(names)
+                    if task is None:
+                        break
+                    if executor is None:
+                        self.report(task, run_task(task.pk))
+                    else:
+                        running[executor.submit(run_task, task.pk)] = task
+                if not running:
+                    if once:
+                        return
+                    time.sleep(poll_interval)
+                    continue
+                done, _ = wait(running, timeout=poll_interval, return_when=FIRST_COMPLETED)
+                broken = False
+                for future in done:
+                    task = running.pop(future)
+                    try:
+                        self.report(task, future.result())
+                    except Exception as e:
+                        # No more heartbeats: requeue_lost times the task out.
+                        self.stderr.write(f"{task.task_type} #{task.pk}: worker died ({e!r})")
+                        broken = broken or isinstance(e, BrokenProcessPool)
+                if broken:
+                    executor.shutdown(wait=False, cancel_futures=True)
+                    running.clear()
+                    executor = self.start_pool(processes)
+        except KeyboardInterrupt:
+            return
+        finally:
+            if executor is not None:
+                executor.shutdown(cancel_futures=True)
+
+    def start_pool(self, processes):
+        # Spawned, not forked: no child inherits this process's connections.
+        # The initializer must not import crm modules, which need setup() first.
+        connections.close_all()
+        return ProcessPoolExecutor(
+            processes, mp_context=multiprocessing.get_context("spawn"), initializer=django.setup
+        )
+
+    def report(self, task, status):
+        self.stdout.write(f"{task.task_type} #{task.pk}: {status} (attempt {task.attempts})")
@@ -0,0 +1,65 @@
+import datetime
+from itertools import groupby
+from operator import attrgetter
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from crm.models import HighWaterMark, Order
+
+MARK = "send_order_reminders"
+LOG_FILE = "/tmp/order_reminders_log.txt"
+
+
+class Command(BaseCommand):
+    help = (
+        "Log a reminder per customer for orders placed in the last N days. "
+        "A high-water mark on the order id makes re-runs skip orders that "
+        "were already reminded."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--days", type=int, default=7)
+        parser.add_argument("--log-file", default=LOG_FILE)
+        parser.add_argument("--batch-size", type=int, default=500,
+                            help="Customers per buffered log write.")
+        parser.add_argument("--ignore-mark", action="store_true",
+                            help="Remind every order in the window, then advance the mark.")
+
+    def handle(self, *args, days, log_file, batch_size, ignore_mark, **options):
+        if days < 1 or batch_size < 1:
+            raise CommandError("--days and --batch-size must be positive.")
+        since = timezone.now() - datetime.timedelta(days=days)
+        mark = 0 if ignore_mark else HighWaterMark.get(MARK)
+
+        # The window is a range scan on crm_order_date_id_idx; rows come back
+        # sorted by customer so each customer gets one reminder.
+        orders = (
+            Order.objects.filter(order_date__gte=since, pk__gt=mark)
+            .select_related("customer")
+            .only("order_date", "customer__email")
+            .order_by("customer_id", "order_date", "pk")
+        )
+        timestamp = timezone.now().strftime("%Y-%m-%d %H:%M:%S")
+        customers = reminded = last_id = 0
+        buffer = []
+        with open(log_file, "a", encoding="utf-8") as log:
+            for _, group in groupby(orders.iterator(chunk_size=2000), key=attrgetter("customer_id")):
+                group = list(group)
+                ids = [order.pk for order in group]
+                last_id = max(last_id, *ids)
+                reminded += len(ids)
+                customers += 1
+                buffer.append(
+                    f"[{timestamp}] Reminder → {group[0].customer.email} | Orders: {', '.join(map(str, ids))}\n"
+                )
+                if len(buffer) >= batch_size:
+                    log.writelines(buffer)
+                    buffer.clear()
+            log.writelines(buffer)
+
+        if last_id:
+            HighWaterMark.advance(MARK, last_id)
+        self.stdout.write(self.style.SUCCESS(
+            f"Reminded {customers} customers about {reminded} orders."
+        ))
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from crm.db import set_journal_mode
+
+
+class Command(BaseCommand):
+    help = "Switch a SQLite database's journal mode once (it persists in the file)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("mode", nargs="?", default="WAL", choices=["WAL", "DELETE", "wal", "delete"])
+        parser.add_argument("--database", default=DEFAULT_DB_ALIAS)
+
+    def handle(self, *args, mode, database, **options):
+        connection = connections[database]
+        if connection.vendor != "sqlite":
+            raise CommandError(f"{database} is not a SQLite database.")
+        current = set_journal_mode(connection, mode.upper())
+        self.stdout.write(self.style.SUCCESS(f"{database}: journal_mode={current}"))
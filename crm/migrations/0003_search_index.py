@@ -0,0 +1,54 @@
+from django.db import migrations
+
+SQLITE_FORWARD = [
+    "CREATE VIRTUAL TABLE crm_customer_fts USING fts5(name, email)",
+    "CREATE VIRTUAL TABLE crm_product_fts USING fts5(name)",
+    "CREATE VIRTUAL TABLE crm_order_fts USING fts5(customer_name, product_names)",
+    "INSERT INTO crm_customer_fts (rowid, name, email) SELECT id, name, email FROM crm_customer",
+    "INSERT INTO crm_product_fts (rowid, name) SELECT id, name FROM crm_product",
+    "INSERT INTO crm_order_fts (rowid, customer_name, product_names)"
+    " SELECT o.id, c.name, COALESCE(group_concat(p.name, ' '), '')"
+    " FROM crm_order o JOIN crm_customer c ON c.id = o.customer_id"
+    " LEFT JOIN crm_order_products op ON op.order_id = o.id"
+    " LEFT JOIN crm_product p ON p.id = op.product_id"
+    " GROUP BY o.id, c.name",
+]
+SQLITE_REVERSE = [
+    "DROP TABLE IF EXISTS crm_customer_fts",
+    "DROP TABLE IF EXISTS crm_product_fts",
+    "DROP TABLE IF EXISTS crm_order_fts",
+]
+
+# Django compiles icontains to UPPER(col::text) LIKE UPPER(%s) on PostgreSQL.
+POSTGRES_FORWARD = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE INDEX crm_customer_name_trgm ON crm_customer USING gin (UPPER(name::text) gin_trgm_ops)",
+    "CREATE INDEX crm_customer_email_trgm ON crm_customer USING gin (UPPER(email::text) gin_trgm_ops)",
+    "CREATE INDEX crm_product_name_trgm ON crm_product USING gin (UPPER(name::text) gin_trgm_ops)",
+]
+POSTGRES_REVERSE = [
+    "DROP INDEX IF EXISTS crm_customer_name_trgm",
+    "DROP INDEX IF EXISTS crm_customer_email_trgm",
+    "DROP INDEX IF EXISTS crm_product_name_trgm",
+]
+
+
+def run(statements_by_vendor):
+    def operation(apps, schema_editor):
+        for statement in statements_by_vendor.get(schema_editor.connection.vendor, ()):
+            schema_editor.execute(statement)
+    return operation
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0002_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            run({'sqlite': SQLITE_FORWARD, 'postgresql': POSTGRES_FORWARD}),
+            run({'sqlite': SQLITE_REVERSE, 'postgresql': POSTGRES_REVERSE}),
+        ),
+    ]
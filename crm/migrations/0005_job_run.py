@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0004_high_water_mark'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='JobRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100)),
+                ('status', models.CharField(choices=[('running', 'running'), ('success', 'success'), ('failed', 'failed'), ('abandoned', 'abandoned')], default='running', max_length=10)),
+                ('node', models.CharField(blank=True, max_length=255)),
+                ('pid', models.IntegerField(null=True)),
+                ('started_at', models.DateTimeField(auto_now_add=True)),
+                ('finished_at', models.DateTimeField(null=True)),
+                ('duration_ms', models.FloatField(null=True)),
+                ('error', models.TextField(blank=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['name', 'started_at'], name='crm_jobrun_name_started_idx')],
+                'constraints': [models.UniqueConstraint(condition=models.Q(('status', 'running')), fields=('name',), name='crm_jobrun_one_running')],
+            },
+        ),
+    ]
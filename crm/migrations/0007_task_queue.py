@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:10
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0006_sales_rollups'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Task',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('task_type', models.CharField(max_length=100)),
+                ('kwargs', models.JSONField(default=dict)),
+                ('status', models.CharField(choices=[('queued', 'queued'), ('running', 'running'), ('success', 'success'), ('failed', 'failed')], default='queued', max_length=10)),
+                ('slot', models.PositiveSmallIntegerField(null=True)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('max_attempts', models.PositiveIntegerField(default=1)),
+                ('run_after', models.DateTimeField(default=django.utils.timezone.now)),
+                ('result', models.JSONField(null=True)),
+                ('error', models.TextField(blank=True)),
+                ('worker', models.CharField(blank=True, max_length=255)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('started_at', models.DateTimeField(null=True)),
+                ('finished_at', models.DateTimeField(null=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', 'run_after'], name='crm_task_status_run_after_idx')],
+                'constraints': [models.UniqueConstraint(condition=models.Q(('status', 'running')), fields=('task_type', 'slot'), name='crm_task_running_slot')],
+            },
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:26
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def backfill_heartbeats(apps, schema_editor):
+    # Tasks running before heartbeats existed are timed from their start.
+    Task = apps.get_model("crm", "Task")
+    Task.objects.filter(status="running").update(heartbeat_at=F("started_at"))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0007_task_queue'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='task',
+            name='heartbeat_at',
+            field=models.DateTimeField(null=True),
+        ),
+        migrations.RunPython(backfill_heartbeats, migrations.RunPython.noop),
+    ]
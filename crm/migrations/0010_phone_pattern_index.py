@@ -0,0 +1,31 @@
+from django.db import migrations
+
+# Django compiles startswith to "phone"::text LIKE %s on PostgreSQL; a plain
+# btree serves that only under the C collation.
+POSTGRES_FORWARD = [
+    "CREATE INDEX crm_customer_phone_like_idx ON crm_customer (phone varchar_pattern_ops)",
+]
+POSTGRES_REVERSE = [
+    "DROP INDEX IF EXISTS crm_customer_phone_like_idx",
+]
+
+
+def run(statements_by_vendor):
+    def operation(apps, schema_editor):
+        for statement in statements_by_vendor.get(schema_editor.connection.vendor, ()):
+            schema_editor.execute(statement)
+    return operation
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0009_task_owner'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            run({'postgresql': POSTGRES_FORWARD}),
+            run({'postgresql': POSTGRES_REVERSE}),
+        ),
+    ]
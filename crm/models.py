@@ -1,4 +1,21 @@
-from django.db import models
+from django.conf import settings
+from django.db import models, router, transaction
+from django.db.models import Case, DecimalField, Exists, F, OuterRef, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce, Now
+from django.utils import timezone
+
+from .response_cache import bump_versions
+
+class CustomerQuerySet(models.QuerySet):
+    def inactive(self, cutoff):
+        """Customers created before ``cutoff`` with no order since then.
+
+        A correlated NOT EXISTS on crm_order_customer_date_idx, rather than
+        exclude() across the relation.
+        """
+        recent = Order.objects.filter(customer=OuterRef("pk"), order_date__gte=cutoff)
+        return self.filter(~Exists(recent), created_at__lt=cutoff)
+
 
 class Customer(models.Model):
     name = models.CharField(max_length=100)
@@ -6,30 +23,261 @@ class Customer(models.Model):
     phone = models.CharField(max_length=20, blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    objects = CustomerQuerySet.as_manager()
+
+    class Meta:
+        # Chosen from CustomerFilter and the keyset ordering; verify with
+        # `manage.py explain_filters`.
+        indexes = [
+            models.Index(fields=["created_at", "id"], name="crm_customer_created_id_idx"),
+            models.Index(fields=["phone"], name="crm_customer_phone_idx"),
+        ]
+
     def __str__(self):
         return self.name
 
 
+def per_product(default, rules, key):
+    """Build ``CASE id WHEN ... END`` from rules like {"product_id": 1, key: 5}."""
+    whens = [
+        When(pk=rule["product_id"], then=Value(rule[key]))
+        for rule in rules or ()
+        if rule.get(key) is not None
+    ]
+    if not whens:
+        return Value(default)
+    return Case(*whens, default=Value(default), output_field=models.IntegerField())
+
+
+class ProductQuerySet(models.QuerySet):
+    def low_stock(self, threshold=10, rules=None):
+        return self.filter(stock__lt=per_product(threshold, rules, "threshold"))
+
+    def restock(self, increment=10, rules=None):
+        """Add ``increment`` to every product in the queryset in one UPDATE.
+
+        Returns the updated rows, read back by pk: the restocked rows may no
+        longer match the queryset's own filter.
+        """
+        new_stock = F("stock") + per_product(increment, rules, "increment")
+        using = self._db or router.db_for_write(self.model)
+        products = self.model._default_manager.using(using)
+        with transaction.atomic(using=using):
+            ids = list(self.using(using).select_for_update().values_list("pk", flat=True))
+            products.filter(pk__in=ids).update(stock=new_stock)
+            # Set-based: no post_save fires, so invalidate cached responses here.
+            bump_versions("product")
+            return list(products.filter(pk__in=ids))
+
+
 class Product(models.Model):
     name = models.CharField(max_length=100)
     price = models.DecimalField(max_digits=10, decimal_places=2)
     stock = models.PositiveIntegerField(default=0)
 
+    objects = ProductQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["price"], name="crm_product_price_idx"),
+            models.Index(fields=["stock"], name="crm_product_stock_idx"),
+        ]
+
     def __str__(self):
         return self.name
 
 
+class OrderQuerySet(models.QuerySet):
+    def for_products(self, product_ids):
+        """Orders containing any of the products, via the through table."""
+        through = Order.products.through
+        return self.filter(
+            pk__in=through.objects.filter(product_id__in=product_ids).values("order_id")
+        )
+
+    def recompute_totals(self):
+        """Set total_amount to the DB-side sum of product prices in one UPDATE."""
+        through = Order.products.through
+        total = (
+            through.objects.filter(order_id=OuterRef("pk"))
+            .values("order_id")
+            .annotate(total=Sum("product__price"))
+            .values("total")
+        )
+        money = DecimalField(max_digits=10, decimal_places=2)
+        bump_versions("order")
+        return self.update(
+            total_amount=Coalesce(Subquery(total, output_field=money), Value(0), output_field=money)
+        )
+
+
 class Order(models.Model):
     customer = models.ForeignKey(Customer, on_delete=models.CASCADE, related_name='orders')
     products = models.ManyToManyField(Product, related_name='orders')
     order_date = models.DateTimeField(auto_now_add=True)
+    # Denormalized: kept current by crm.signals on Order.products changes and
+    # by the recompute_order_totals command after price changes.
     total_amount = models.DecimalField(max_digits=10, decimal_places=2, default=0.00)
 
+    objects = OrderQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["order_date", "id"], name="crm_order_date_id_idx"),
+            models.Index(fields=["customer", "order_date"], name="crm_order_customer_date_idx"),
+            models.Index(fields=["total_amount"], name="crm_order_total_idx"),
+        ]
+
     def calculate_total(self):
-        total = sum(product.price for product in self.products.all())
+        total = self.products.aggregate(total=Sum("price"))["total"] or 0
+        Order.objects.filter(pk=self.pk).update(total_amount=total)
         self.total_amount = total
-        self.save()
         return total
 
     def __str__(self):
         return f"Order {self.id} - {self.customer.name}"
+
+
+class HighWaterMark(models.Model):
+    """Last id handled by an incremental job (e.g. send_order_reminders)."""
+    name = models.CharField(max_length=100, unique=True)
+    value = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    @classmethod
+    def get(cls, name):
+        return cls.objects.filter(name=name).values_list("value", flat=True).first() or 0
+
+    @classmethod
+    def advance(cls, name, value):
+        # Never move backwards, even if two runs overlap.
+        mark, _ = cls.objects.get_or_create(name=name)
+        cls.objects.filter(pk=mark.pk, value__lt=value).update(value=value, updated_at=Now())
+
+    def __str__(self):
+        return f"{self.name} = {self.value}"
+
+
+class JobRun(models.Model):
+    """One execution of a crm.jobs job.
+
+    At most one ``running`` row may exist per job name (partial unique
+    index), which is what keeps two schedulers from running a job at once.
+    """
+    RUNNING = "running"
+    SUCCESS = "success"
+    FAILED = "failed"
+    ABANDONED = "abandoned"
+    STATUS_CHOICES = [(s, s) for s in (RUNNING, SUCCESS, FAILED, ABANDONED)]
+
+    name = models.CharField(max_length=100)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=RUNNING)
+    node = models.CharField(max_length=255, blank=True)
+    pid = models.IntegerField(null=True)
+    started_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True)
+    duration_ms = models.FloatField(null=True)
+    error = models.TextField(blank=True)
+
+    class Meta:
+        indexes = [models.Index(fields=["name", "started_at"], name="crm_jobrun_name_started_idx")]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["name"], condition=models.Q(status="running"), name="crm_jobrun_one_running",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.name} {self.status} at {self.started_at}"
+
+
+# -----------------
+# ANALYTICS ROLLUPS (crm/analytics.py)
+# -----------------
+# Maintained per affected key by crm.signals and rebuilt by
+# `manage.py rebuild_analytics`. Plain id references (no FK constraint), so
+# raw deletes of customers or products never trip over rollup rows.
+class DailySales(models.Model):
+    day = models.DateField(unique=True)
+    order_count = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    def __str__(self):
+        return f"{self.day}: {self.order_count} orders, {self.revenue}"
+
+
+class ProductDailySales(models.Model):
+    product = models.ForeignKey(
+        Product, on_delete=models.DO_NOTHING, db_constraint=False, related_name="+"
+    )
+    day = models.DateField()
+    units = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            # Also serves topProducts' day-range scans.
+            models.UniqueConstraint(fields=["day", "product"], name="crm_productdailysales_day_product"),
+        ]
+
+    def __str__(self):
+        return f"{self.product_id} on {self.day}: {self.units} units, {self.revenue}"
+
+
+class CustomerSales(models.Model):
+    customer = models.OneToOneField(
+        Customer, primary_key=True, on_delete=models.DO_NOTHING, db_constraint=False, related_name="+"
+    )
+    order_count = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    first_order_at = models.DateTimeField(null=True)
+    last_order_at = models.DateTimeField(null=True)
+
+    def __str__(self):
+        return f"{self.customer_id}: {self.order_count} orders, {self.revenue}"
+
+
+class Task(models.Model):
+    """A unit of background work (crm.tasks), run by ``manage.py run_worker``.
+
+    A running task holds one of its type's ``concurrency`` slots; the partial
+    unique index on (task_type, slot) is what keeps any number of workers
+    within the limit.
+    """
+    QUEUED = "queued"
+    RUNNING = "running"
+    SUCCESS = "success"
+    FAILED = "failed"
+    STATUS_CHOICES = [(s, s) for s in (QUEUED, RUNNING, SUCCESS, FAILED)]
+
+    task_type = models.CharField(max_length=100)
+    kwargs = models.JSONField(default=dict)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=QUEUED)
+    slot = models.PositiveSmallIntegerField(null=True)
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=1)
+    # Not claimed before this time (set by the retry backoff).
+    run_after = models.DateTimeField(default=timezone.now)
+    result = models.JSONField(null=True)
+    error = models.TextField(blank=True)
+    worker = models.CharField(max_length=255, blank=True)
+    # Who queued it; only they (and staff) may read its status and result.
+    owner = models.ForeignKey(
+        settings.AUTH_USER_MODEL, null=True, blank=True, on_delete=models.SET_NULL, related_name="+",
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True)
+    # Bumped by the worker while the task runs; a stale one means the worker is gone.
+    heartbeat_at = models.DateTimeField(null=True)
+    finished_at = models.DateTimeField(null=True)
+
+    class Meta:
+        indexes = [models.Index(fields=["status", "run_after"], name="crm_task_status_run_after_idx")]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["task_type", "slot"], condition=models.Q(status="running"), name="crm_task_running_slot",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.task_type} #{self.pk} {self.status}"
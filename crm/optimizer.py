@@ -0,0 +1,122 @@
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Prefetch
+from graphene.utils.str_converters import to_snake_case
+from graphql.language import FieldNode, FragmentSpreadNode, InlineFragmentNode
+
+from .fields import PAGINATION_ARGS
+
+
+def collect_fields(selection_set, fragments):
+    """Return the FieldNodes of a selection set with fragments flattened."""
+    fields = []
+    if selection_set is None:
+        return fields
+    for selection in selection_set.selections:
+        if isinstance(selection, FieldNode):
+            fields.append(selection)
+        elif isinstance(selection, InlineFragmentNode):
+            fields.extend(collect_fields(selection.selection_set, fragments))
+        elif isinstance(selection, FragmentSpreadNode):
+            fragment = fragments.get(selection.name.value)
+            if fragment is not None:
+                fields.extend(collect_fields(fragment.selection_set, fragments))
+    return fields
+
+
+def node_fields(field_node, fragments):
+    """Selected fields of the nodes of a relay connection (edges { node { ... } })."""
+    fields = []
+    for edges in collect_fields(field_node.selection_set, fragments):
+        if edges.name.value != "edges":
+            continue
+        for node in collect_fields(edges.selection_set, fragments):
+            if node.name.value == "node":
+                fields.extend(collect_fields(node.selection_set, fragments))
+    return fields
+
+
+class QueryPlan:
+    """select_related / prefetch_related / only() derived from a selection set."""
+
+    def __init__(self, model, fragments):
+        self.model = model
+        self.fragments = fragments
+        self.only = {model._meta.pk.name}
+        self.select_related = []
+        self.prefetch = []
+        # A field we cannot map to a column may read anything: load all columns.
+        self.prune = True
+
+    def add_fields(self, model, field_nodes, prefix=""):
+        for field_node in field_nodes:
+            name = field_node.name.value
+            if name == "__typename":
+                continue
+            if name == "id":
+                self.only.add(prefix + model._meta.pk.name)
+                continue
+            try:
+                field = model._meta.get_field(to_snake_case(name))
+            except FieldDoesNotExist:
+                self.prune = False
+                continue
+            path = prefix + field.name
+            if field.concrete and (field.many_to_one or field.one_to_one):
+                self.only.add(path)
+                self.select_related.append(path)
+                self.only.add(f"{path}__{field.related_model._meta.pk.name}")
+                self.add_fields(
+                    field.related_model,
+                    collect_fields(field_node.selection_set, self.fragments),
+                    prefix=f"{path}__",
+                )
+            elif field.is_relation:
+                # Connection arguments other than pagination go through the
+                # filterset on a fresh queryset, so a prefetch would be wasted.
+                if any(arg.name.value not in PAGINATION_ARGS for arg in field_node.arguments):
+                    continue
+                queryset = optimize(
+                    field.related_model._default_manager.all(),
+                    node_fields(field_node, self.fragments),
+                    self.fragments,
+                    reverse_fk=field.field.attname if field.one_to_many else None,
+                )
+                self.prefetch.append(Prefetch(path, queryset=queryset))
+            else:
+                self.only.add(path)
+
+    def apply(self, queryset):
+        if self.select_related:
+            queryset = queryset.select_related(*self.select_related)
+        if self.prefetch:
+            queryset = queryset.prefetch_related(*self.prefetch)
+        if self.prune:
+            queryset = queryset.only(*sorted(self.only))
+        return queryset
+
+
+def optimize(queryset, field_nodes, fragments, reverse_fk=None):
+    plan = QueryPlan(queryset.model, fragments)
+    if reverse_fk:
+        # Prefetching a reverse FK matches rows back to parents by this column.
+        plan.only.add(reverse_fk)
+    plan.add_fields(queryset.model, field_nodes)
+    return plan.apply(queryset)
+
+
+def optimize_queryset(queryset, info):
+    """Shape a connection queryset to the selection set of the current field."""
+    fields = []
+    for field_node in info.field_nodes:
+        fields.extend(node_fields(field_node, info.fragments))
+    if not fields:
+        return queryset
+    return optimize(queryset, fields, info.fragments)
+
+
+def prefetched(instance, name):
+    """Return the prefetched rows for a relation, or None if it was not prefetched."""
+    cache = getattr(instance, "_prefetched_objects_cache", {})
+    if name not in cache:
+        return None
+    return list(cache[name])
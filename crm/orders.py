@@ -0,0 +1,112 @@
+"""Order placement with stock reservation.
+
+``place_order`` validates with plain reads, then does all of its writes in
+one short transaction whose first statement is the stock reservation:
+
+    UPDATE crm_product SET stock = stock - 1 WHERE id IN (...) AND stock > 0
+
+A product that ran out matches no row, so a short row count means the order
+cannot be filled and the transaction rolls back; stock can never go negative
+or be sold twice. Because the transaction writes before it reads, SQLite
+takes the write lock up front instead of upgrading a read lock mid-way (which
+fails immediately with "database is locked" rather than waiting). Lock errors
+that still happen under contention are retried with backoff.
+
+The through rows are bulk-inserted and the total is summed inside the same
+transaction, so no m2m_changed handlers run; search indexing and
+response-cache invalidation and the product rollups are done here instead.
+"""
+import random
+import time
+from decimal import Decimal
+
+from django.core.exceptions import ValidationError
+from django.db import OperationalError, connection, transaction
+from django.db.models import F, Sum
+from django.utils import timezone
+
+from crm import analytics
+from crm.models import Customer, Order, Product
+from crm.response_cache import bump_versions
+from crm.search import get_search_backend
+
+MAX_ATTEMPTS = 10
+# Seconds before the first retry; doubled (with jitter) on each further one.
+BACKOFF = 0.01
+MAX_BACKOFF = 0.5
+CENTS = Decimal("0.01")
+
+
+def is_lock_error(error):
+    # SQLite reports "database is locked" (busy) or "database table is locked"
+    # (shared-cache databases, e.g. the in-memory test database).
+    return "is locked" in str(error)
+
+
+def place_order(customer_id, product_ids):
+    """Create an order for one unit of each product; return the Order."""
+    # Retrying inside an outer transaction would repeat its earlier work.
+    attempts = 1 if connection.in_atomic_block else MAX_ATTEMPTS
+    for attempt in range(attempts):
+        try:
+            order = try_place_order(customer_id, product_ids)
+            break
+        except OperationalError as e:
+            if not is_lock_error(e) or attempt == attempts - 1:
+                raise
+            time.sleep(min(MAX_BACKOFF, BACKOFF * 2 ** attempt) * random.uniform(0.5, 1.5))
+    bump_versions("order", "product")
+    return order
+
+
+def try_place_order(customer_id, product_ids):
+    if not Customer.objects.filter(pk=customer_id).exists():
+        raise ValidationError("Invalid customer ID.")
+    product_ids = list(Product.objects.filter(pk__in=product_ids).values_list("pk", flat=True))
+    if not product_ids:
+        raise ValidationError("No valid products found.")
+
+    order = reserve_and_create(customer_id, product_ids)
+    if order is None:
+        raise ValidationError(unavailable_message(product_ids))
+    return order
+
+
+def unavailable_message(product_ids):
+    """Explain a failed reservation: products that ran out, or were deleted meanwhile."""
+    # Read after the rollback, so only products that really ran out are named.
+    products = Product.objects.filter(pk__in=product_ids).order_by("pk").values_list("pk", "name", "stock")
+    found, sold_out = set(), []
+    for pk, name, stock in products:
+        found.add(pk)
+        if stock == 0:
+            sold_out.append(name)
+    missing = sorted(set(product_ids) - found)
+    problems = []
+    if sold_out:
+        problems.append("Out of stock: {}.".format(", ".join(sold_out)))
+    if missing:
+        problems.append("Products no longer exist: {}.".format(", ".join(map(str, missing))))
+    # Restocked since the reservation failed: nothing to name, but retrying can work.
+    return " ".join(problems) or "Out of stock; please try again."
+
+
+def reserve_and_create(customer_id, product_ids):
+    """Reserve stock and write the order; return None (rolled back) if any product ran out."""
+    with transaction.atomic():
+        reserved = Product.objects.filter(pk__in=product_ids, stock__gt=0).update(stock=F("stock") - 1)
+        if reserved != len(product_ids):
+            transaction.set_rollback(True)
+            return None
+        total = Product.objects.filter(pk__in=product_ids).aggregate(total=Sum("price"))["total"]
+        # SQLite sums decimals as floats; store the column's two places.
+        total = total.quantize(CENTS)
+        order = Order.objects.create(customer_id=customer_id, total_amount=total)
+        through = Order.products.through
+        through.objects.bulk_create(through(order_id=order.pk, product_id=pk) for pk in product_ids)
+        # Inside the transaction: a retry must never follow a commit. Order's
+        # post_save counted the order with its full total; add the lines'
+        # product rows.
+        get_search_backend().index(Order, [order.pk])
+        analytics.record_lines(through.objects.filter(order_id=order.pk), order_revenue=False)
+    return order
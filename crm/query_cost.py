@@ -0,0 +1,276 @@
+"""Static cost and depth analysis of GraphQL documents.
+
+The cost of an operation is the number of objects it can return in the worst
+case: every connection contributes ``parents x page size`` nodes, where the
+page size is the literal ``first``/``last`` argument, the per-relation
+``FAN_OUT`` estimate for unpaginated nested connections, or the connection
+max limit. Singular relations cost one object per parent.
+
+QueryCostRule rejects documents over ``MAX_COST`` or ``MAX_DEPTH`` during
+validation, so nothing executes; results are cached per document hash.
+Validation cannot see the request's variables, so a variable page size is
+costed at its default there; ``operation_cost`` recosts such operations with
+the actual variable values, and crm.views checks that cost again before
+executing (``cost_error``). The operations of a batched request also share
+one ``CostBudget``, so a batch cannot spend more than one operation may.
+"""
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from graphene_django.settings import graphene_settings
+from graphql import (
+    FieldNode, FragmentDefinitionNode, FragmentSpreadNode, GraphQLError, GraphQLInterfaceType,
+    GraphQLObjectType, InlineFragmentNode, IntValueNode, OperationDefinitionNode, VariableNode,
+    get_named_type,
+)
+from graphql.validation import ValidationRule
+
+from .documents import query_hash
+from .fields import DEFAULT_PAGE_SIZE
+
+DEFAULTS = {
+    "MAX_COST": 50000,
+    "MAX_DEPTH": 15,
+    # Expected size of a nested connection queried without first/last,
+    # keyed by "<ParentType>.<field>"; unlisted relations use the max limit.
+    "FAN_OUT": {},
+    # Page size assumed when RELAY_CONNECTION_MAX_LIMIT is None (unbounded).
+    "DEFAULT_PAGE_SIZE": DEFAULT_PAGE_SIZE,
+    "CACHE_SIZE": 500,
+}
+
+
+def config():
+    return {**DEFAULTS, **getattr(settings, "CRM_QUERY_COST", {})}
+
+
+class OperationCost:
+    def __init__(self, cost, depth, page_variables=()):
+        self.cost = cost
+        self.depth = depth
+        # Variables used as first/last: the cost depends on their values.
+        self.page_variables = frozenset(page_variables)
+
+    def extension(self):
+        options = config()
+        return {
+            "requested": self.cost,
+            "maximum": options["MAX_COST"],
+            "depth": self.depth,
+            "maxDepth": options["MAX_DEPTH"],
+        }
+
+
+def is_connection(named_type):
+    return isinstance(named_type, GraphQLObjectType) and {"edges", "pageInfo"} <= set(named_type.fields)
+
+
+def is_model_type(named_type):
+    graphene_type = getattr(named_type, "graphene_type", None)
+    return getattr(getattr(graphene_type, "_meta", None), "model", None) is not None
+
+
+def page_size(field_node, parent_type, variable_values, options, page_variables):
+    max_limit = graphene_settings.RELAY_CONNECTION_MAX_LIMIT
+    default = max_limit or options["DEFAULT_PAGE_SIZE"]
+    for argument in field_node.arguments:
+        if argument.name.value not in ("first", "last"):
+            continue
+        value = argument.value
+        if isinstance(value, VariableNode):
+            page_variables.add(value.name.value)
+            value = variable_values.get(value.name.value)
+        elif isinstance(value, IntValueNode):
+            value = int(value.value)
+        if isinstance(value, int) and not isinstance(value, bool):
+            return min(value, max_limit) if max_limit else value
+        # A variable without a value may be anything up to the limit.
+        return default
+    key = f"{parent_type.name}.{field_node.name.value}"
+    return options["FAN_OUT"].get(key, default)
+
+
+class CostAnalysis:
+    def __init__(self, schema, fragments, variable_values, options):
+        self.schema = schema
+        self.fragments = fragments
+        self.variable_values = variable_values
+        self.options = options
+        self.page_variables = set()
+        # Fragment cycles are reported by NoFragmentCyclesRule; don't follow them.
+        self.visiting = set()
+
+    def walk(self, parent_type, selection_set, multiplier, depth, root=False):
+        """Return ``(cost, depth)`` of a selection set under ``multiplier`` parents."""
+        cost, max_depth = 0, depth
+        for selection in selection_set.selections:
+            if isinstance(selection, FieldNode):
+                field = parent_type.fields.get(selection.name.value)
+                if field is None:
+                    continue
+                named_type = get_named_type(field.type)
+                rows = multiplier
+                if is_connection(named_type):
+                    rows = multiplier * page_size(
+                        selection, parent_type, self.variable_values, self.options, self.page_variables
+                    )
+                    cost += rows
+                elif root or is_model_type(named_type) and is_model_type(parent_type):
+                    # Nodes under edges are already counted by their connection.
+                    cost += multiplier
+                if selection.selection_set is not None:
+                    child_cost, child_depth = self.walk(named_type, selection.selection_set, rows, depth + 1)
+                    cost += child_cost
+                    max_depth = max(max_depth, child_depth)
+                else:
+                    max_depth = max(max_depth, depth + 1)
+                continue
+
+            if isinstance(selection, FragmentSpreadNode):
+                fragment = self.fragments.get(selection.name.value)
+                if fragment is None or fragment.name.value in self.visiting:
+                    continue
+                type_condition, selection_set = fragment.type_condition, fragment.selection_set
+            elif isinstance(selection, InlineFragmentNode):
+                type_condition, selection_set = selection.type_condition, selection.selection_set
+            else:
+                continue
+            fragment_type = parent_type
+            if type_condition is not None:
+                fragment_type = self.schema.get_type(type_condition.name.value) or parent_type
+            if not isinstance(fragment_type, (GraphQLObjectType, GraphQLInterfaceType)):
+                continue
+            name = selection.name.value if isinstance(selection, FragmentSpreadNode) else None
+            self.visiting.add(name)
+            child_cost, child_depth = self.walk(fragment_type, selection_set, multiplier, depth, root)
+            self.visiting.discard(name)
+            cost += child_cost
+            max_depth = max(max_depth, child_depth)
+        return cost, max_depth
+
+
+def analyze(schema, document, variables=None):
+    """Return ``{operation name: OperationCost}`` for every operation in a document.
+
+    Variable page sizes take their value from ``variables``, else their
+    literal default.
+    """
+    options = config()
+    fragments = {
+        definition.name.value: definition
+        for definition in document.definitions
+        if isinstance(definition, FragmentDefinitionNode)
+    }
+    costs = {}
+    for definition in document.definitions:
+        if not isinstance(definition, OperationDefinitionNode):
+            continue
+        root_type = schema.get_root_type(definition.operation)
+        if root_type is None:
+            continue
+        variable_values = {
+            variable.variable.name.value: int(variable.default_value.value)
+            for variable in definition.variable_definitions
+            if isinstance(variable.default_value, IntValueNode)
+        }
+        variable_values.update(variables or {})
+        analysis = CostAnalysis(schema, fragments, variable_values, options)
+        cost, depth = analysis.walk(root_type, definition.selection_set, 1, 0, root=True)
+        name = definition.name.value if definition.name else None
+        costs[name] = OperationCost(cost, depth, analysis.page_variables)
+    return costs
+
+
+class CostCache:
+    """Thread-safe LRU of analyze() results keyed by document hash."""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, schema, document):
+        key = query_hash(document.loc.source.body) if document.loc else None
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return self._entries[key]
+        costs = analyze(schema, document)
+        if key is not None:
+            with self._lock:
+                self._entries[key] = costs
+                while len(self._entries) > self.maxsize:
+                    self._entries.popitem(last=False)
+        return costs
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+cost_cache = CostCache(config()["CACHE_SIZE"])
+
+
+def operation_cost(schema, document, operation_name=None, variables=None):
+    """Return the OperationCost of the operation that will run, if any.
+
+    Operations paging by variables are recosted with ``variables`` (not cached).
+    """
+    costs = cost_cache.get(schema, document)
+    if operation_name is None and len(costs) == 1:
+        operation_name = next(iter(costs))
+    cost = costs.get(operation_name)
+    if cost is not None and variables and cost.page_variables & set(variables):
+        cost = analyze(schema, document, variables)[operation_name]
+    return cost
+
+
+def cost_error(cost, name=None):
+    """Return the GraphQLError for a cost over the depth or cost budget, else None."""
+    options = config()
+    label = f"Operation '{name}'" if name else "Operation"
+    if cost.depth > options["MAX_DEPTH"]:
+        return GraphQLError(
+            f"{label} has depth {cost.depth}, exceeding the maximum of {options['MAX_DEPTH']}.",
+            extensions={"code": "QUERY_TOO_DEEP", "cost": cost.extension()},
+        )
+    if cost.cost > options["MAX_COST"]:
+        return GraphQLError(
+            f"{label} may return {cost.cost} objects, exceeding the budget of {options['MAX_COST']}.",
+            extensions={"code": "QUERY_TOO_COSTLY", "cost": cost.extension()},
+        )
+    return None
+
+
+class CostBudget:
+    """Running cost of the operations of one batched request."""
+
+    def __init__(self, limit=None):
+        self.limit = config()["MAX_COST"] if limit is None else limit
+        self.spent = 0
+        # Parallel batch reads charge from several threads.
+        self.lock = threading.Lock()
+
+    def charge(self, cost, name=None):
+        """Add an operation's cost; return the GraphQLError to fail it with once over the limit."""
+        with self.lock:
+            self.spent += cost.cost
+            spent = self.spent
+        if spent <= self.limit:
+            return None
+        label = f"Operation '{name}'" if name else "Operation"
+        return GraphQLError(
+            f"{label} brings the batch to {spent} objects, exceeding the budget of {self.limit}.",
+            extensions={"code": "BATCH_TOO_COSTLY", "cost": cost.extension()},
+        )
+
+
+class QueryCostRule(ValidationRule):
+    """Reject operations whose static cost or depth exceeds the budget."""
+
+    def enter_document(self, node, *args):
+        for name, cost in cost_cache.get(self.context.schema, node).items():
+            error = cost_error(cost, name)
+            if error is not None:
+                self.report_error(error)
@@ -0,0 +1,153 @@
+"""Opt-in response cache for read-only GraphQL operations.
+
+Responses are stored in the Django cache selected by
+``settings.CRM_RESPONSE_CACHE["CACHE"]`` under a key built from the printed
+document, variables, operation name, user and the current *version* of every
+model the document touches. Writes bump those versions (crm.signals, and the
+set-based updates in crm.models), so stale entries are never read again and
+simply age out.
+
+Responses read from a replica are not stored (see crm.routing): the replica
+may not have the write a version bump announced yet. With read replicas
+configured, queries normally read a replica, so the cache then stores almost
+nothing; it and the replicas are alternative ways to take read load off the
+primary, and enabling both buys little over replicas alone.
+"""
+import hashlib
+import json
+import threading
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from graphql import OperationType, TypeInfo, TypeInfoVisitor, Visitor, get_named_type, get_operation_ast, print_ast, visit
+from graphql.language import FieldNode
+
+DEFAULTS = {
+    "ENABLED": False,
+    "CACHE": "default",
+    # Seconds a response may be reused when no hint applies; 0 = don't cache.
+    "DEFAULT_MAX_AGE": 0,
+    # cacheControl hints per root field (GraphQL name): the response max-age
+    # is the smallest hint among the selected root fields.
+    "MAX_AGE": {},
+}
+
+
+def config():
+    return {**DEFAULTS, **getattr(settings, "CRM_RESPONSE_CACHE", {})}
+
+
+def get_cache():
+    return caches[config()["CACHE"]]
+
+
+def version_key(model_name):
+    return f"crm:version:{model_name}"
+
+
+def _bump(model_names):
+    cache = get_cache()
+    for name in model_names:
+        try:
+            cache.incr(version_key(name))
+        except ValueError:
+            cache.add(version_key(name), 1, timeout=None)
+
+
+def bump_versions(*model_names):
+    """Invalidate cached responses that read any of the given models.
+
+    Bumped now and again on commit, so a reader cannot cache pre-commit data
+    under the new version.
+    """
+    _bump(model_names)
+    transaction.on_commit(lambda: _bump(model_names))
+
+
+class ResponseCacheStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.stores = 0
+
+    def record(self, name):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def as_dict(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "stores": self.stores}
+
+
+stats = ResponseCacheStats()
+
+
+def _models_by_type_name():
+    from graphene_django.registry import get_global_registry
+
+    return {
+        graphene_type._meta.name: model._meta.model_name
+        for model, graphene_type in get_global_registry()._registry.items()
+    }
+
+
+class CachePlan:
+    """What a cacheable document reads and for how long it may be reused."""
+
+    def __init__(self, models, hints, max_age):
+        self.models = models
+        self.hints = hints
+        self.max_age = max_age
+
+    def extension(self):
+        return {"version": 1, "hints": self.hints}
+
+
+def plan_for(schema, document, operation_name):
+    """Return a CachePlan for a query operation, or None if it is not cacheable."""
+    operation = get_operation_ast(document, operation_name)
+    if operation is None or operation.operation != OperationType.QUERY:
+        return None
+
+    options = config()
+    hints = []
+    for selection in operation.selection_set.selections:
+        if isinstance(selection, FieldNode) and selection.name.value != "__typename":
+            name = selection.name.value
+            hints.append({"path": [name], "maxAge": options["MAX_AGE"].get(name, options["DEFAULT_MAX_AGE"])})
+    max_age = min((hint["maxAge"] for hint in hints), default=0)
+    if max_age <= 0:
+        return None
+
+    type_models = _models_by_type_name()
+    models = set()
+    type_info = TypeInfo(schema)
+
+    class ModelCollector(Visitor):
+        def enter_field(self, node, *args):
+            field_type = type_info.get_type()
+            if field_type is not None:
+                model = type_models.get(get_named_type(field_type).name)
+                if model:
+                    models.add(model)
+
+    visit(document, TypeInfoVisitor(type_info, ModelCollector()))
+    return CachePlan(sorted(models), hints, max_age)
+
+
+def cache_key(request, document, variables, operation_name, plan):
+    cache = get_cache()
+    versions = cache.get_many([version_key(name) for name in plan.models])
+    user = getattr(request, "user", None)
+    payload = json.dumps(
+        {
+            "document": print_ast(document),
+            "variables": variables or {},
+            "operation": operation_name,
+            "user": user.pk if user is not None and user.is_authenticated else None,
+            "versions": [versions.get(version_key(name), 0) for name in plan.models],
+        },
+        sort_keys=True,
+        default=str,
+    )
+    return "crm:response:" + hashlib.sha256(payload.encode("utf-8")).hexdigest()
@@ -0,0 +1,105 @@
+"""Read-replica routing for GraphQL operations.
+
+ReplicaRouter (in settings.DATABASE_ROUTERS) sends reads to one of the
+``CRM_DB_ROUTING["REPLICAS"]`` aliases only while a GraphQL ``query``
+operation executes inside a routed request (crm.views wraps every request in
+``routed_request`` and every query in ``replica_reads``). Everything else
+(mutations, jobs, management commands, crm.client) reads the primary.
+
+Within a request, reads stick to the primary once anything was written or a
+mutation ran, so a batch such as ``[createOrder, allOrders]`` always sees its
+own write, whatever the replication lag. A request reads from one replica,
+picked at random, so its queries see one consistent snapshot.
+
+A response read from a replica is not stored in crm.response_cache: a lagging
+replica could otherwise store pre-write data under the versions the write
+bumped. ``read_replica`` tells whether the request read one.
+"""
+import contextlib
+import contextvars
+import random
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+DEFAULTS = {
+    # Database aliases serving replica reads; empty: everything uses the primary.
+    "REPLICAS": (),
+}
+
+
+def config():
+    return {**DEFAULTS, **getattr(settings, "CRM_DB_ROUTING", {})}
+
+
+def replicas():
+    return [alias for alias in config()["REPLICAS"] if alias in connections.settings]
+
+
+class RequestRouting:
+    """Routing state of one request, shared by all of its operations."""
+
+    def __init__(self):
+        self.wrote = False
+        self.replica = None
+
+    def pick_replica(self):
+        if self.replica is None:
+            pool = replicas()
+            self.replica = random.choice(pool) if pool else DEFAULT_DB_ALIAS
+        return self.replica
+
+    @property
+    def read_replica(self):
+        return self.replica not in (None, DEFAULT_DB_ALIAS)
+
+
+current_request = contextvars.ContextVar("crm_db_request", default=None)
+reading_replica = contextvars.ContextVar("crm_db_replica_reads", default=False)
+
+
+@contextlib.contextmanager
+def routed_request():
+    token = current_request.set(RequestRouting())
+    try:
+        yield current_request.get()
+    finally:
+        current_request.reset(token)
+
+
+@contextlib.contextmanager
+def replica_reads(enabled=True):
+    """Let reads in this block go to a replica (unless the request has written)."""
+    state = current_request.get()
+    if state is not None and not enabled:
+        # A mutation: later reads of the request must see what it writes.
+        state.wrote = True
+    token = reading_replica.set(enabled)
+    try:
+        yield
+    finally:
+        reading_replica.reset(token)
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        state = current_request.get()
+        if state is None:
+            return None
+        # Reads inside a primary transaction must see its uncommitted rows.
+        if state.wrote or not reading_replica.get() or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return state.pick_replica()
+
+    def db_for_write(self, model, **hints):
+        state = current_request.get()
+        if state is not None:
+            state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the primary's rows, so objects read from either relate.
+        pool = {DEFAULT_DB_ALIAS, *replicas()}
+        if obj1._state.db in pool and obj2._state.db in pool:
+            return True
+        return None
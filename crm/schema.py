@@ -1,35 +1,153 @@
-import re
 import graphene
 from graphene_django import DjangoObjectType
-from django.db import transaction
-from django.core.exceptions import ValidationError
-from crm.models import Customer, Product, Order   # ✅ absolute import for checker
+from django.db import DEFAULT_DB_ALIAS
+from django.db.models import F
+from django.core.exceptions import PermissionDenied, ValidationError
+from crm.models import Customer, Product, Order, per_product   # ✅ absolute import for checker
+from crm.models import CustomerSales, DailySales, Task
+from . import analytics, tasks
+from .customers import BULK_CHUNK_SIZE, PHONE_RE, bulk_create_customers
 from .filters import CustomerFilter, ProductFilter, OrderFilter
-from graphene_django.filter import DjangoFilterConnectionField
+from .fields import (
+    BatchedFilterConnectionField, KeysetConnection, KeysetConnectionField, has_filter_args
+)
+from .loaders import get_loaders
+from .optimizer import optimize_queryset, prefetched
+from .orders import place_order
+
+TOP_PRODUCTS_MAX = 100
 
 # -----------------
 # TYPES
 # -----------------
+# Connection querysets are shaped to the selection set (crm/optimizer.py).
+# Relations that were not joined or prefetched resolve through the per-request
+# DataLoaders (crm/loaders.py), so a page of N nodes costs one query per
+# relation instead of N.
 class CustomerType(DjangoObjectType):
+    orders = BatchedFilterConnectionField(lambda: OrderType, required=True)
+
     class Meta:
         model = Customer
         filterset_class = CustomerFilter
         interfaces = (graphene.relay.Node,)
 
+    @classmethod
+    def get_queryset(cls, queryset, info):
+        return optimize_queryset(queryset, info)
+
+    def resolve_orders(self, info, **kwargs):
+        if has_filter_args(kwargs):
+            return self.orders.all()
+        cached = prefetched(self, "orders")
+        if cached is not None:
+            return cached
+        return get_loaders(info.context).orders_by_customer.load(self.pk)
+
 
 class ProductType(DjangoObjectType):
+    orders = BatchedFilterConnectionField(lambda: OrderType, required=True)
+
     class Meta:
         model = Product
         filterset_class = ProductFilter
         interfaces = (graphene.relay.Node,)
 
+    @classmethod
+    def get_queryset(cls, queryset, info):
+        return optimize_queryset(queryset, info)
+
+    def resolve_orders(self, info, **kwargs):
+        if has_filter_args(kwargs):
+            return self.orders.all()
+        cached = prefetched(self, "orders")
+        if cached is not None:
+            return cached
+        return get_loaders(info.context).orders_by_product.load(self.pk)
+
 
 class OrderType(DjangoObjectType):
+    # Declared explicitly: the auto-converted FK field would re-fetch the
+    # customer through get_node() once get_queryset is overridden.
+    customer = graphene.Field(CustomerType, required=True)
+    products = BatchedFilterConnectionField(ProductType, required=True)
+
     class Meta:
         model = Order
         filterset_class = OrderFilter
         interfaces = (graphene.relay.Node,)
 
+    @classmethod
+    def get_queryset(cls, queryset, info):
+        return optimize_queryset(queryset, info)
+
+    def resolve_customer(self, info):
+        if Order.customer.is_cached(self):
+            return self.customer
+        return get_loaders(info.context).customer.load(self.customer_id)
+
+    def resolve_products(self, info, **kwargs):
+        if has_filter_args(kwargs):
+            return self.products.all()
+        cached = prefetched(self, "products")
+        if cached is not None:
+            return cached
+        return get_loaders(info.context).products_by_order.load(self.pk)
+
+
+class CustomerKeysetConnection(KeysetConnection):
+    class Meta:
+        node = CustomerType
+
+
+class OrderKeysetConnection(KeysetConnection):
+    class Meta:
+        node = OrderType
+
+
+# Analytics: served from the rollup tables of crm/analytics.py.
+class DailySalesType(DjangoObjectType):
+    class Meta:
+        model = DailySales
+        fields = ("day", "order_count", "revenue")
+
+
+class ProductSalesType(graphene.ObjectType):
+    product = graphene.Field(ProductType, required=True)
+    units = graphene.Int(required=True)
+    revenue = graphene.Decimal(required=True)
+
+
+class CustomerSalesType(DjangoObjectType):
+    class Meta:
+        model = CustomerSales
+        fields = ("customer", "order_count", "revenue", "first_order_at", "last_order_at")
+
+
+def request_user(info):
+    """The authenticated user of the request, or None."""
+    user = getattr(info.context, "user", None)
+    return user if user is not None and user.is_authenticated else None
+
+
+class JobStatusType(DjangoObjectType):
+    """A background task (crm/tasks.py), looked up by the jobId a mutation returned."""
+
+    class Meta:
+        model = Task
+        fields = (
+            "id", "task_type", "status", "attempts", "max_attempts", "run_after", "result", "error",
+            "created_at", "started_at", "finished_at",
+        )
+
+    def resolve_error(self, info):
+        # The traceback is for staff; everyone else gets its last line, the exception.
+        user = request_user(info)
+        if user is not None and user.is_staff:
+            return self.error
+        lines = self.error.strip().splitlines()
+        return lines[-1] if lines else ""
+
 
 # -----------------
 # MUTATIONS
@@ -46,7 +164,7 @@ class CreateCustomer(graphene.Mutation):
     def mutate(self, info, name, email, phone=None):
         if Customer.objects.filter(email=email).exists():
             raise ValidationError("Email already exists.")
-        if phone and not re.match(r"^\+?\d[\d\-]{7,}$", phone):
+        if phone and not PHONE_RE.match(phone):
             raise ValidationError("Invalid phone format.")
         customer = Customer.objects.create(name=name, email=email, phone=phone)
         return CreateCustomer(customer=customer, message="Customer created successfully.")
@@ -55,27 +173,23 @@ class CreateCustomer(graphene.Mutation):
 class BulkCreateCustomers(graphene.Mutation):
     class Arguments:
         input = graphene.List(graphene.JSONString, required=True)
+        chunk_size = graphene.Int(required=False, default_value=BULK_CHUNK_SIZE)
+        # Queue the work (see crm/tasks.py) and return its jobId at once.
+        background = graphene.Boolean(required=False, default_value=False)
 
     customers = graphene.List(CustomerType)
     errors = graphene.List(graphene.String)
+    job_id = graphene.ID()
 
-    @transaction.atomic
-    def mutate(self, info, input):
-        customers = []
-        errors = []
-        for entry in input:
-            try:
-                name = entry.get("name")
-                email = entry.get("email")
-                phone = entry.get("phone")
-                if Customer.objects.filter(email=email).exists():
-                    raise ValidationError(f"Duplicate email: {email}")
-                if phone and not re.match(r"^\+?\d[\d\-]{7,}$", phone):
-                    raise ValidationError(f"Invalid phone: {phone}")
-                customer = Customer.objects.create(name=name, email=email, phone=phone)
-                customers.append(customer)
-            except Exception as e:
-                errors.append(str(e))
+    def mutate(self, info, input, chunk_size=BULK_CHUNK_SIZE, background=False):
+        if chunk_size < 1:
+            raise ValidationError("chunkSize must be positive.")
+        if background:
+            job = tasks.enqueue(
+                "bulk_create_customers", owner=request_user(info), input=input, chunk_size=chunk_size
+            )
+            return BulkCreateCustomers(job_id=job.pk)
+        customers, errors = bulk_create_customers(input, chunk_size)
         return BulkCreateCustomers(customers=customers, errors=errors)
 
 
@@ -104,49 +218,131 @@ class CreateOrder(graphene.Mutation):
     order = graphene.Field(OrderType)
 
     def mutate(self, info, customer_id, product_ids):
-        try:
-            customer = Customer.objects.get(pk=customer_id)
-        except Customer.DoesNotExist:
-            raise ValidationError("Invalid customer ID.")
+        # Reserves one unit of stock per product (see crm/orders.py).
+        return CreateOrder(order=place_order(customer_id, product_ids))
 
-        products = Product.objects.filter(pk__in=product_ids)
-        if not products.exists():
-            raise ValidationError("No valid products found.")
 
-        order = Order.objects.create(customer=customer)
-        order.products.set(products)
-        order.calculate_total()
-        return CreateOrder(order=order)
+class RestockRuleInput(graphene.InputObjectType):
+    product_id = graphene.ID(required=True)
+    threshold = graphene.Int()
+    increment = graphene.Int()
 
 
 class UpdateLowStockProducts(graphene.Mutation):
+    class Arguments:
+        threshold = graphene.Int(required=False, default_value=10)
+        increment = graphene.Int(required=False, default_value=10)
+        rules = graphene.List(graphene.NonNull(RestockRuleInput), required=False)
+        dry_run = graphene.Boolean(required=False, default_value=False)
+        background = graphene.Boolean(required=False, default_value=False)
+
     updated_products = graphene.List(ProductType)
     message = graphene.String()
+    job_id = graphene.ID()
+
+    def mutate(self, info, threshold=10, increment=10, rules=None, dry_run=False, background=False):
+        rules = [dict(rule) for rule in rules or ()]
+        if increment <= 0 or any(rule.get("increment") is not None and rule["increment"] <= 0 for rule in rules):
+            raise ValidationError("Increment must be positive.")
+        if threshold < 0 or any(rule.get("threshold") is not None and rule["threshold"] < 0 for rule in rules):
+            raise ValidationError("Threshold cannot be negative.")
+
+        if background and not dry_run:
+            job = tasks.enqueue(
+                "restock_low_stock", owner=request_user(info),
+                threshold=threshold, increment=increment, rules=rules,
+            )
+            return UpdateLowStockProducts(job_id=job.pk, message="Restock queued.")
 
-    def mutate(self, info):
-        low_stock_products = Product.objects.filter(stock__lt=10)
-        updated_products = []
-        for product in low_stock_products:
-            product.stock += 10
-            product.save()
-            updated_products.append(product)
-        
-        message = f"{len(updated_products)} products restocked."
+        low_stock_products = Product.objects.low_stock(threshold, rules)
+        if dry_run:
+            updated_products = list(
+                low_stock_products.annotate(
+                    restocked=F("stock") + per_product(increment, rules, "increment")
+                )
+            )
+            for product in updated_products:
+                product.stock = product.restocked
+            message = f"{len(updated_products)} products would be restocked."
+        else:
+            updated_products = low_stock_products.restock(increment, rules)
+            message = f"{len(updated_products)} products restocked."
         return UpdateLowStockProducts(updated_products=updated_products, message=message)
 
 
+class CleanupInactiveCustomers(graphene.Mutation):
+    """Queue ``manage.py cleanup_inactive_customers``; always runs in the background.
+
+    Deletes customers in bulk, so it needs the ``crm.delete_customer``
+    permission.
+    """
+
+    class Arguments:
+        days = graphene.Int(required=False, default_value=365)
+        chunk_size = graphene.Int(required=False, default_value=500)
+
+    job_id = graphene.ID()
+
+    def mutate(self, info, days=365, chunk_size=500):
+        user = request_user(info)
+        if user is None or not user.has_perm("crm.delete_customer"):
+            raise PermissionDenied("You do not have permission to delete customers.")
+        if days < 1 or chunk_size < 1:
+            raise ValidationError("days and chunkSize must be positive.")
+        job = tasks.enqueue("cleanup_inactive_customers", owner=user, days=days, chunk_size=chunk_size)
+        return CleanupInactiveCustomers(job_id=job.pk)
+
+
 class Mutation(graphene.ObjectType):
     create_customer = CreateCustomer.Field()
     bulk_create_customers = BulkCreateCustomers.Field()
     create_product = CreateProduct.Field()
     create_order = CreateOrder.Field()
     updateLowStockProducts = UpdateLowStockProducts.Field()  # ✅ match GraphQL mutation name exactly
+    cleanup_inactive_customers = CleanupInactiveCustomers.Field()
 
 
 # -----------------
 # QUERIES (with filters)
 # -----------------
 class Query(graphene.ObjectType):
-    all_customers = DjangoFilterConnectionField(CustomerType)
-    all_products = DjangoFilterConnectionField(ProductType)
-    all_orders = DjangoFilterConnectionField(OrderType)
+    all_customers = BatchedFilterConnectionField(CustomerType)
+    all_products = BatchedFilterConnectionField(ProductType)
+    all_orders = BatchedFilterConnectionField(OrderType)
+    # Opt-in keyset pagination: constant cost per page, newest first.
+    all_customers_keyset = KeysetConnectionField(CustomerKeysetConnection, key="created_at")
+    all_orders_keyset = KeysetConnectionField(OrderKeysetConnection, key="order_date")
+
+    # Date ranges are [since, until).
+    revenue_by_day = graphene.List(
+        graphene.NonNull(DailySalesType), required=True, since=graphene.Date(), until=graphene.Date()
+    )
+    top_products = graphene.List(
+        graphene.NonNull(ProductSalesType), required=True,
+        since=graphene.Date(), until=graphene.Date(), first=graphene.Int(default_value=10),
+    )
+    customer_lifetime_value = graphene.Field(CustomerSalesType, customer_id=graphene.ID(required=True))
+    job_status = graphene.Field(JobStatusType, id=graphene.ID(required=True))
+
+    def resolve_revenue_by_day(self, info, since=None, until=None):
+        return analytics.revenue_by_day(since, until)
+
+    def resolve_top_products(self, info, since=None, until=None, first=10):
+        if not 1 <= first <= TOP_PRODUCTS_MAX:
+            raise ValidationError(f"`first` must be between 1 and {TOP_PRODUCTS_MAX}.")
+        return analytics.top_products(since, until, first)
+
+    def resolve_customer_lifetime_value(self, info, customer_id):
+        return analytics.customer_lifetime_value(customer_id)
+
+    def resolve_job_status(self, info, id):
+        # Jobs are visible to staff and to the user who queued them; anyone
+        # else gets null, as for an unknown id.
+        user = request_user(info)
+        if user is None:
+            return None
+        # Read from the primary: a lagging replica would report stale progress.
+        jobs = Task.objects.using(DEFAULT_DB_ALIAS).filter(pk=id)
+        if not user.is_staff:
+            jobs = jobs.filter(owner=user)
+        return jobs.first()
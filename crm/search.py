@@ -0,0 +1,208 @@
+"""Ranked text search for the CRM models.
+
+``icontains`` filters compile to ``LIKE '%x%'`` which no index can serve. The
+``search`` filter argument goes through one of these backends instead,
+selected by ``settings.CRM_SEARCH_BACKEND``:
+
+* ``sqlite_fts``: FTS5 shadow tables (created by migration 0003) kept in sync
+  by crm.signals, ranked with bm25().
+* ``postgres_trgm``: pg_trgm GIN indexes serve the ILIKE match, ranked with
+  trigram word similarity.
+* ``like``: plain icontains, unranked; works everywhere.
+* ``auto`` (default): sqlite_fts on SQLite, postgres_trgm on PostgreSQL,
+  like elsewhere.
+"""
+import re
+from functools import reduce
+from operator import or_
+
+from django.conf import settings
+from django.db import connections, router
+from django.db.models import F, FloatField, Func, Max, OuterRef, Q, Subquery
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Greatest
+
+from crm.models import Customer, Product, Order
+
+SEARCH_FIELDS = {
+    Customer: ("name", "email"),
+    Product: ("name",),
+    Order: ("customer__name", "products__name"),
+}
+
+
+def icontains_any(fields, text):
+    return reduce(or_, (Q(**{f"{field}__icontains": text}) for field in fields))
+
+
+def connection_for(model):
+    """The connection holding ``model``'s rows, and so its search documents."""
+    return connections[router.db_for_write(model)]
+
+
+class LikeBackend:
+    def search(self, queryset, text):
+        matches = queryset.model._default_manager.filter(
+            icontains_any(SEARCH_FIELDS[queryset.model], text)
+        )
+        return queryset.filter(pk__in=matches.values("pk"))
+
+    def index(self, model, pks):
+        """Refresh the documents of ``pks``; return the pks whose text changed."""
+        return []
+
+    def remove(self, model, pks):
+        pass
+
+    def rebuild(self, model):
+        pass
+
+
+class PostgresTrigramBackend(LikeBackend):
+    def search(self, queryset, text):
+        from django.contrib.postgres.search import TrigramWordSimilarity
+
+        model = queryset.model
+        fields = SEARCH_FIELDS[model]
+        similarities = [TrigramWordSimilarity(text, field) for field in fields]
+        score = similarities[0] if len(similarities) == 1 else Greatest(*similarities)
+        # Scored in a subquery: to-many fields would otherwise duplicate rows.
+        ranks = (
+            model._default_manager.filter(pk=OuterRef("pk"))
+            .values("pk")
+            .annotate(score=Max(score))
+            .values("score")
+        )
+        return (
+            super().search(queryset, text)
+            .annotate(search_rank=Subquery(ranks, output_field=FloatField()))
+            .order_by("-search_rank", "pk")
+        )
+
+
+class BM25Rank(Func):
+    """bm25() of the FTS5 row matching ``pk``, which is compiled with the
+    queryset's own alias for the table (``U0`` in a subquery, say)."""
+
+    output_field = FloatField()
+
+    def __init__(self, table, match):
+        self.table, self.match = table, match
+        super().__init__(F("pk"))
+
+    def as_sql(self, compiler, connection, **extra_context):
+        pk_sql, params = compiler.compile(self.source_expressions[0])
+        table = self.table
+        return (
+            f"(SELECT bm25({table}) FROM {table} WHERE {table} MATCH %s AND rowid = {pk_sql})",
+            [self.match, *params],
+        )
+
+
+class SQLiteFTSBackend(LikeBackend):
+    # model -> (FTS5 table, columns, source id column, source SELECT
+    # producing id + columns).
+    TABLES = {
+        Customer: (
+            "crm_customer_fts", ("name", "email"), "id",
+            "SELECT id, name, email FROM crm_customer WHERE {where}",
+        ),
+        Product: (
+            "crm_product_fts", ("name",), "id",
+            "SELECT id, name FROM crm_product WHERE {where}",
+        ),
+        Order: (
+            "crm_order_fts", ("customer_name", "product_names"), "o.id",
+            "SELECT o.id AS id, c.name AS customer_name,"
+            " COALESCE(group_concat(p.name, ' '), '') AS product_names"
+            " FROM crm_order o JOIN crm_customer c ON c.id = o.customer_id"
+            " LEFT JOIN crm_order_products op ON op.order_id = o.id"
+            " LEFT JOIN crm_product p ON p.id = op.product_id"
+            " WHERE {where} GROUP BY o.id, c.name",
+        ),
+    }
+    # Stay well below SQLite's bound-parameter limit.
+    CHUNK_SIZE = 500
+
+    @staticmethod
+    def match_expression(text):
+        # Quote every word and prefix-match it: no FTS5 syntax from user input.
+        return " ".join(f'"{word}"*' for word in re.findall(r"\w+", text))
+
+    def search(self, queryset, text):
+        match = self.match_expression(text)
+        if not match:
+            return queryset.none()
+        table = self.TABLES[queryset.model][0]
+        return (
+            queryset.filter(pk__in=RawSQL(f"SELECT rowid FROM {table} WHERE {table} MATCH %s", [match]))
+            .annotate(search_rank=BM25Rank(table, match))
+            .order_by("search_rank", "pk")
+        )
+
+    def index(self, model, pks):
+        table, columns, id_column, source = self.TABLES[model]
+        pks = list(pks)
+        changed = []
+        with connection_for(model).cursor() as cursor:
+            for start in range(0, len(pks), self.CHUNK_SIZE):
+                chunk = pks[start:start + self.CHUNK_SIZE]
+                placeholders = ", ".join(["%s"] * len(chunk))
+                # Only rewrite rows whose text differs from the shadow copy.
+                select = source.format(where=f"{id_column} IN ({placeholders})")
+                differs = " OR ".join(f"f.{column} IS NOT src.{column}" for column in columns)
+                cursor.execute(
+                    f"SELECT src.id FROM ({select}) AS src LEFT JOIN {table} AS f ON f.rowid = src.id"
+                    f" WHERE f.rowid IS NULL OR {differs}",
+                    chunk,
+                )
+                stale = [row[0] for row in cursor.fetchall()]
+                if not stale:
+                    continue
+                placeholders = ", ".join(["%s"] * len(stale))
+                cursor.execute(f"DELETE FROM {table} WHERE rowid IN ({placeholders})", stale)
+                cursor.execute(
+                    f"INSERT INTO {table} (rowid, {', '.join(columns)}) "
+                    + source.format(where=f"{id_column} IN ({placeholders})"),
+                    stale,
+                )
+                changed.extend(stale)
+        return changed
+
+    def remove(self, model, pks):
+        table = self.TABLES[model][0]
+        pks = list(pks)
+        with connection_for(model).cursor() as cursor:
+            for start in range(0, len(pks), self.CHUNK_SIZE):
+                chunk = pks[start:start + self.CHUNK_SIZE]
+                placeholders = ", ".join(["%s"] * len(chunk))
+                cursor.execute(f"DELETE FROM {table} WHERE rowid IN ({placeholders})", chunk)
+
+    def rebuild(self, model):
+        table, columns, _, source = self.TABLES[model]
+        with connection_for(model).cursor() as cursor:
+            cursor.execute(f"DELETE FROM {table}")
+            cursor.execute(
+                f"INSERT INTO {table} (rowid, {', '.join(columns)}) " + source.format(where="1 = 1")
+            )
+
+
+BACKENDS = {
+    "like": LikeBackend,
+    "sqlite_fts": SQLiteFTSBackend,
+    "postgres_trgm": PostgresTrigramBackend,
+}
+AUTO_BACKENDS = {"sqlite": "sqlite_fts", "postgresql": "postgres_trgm"}
+
+_backend = None
+
+
+def get_search_backend():
+    global _backend
+    if _backend is None:
+        name = getattr(settings, "CRM_SEARCH_BACKEND", "auto")
+        if name == "auto":
+            # Replicas run the primary's engine; reading the route has no side effects.
+            name = AUTO_BACKENDS.get(connections[router.db_for_read(Customer)].vendor, "like")
+        _backend = BACKENDS[name]()
+    return _backend
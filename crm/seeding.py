@@ -0,0 +1,131 @@
+"""Deterministic, production-shaped test data (``manage.py seed_db``).
+
+Everything is drawn from one ``random.Random(seed)``, so the same arguments
+always produce the same rows (dates are offsets back from ``until``, which
+defaults to today's midnight). The shape follows what a real shop looks like:
+
+- product popularity is Zipf-like: a few products appear in most orders;
+- order sizes are skewed towards 1-3 products, occasionally up to 8;
+- a minority of customers place most of the orders;
+- prices are log-normal, order dates uniform over ``days``.
+
+Rows are written with ``bulk_create`` in chunks, so signals do not run; the
+totals of each chunk's orders are recomputed after its lines, and the search
+index and the analytics rollups are rebuilt at the end.
+"""
+import datetime
+import itertools
+import random
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from crm import analytics
+from crm.models import Customer, CustomerSales, DailySales, Order, Product, ProductDailySales
+from crm.response_cache import bump_versions
+from crm.search import get_search_backend
+
+CHUNK_SIZE = 2000
+
+# Products per order and how often each size occurs.
+ORDER_SIZES = (1, 2, 3, 4, 5, 6, 8)
+ORDER_SIZE_WEIGHTS = (30, 25, 18, 12, 8, 5, 2)
+
+
+def flush():
+    """Delete all CRM rows with one DELETE per table (no per-row signals)."""
+    qn = connection.ops.quote_name
+    models = (
+        Order.products.through, Order, Customer, Product, DailySales, ProductDailySales, CustomerSales,
+    )
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            for model in models:
+                cursor.execute(f"DELETE FROM {qn(model._meta.db_table)}")
+        # Empties the search index along with its tables.
+        backend = get_search_backend()
+        for model in (Customer, Product, Order):
+            backend.rebuild(model)
+
+
+def cumulative(weights):
+    return list(itertools.accumulate(weights))
+
+
+def generate(
+    customers, products, orders, seed=0, days=365, until=None, chunk_size=CHUNK_SIZE, stdout=None
+):
+    """Insert the rows; return the counts per table."""
+    rng = random.Random(seed)
+    if until is None:
+        until = timezone.make_aware(datetime.datetime.combine(timezone.localdate(), datetime.time.min))
+
+    def log(message):
+        if stdout is not None:
+            stdout.write(message)
+
+    with transaction.atomic():
+        product_ids = []
+        for start in range(0, products, chunk_size):
+            rows = Product.objects.bulk_create(
+                Product(
+                    name=f"Product {i}",
+                    price=round(min(5000, max(0.5, rng.lognormvariate(3, 1))), 2),
+                    stock=rng.randint(0, 500),
+                )
+                for i in range(start, min(products, start + chunk_size))
+            )
+            product_ids += [row.pk for row in rows]
+        log(f"{len(product_ids)} products")
+
+        customer_ids = []
+        for start in range(0, customers, chunk_size):
+            rows = Customer.objects.bulk_create(
+                Customer(
+                    name=f"Customer {i}",
+                    email=f"customer{i}@example.com",
+                    phone=f"+1555{i:07d}" if rng.random() < 0.6 else None,
+                )
+                for i in range(start, min(customers, start + chunk_size))
+            )
+            customer_ids += [row.pk for row in rows]
+        log(f"{len(customer_ids)} customers")
+
+        product_weights = cumulative(1 / (rank + 1) for rank in range(len(product_ids)))
+        customer_weights = cumulative(rng.paretovariate(1.2) for _ in customer_ids)
+        size_weights = cumulative(ORDER_SIZE_WEIGHTS)
+        through = Order.products.through
+        span = days * 86400
+        lines = 0
+        for start in range(0, orders, chunk_size):
+            count = min(orders, start + chunk_size) - start
+            owners = rng.choices(customer_ids, cum_weights=customer_weights, k=count)
+            dates = [until - datetime.timedelta(seconds=rng.randrange(span)) for _ in range(count)]
+            chunk = Order.objects.bulk_create(Order(customer_id=owner) for owner in owners)
+            # order_date is auto_now_add, which bulk_create always overwrites.
+            for order, order_date in zip(chunk, dates):
+                order.order_date = order_date
+            Order.objects.bulk_update(chunk, ["order_date"])
+            links = []
+            for order in chunk:
+                size = min(len(product_ids), rng.choices(ORDER_SIZES, cum_weights=size_weights)[0])
+                chosen = set()
+                while len(chosen) < size:
+                    chosen.add(rng.choices(product_ids, cum_weights=product_weights)[0])
+                links += [through(order_id=order.pk, product_id=pk) for pk in sorted(chosen)]
+            through.objects.bulk_create(links)
+            # Only the generated orders: rows already in the database keep
+            # their totals.
+            Order.objects.filter(pk__in=[order.pk for order in chunk]).recompute_totals()
+            lines += len(links)
+            log(f"{start + count} orders, {lines} order lines")
+
+        backend = get_search_backend()
+        for model in (Customer, Product, Order):
+            backend.rebuild(model)
+        rollups = analytics.rebuild()
+    bump_versions("customer", "product", "order")
+    return {
+        "customers": len(customer_ids), "products": len(product_ids), "orders": orders, "lines": lines,
+        **rollups,
+    }
@@ -0,0 +1,198 @@
+from django.db import transaction
+from django.db.models import F, Sum
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from crm import analytics
+from crm.models import Customer, Order, Product, ProductDailySales
+from crm.response_cache import bump_versions
+from crm.search import get_search_backend
+
+
+@receiver(m2m_changed, sender=Order.products.through)
+def remember_cleared_orders(sender, instance, action, reverse, **kwargs):
+    # product.orders.clear(): the links are gone by post_clear, so remember
+    # whose totals and search documents change.
+    if action == "pre_clear" and reverse:
+        instance._cleared_order_ids = list(instance.orders.values_list("pk", flat=True))
+
+
+def affected_order_ids(instance, action, reverse, pk_set):
+    if not reverse:
+        return [instance.pk]
+    if action == "post_clear":
+        return getattr(instance, "_cleared_order_ids", [])
+    return list(pk_set)
+
+
+@receiver(m2m_changed, sender=Order.products.through)
+def maintain_order_total(sender, instance, action, reverse, pk_set, **kwargs):
+    """Keep Order.total_amount in step with Order.products.
+
+    Additions are applied as a delta (Django passes only the newly linked ids
+    in ``pk_set``); removals and clears recompute the affected orders from the
+    through table in one UPDATE.
+    """
+    if action not in ("post_add", "post_remove", "post_clear"):
+        return
+
+    if not reverse:
+        if action == "post_add":
+            delta = Product.objects.filter(pk__in=pk_set).aggregate(total=Sum("price"))["total"] or 0
+            Order.objects.filter(pk=instance.pk).update(total_amount=F("total_amount") + delta)
+        else:
+            Order.objects.filter(pk=instance.pk).recompute_totals()
+        instance.refresh_from_db(fields=["total_amount"])
+    elif action == "post_add":
+        Order.objects.filter(pk__in=pk_set).update(total_amount=F("total_amount") + instance.price)
+    else:
+        Order.objects.filter(pk__in=affected_order_ids(instance, action, reverse, pk_set)).recompute_totals()
+
+
+# -----------------
+# SEARCH INDEX (crm/search.py)
+# -----------------
+@receiver(m2m_changed, sender=Order.products.through)
+def index_order_products(sender, instance, action, reverse, pk_set, **kwargs):
+    if action in ("post_add", "post_remove", "post_clear"):
+        get_search_backend().index(Order, affected_order_ids(instance, action, reverse, pk_set))
+
+
+@receiver(post_save, sender=Customer)
+def index_customer(sender, instance, created, **kwargs):
+    backend = get_search_backend()
+    if backend.index(Customer, [instance.pk]) and not created:
+        # Order documents embed the customer name.
+        backend.index(Order, instance.orders.values_list("pk", flat=True))
+
+
+@receiver(post_save, sender=Product)
+def index_product(sender, instance, created, **kwargs):
+    backend = get_search_backend()
+    if backend.index(Product, [instance.pk]) and not created:
+        backend.index(Order, instance.orders.values_list("pk", flat=True))
+
+
+@receiver(pre_delete, sender=Product)
+def remember_product_orders(sender, instance, **kwargs):
+    instance._cleared_order_ids = list(instance.orders.values_list("pk", flat=True))
+
+
+@receiver(post_save, sender=Order)
+def index_order(sender, instance, **kwargs):
+    get_search_backend().index(Order, [instance.pk])
+
+
+@receiver(post_delete, sender=Customer)
+@receiver(post_delete, sender=Product)
+@receiver(post_delete, sender=Order)
+def unindex(sender, instance, **kwargs):
+    backend = get_search_backend()
+    backend.remove(sender, [instance.pk])
+    if sender is Product:
+        backend.index(Order, getattr(instance, "_cleared_order_ids", []))
+
+
+# -----------------
+# RESPONSE CACHE VERSIONS (crm/response_cache.py)
+# -----------------
+@receiver(post_save, sender=Customer)
+@receiver(post_save, sender=Product)
+@receiver(post_save, sender=Order)
+@receiver(post_delete, sender=Customer)
+@receiver(post_delete, sender=Product)
+@receiver(post_delete, sender=Order)
+def invalidate_model(sender, **kwargs):
+    bump_versions(sender._meta.model_name)
+
+
+@receiver(m2m_changed, sender=Order.products.through)
+def invalidate_order_products(sender, action, **kwargs):
+    if action in ("post_add", "post_remove", "post_clear"):
+        bump_versions("order", "product")
+
+
+# -----------------
+# ANALYTICS ROLLUPS (crm/analytics.py)
+# -----------------
+@receiver(pre_save, sender=Order)
+def remember_order_rollup_fields(sender, instance, **kwargs):
+    instance._rollup_fields = None
+    if not instance._state.adding:
+        instance._rollup_fields = (
+            Order.objects.filter(pk=instance.pk).values_list("order_date", "customer_id", "total_amount").first()
+        )
+
+
+@receiver(post_save, sender=Order)
+def refresh_order_rollups(sender, instance, created, **kwargs):
+    if created:
+        analytics.record_order(instance)
+        return
+    before = getattr(instance, "_rollup_fields", None)
+    if before is None:
+        analytics.refresh_orders([instance.pk])
+        return
+    order_date, customer_id, total = before
+    if (order_date, customer_id) != (instance.order_date, instance.customer_id):
+        # Moved: the old day and customer lose the order, the new ones gain it.
+        days, customer_ids, product_ids = analytics.rollup_keys([instance.pk])
+        days.add(timezone.localdate(order_date))
+        customer_ids.add(customer_id)
+        analytics.refresh(days, customer_ids, product_ids)
+    else:
+        new_total = sender._meta.get_field("total_amount").to_python(instance.total_amount)
+        analytics.record_revenue(instance, new_total - total)
+
+
+@receiver(m2m_changed, sender=Order.products.through)
+def refresh_order_product_rollups(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == "pre_clear" and not reverse:
+        instance._cleared_product_ids = list(instance.products.values_list("pk", flat=True))
+    if action == "post_add":
+        # New lines only add to the rollups.
+        if reverse:
+            analytics.record_lines(sender.objects.filter(product_id=instance.pk, order_id__in=pk_set))
+        else:
+            analytics.record_lines(sender.objects.filter(order_id=instance.pk, product_id__in=pk_set))
+    elif action in ("post_remove", "post_clear"):
+        if reverse:
+            analytics.refresh_orders(affected_order_ids(instance, action, reverse, pk_set), [instance.pk])
+        elif action == "post_clear":
+            analytics.refresh_orders([instance.pk], getattr(instance, "_cleared_product_ids", []))
+        else:
+            analytics.refresh_orders([instance.pk], pk_set)
+
+
+@receiver(pre_delete, sender=Order)
+def remember_order_rollup_keys(sender, instance, **kwargs):
+    instance._rollup_keys = analytics.rollup_keys([instance.pk])
+
+
+@receiver(post_delete, sender=Order)
+def refresh_deleted_order_rollups(sender, instance, **kwargs):
+    analytics.refresh(*getattr(instance, "_rollup_keys", ((), (), ())))
+
+
+@receiver(pre_save, sender=Product)
+def remember_product_price(sender, instance, update_fields=None, **kwargs):
+    if instance.pk is None or (update_fields is not None and "price" not in update_fields):
+        return
+    instance._old_price = Product.objects.filter(pk=instance.pk).values_list("price", flat=True).first()
+
+
+@receiver(post_save, sender=Product)
+def refresh_product_price_rollups(sender, instance, created, **kwargs):
+    old_price = getattr(instance, "_old_price", None)
+    instance._old_price = None
+    if created or old_price is None or old_price == sender._meta.get_field("price").to_python(instance.price):
+        return
+    # Product revenue is priced at refresh time; redo this product's rows, after
+    # the commit so the request's transaction doesn't wait on them.
+    transaction.on_commit(lambda: analytics.refresh_products([instance.pk]))
+
+
+@receiver(post_delete, sender=Product)
+def delete_product_rollups(sender, instance, **kwargs):
+    ProductDailySales.objects.filter(product_id=instance.pk).delete()
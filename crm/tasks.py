@@ -0,0 +1,181 @@
+"""Database-backed background task queue.
+
+Task types are declared in ``settings.CRM_TASKS``. ``enqueue(task_type,
+**kwargs)`` stores a Task row and returns at once (mutations hand its id back
+as ``jobId``, polled with the ``jobStatus`` query); ``manage.py run_worker``
+claims queued tasks and runs them in a process pool:
+
+- a task is claimed with a conditional UPDATE (queued -> running), so two
+  workers never run the same task;
+- a running task holds one of its type's ``concurrency`` slots, unique per
+  type among running tasks, so the limit holds across any number of workers;
+- a failed attempt is retried after ``backoff * 2 ** (attempts - 1)`` seconds
+  (at most ``max_backoff``) until ``max_attempts``; a ValidationError is
+  final, as retrying cannot fix the input;
+- the worker bumps ``heartbeat_at`` of its running tasks every
+  ``HEARTBEAT_INTERVAL`` seconds; a task whose heartbeat is older than
+  ``timeout`` went down with its worker and is requeued, or failed if that was
+  its last attempt. A slow task that is still beating is never requeued.
+
+Handlers take the task's (JSON) kwargs and return a JSON-serializable result.
+"""
+import datetime
+import io
+import logging
+import os
+import socket
+import traceback
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.management import call_command
+from django.db import IntegrityError, connection, transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from crm import customers
+from crm.models import Product, Task
+
+logger = logging.getLogger(__name__)
+
+WORKER = f"{socket.gethostname()}:{os.getpid()}"
+
+DEFAULT_TASK = {
+    # Tasks of this type running at once, across all workers.
+    "concurrency": 1,
+    "max_attempts": 3,
+    # Seconds before the first retry; doubled on each further one.
+    "backoff": 10,
+    "max_backoff": 600,
+    # Seconds without a heartbeat after which a running task is considered lost.
+    "timeout": 300,
+}
+
+# Seconds between heartbeats of a worker's running tasks.
+HEARTBEAT_INTERVAL = 10
+
+# Queued tasks looked at per claim, oldest first, when earlier ones belong to
+# types that are at their concurrency limit.
+CLAIM_SCAN = 20
+
+
+def get_task_types():
+    return {name: {**DEFAULT_TASK, **spec} for name, spec in getattr(settings, "CRM_TASKS", {}).items()}
+
+
+def enqueue(task_type, owner=None, **kwargs):
+    """Queue a task for ``owner`` (a user, or None); return its Task row."""
+    spec = get_task_types().get(task_type)
+    if spec is None:
+        raise ValueError(f"Unknown task type: {task_type}")
+    return Task.objects.create(
+        task_type=task_type, kwargs=kwargs, max_attempts=spec["max_attempts"], owner=owner
+    )
+
+
+def retry_delay(spec, attempts):
+    return min(spec["max_backoff"], spec["backoff"] * 2 ** (attempts - 1))
+
+
+def heartbeat(pks, worker=WORKER):
+    """Mark the worker's running tasks ``pks`` as alive."""
+    return Task.objects.filter(pk__in=pks, status=Task.RUNNING, worker=worker).update(
+        heartbeat_at=timezone.now()
+    )
+
+
+def requeue_lost(task_types):
+    """Requeue (or fail) running tasks whose heartbeat is older than their type's timeout."""
+    specs = get_task_types()
+    now = timezone.now()
+    for name in task_types:
+        lost = Task.objects.filter(
+            task_type=name, status=Task.RUNNING,
+            heartbeat_at__lt=now - datetime.timedelta(seconds=specs[name]["timeout"]),
+        )
+        lost.filter(attempts__gte=F("max_attempts")).update(
+            status=Task.FAILED, slot=None, finished_at=now, error="Worker lost."
+        )
+        lost.update(status=Task.QUEUED, slot=None, run_after=now, error="Worker lost.")
+
+
+def claim(task_types=None, worker=WORKER):
+    """Mark the oldest due task that has a free slot as running; return it or None."""
+    specs = get_task_types()
+    names = list(specs) if task_types is None else [name for name in task_types if name in specs]
+    now = timezone.now()
+    candidates = (
+        Task.objects.filter(status=Task.QUEUED, run_after__lte=now, task_type__in=names)
+        .order_by("run_after", "pk").values_list("pk", "task_type")[:CLAIM_SCAN]
+    )
+    full = set()
+    for pk, task_type in candidates:
+        if task_type in full:
+            continue
+        taken = set(
+            Task.objects.filter(task_type=task_type, status=Task.RUNNING).values_list("slot", flat=True)
+        )
+        free = [slot for slot in range(specs[task_type]["concurrency"]) if slot not in taken]
+        if not free:
+            full.add(task_type)
+            continue
+        try:
+            with transaction.atomic():
+                claimed = Task.objects.filter(pk=pk, status=Task.QUEUED).update(
+                    status=Task.RUNNING, slot=free[0], attempts=F("attempts") + 1,
+                    started_at=now, heartbeat_at=now, worker=worker,
+                )
+        except IntegrityError:
+            # Another worker took the slot first.
+            continue
+        if claimed:
+            return Task.objects.get(pk=pk)
+    return None
+
+
+def run_task(pk):
+    """Run a claimed task and record the outcome; return its new status."""
+    # Long-lived worker: reuse the connection, but drop it if it went stale.
+    if connection.connection is not None and not connection.is_usable():
+        connection.close()
+    task = Task.objects.get(pk=pk)
+    spec = get_task_types()[task.task_type]
+    result, error = None, ""
+    try:
+        result = import_string(spec["callable"])(**task.kwargs)
+        status = Task.SUCCESS
+    except Exception as e:
+        error = traceback.format_exc()
+        logger.exception("Task %s #%s failed (attempt %s).", task.task_type, pk, task.attempts)
+        final = isinstance(e, ValidationError) or task.attempts >= task.max_attempts
+        status = Task.FAILED if final else Task.QUEUED
+
+    now = timezone.now()
+    updates = {"status": status, "slot": None, "result": result, "error": error}
+    if status == Task.QUEUED:
+        updates["run_after"] = now + datetime.timedelta(seconds=retry_delay(spec, task.attempts))
+    else:
+        updates["finished_at"] = now
+    # Unless requeue_lost gave the task to another worker meanwhile.
+    Task.objects.filter(pk=pk, status=Task.RUNNING, attempts=task.attempts).update(**updates)
+    return status
+
+
+# -----------------
+# TASKS
+# -----------------
+def restock_low_stock(threshold=10, increment=10, rules=None):
+    products = Product.objects.low_stock(threshold, rules).restock(increment, rules)
+    return {"restocked": [product.pk for product in products]}
+
+
+def bulk_create_customers(input, chunk_size=customers.BULK_CHUNK_SIZE):
+    created, errors = customers.bulk_create_customers(input, chunk_size)
+    return {"created": [customer.pk for customer in created], "errors": errors}
+
+
+def cleanup_inactive_customers(days=365, chunk_size=500):
+    out = io.StringIO()
+    call_command("cleanup_inactive_customers", days=days, chunk_size=chunk_size, stdout=out)
+    return {"output": out.getvalue().strip().splitlines()[-1]}
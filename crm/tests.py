@@ -1,3 +1,1433 @@
-from django.test import TestCase
+import datetime
+import io
+import json
+import os
+import tempfile
+import threading
+from collections import Counter
+from unittest import mock
+from decimal import Decimal
 
-# Create your tests here.
+from django.contrib.auth.models import Permission, User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection, connections
+from django.db.models import Count, OuterRef, Subquery, Sum
+from django.test import TestCase, TransactionTestCase, RequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from graphene_django.settings import graphene_settings
+from graphql import parse
+from graphql_relay import from_global_id
+
+from alx_backend_graphql.schema import schema
+from crm import analytics
+from crm.client import GraphQLClient, GraphQLClientError
+from crm.db import set_journal_mode, sqlite_pragmas
+from crm.documents import DocumentCache, document_cache, query_hash
+from crm.loaders import Loaders, get_loaders
+from crm.query_cost import cost_cache, operation_cost
+from crm.tracing import metrics
+from crm.views import CRMGraphQLView
+from crm import jobs
+from crm.jobs import run_job
+from crm.management.commands.cleanup_inactive_customers import delete_customers
+from crm.models import Customer, CustomerSales, DailySales, JobRun, Product, ProductDailySales, Order, Task
+from crm.orders import place_order, unavailable_message
+from crm.schema import Query as CRMQuery
+from crm.search import get_search_backend
+from crm import seeding
+from crm import tasks
+
+
+def execute(query, variables=None, user=None):
+    request = RequestFactory().post("/graphql")
+    if user is not None:
+        request.user = user
+    return schema.execute(query, variable_values=variables, context_value=request)
+
+
+class DataLoaderTests(TestCase):
+    ORDERS_QUERY = """
+    query ($first: Int) {
+      allOrders(first: $first) {
+        edges {
+          node {
+            customer { email orders { edges { node { id } } } }
+            products { edges { node { name price orders { edges { node { id } } } } } }
+          }
+        }
+      }
+    }
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        products = [
+            Product.objects.create(name=f"Product {i}", price=10 + i, stock=5)
+            for i in range(4)
+        ]
+        for i in range(30):
+            customer = Customer.objects.create(name=f"Customer {i}", email=f"c{i}@example.com")
+            order = Order.objects.create(customer=customer)
+            order.products.set(products[: 1 + i % 4])
+
+    def count_queries(self, first):
+        with CaptureQueriesContext(connection) as ctx:
+            result = execute(self.ORDERS_QUERY, {"first": first})
+        self.assertIsNone(result.errors)
+        self.assertEqual(len(result.data["allOrders"]["edges"]), first)
+        return len(ctx.captured_queries)
+
+    def test_query_count_is_independent_of_page_size(self):
+        self.assertEqual(self.count_queries(3), self.count_queries(30))
+
+    def test_relations_match_orm(self):
+        result = execute(self.ORDERS_QUERY, {"first": 30})
+        self.assertIsNone(result.errors)
+        orders = Order.objects.order_by("pk").prefetch_related("products")
+        for edge, order in zip(result.data["allOrders"]["edges"], orders):
+            node = edge["node"]
+            self.assertEqual(node["customer"]["email"], order.customer.email)
+            self.assertEqual(
+                [p["node"]["name"] for p in node["products"]["edges"]],
+                [p.name for p in order.products.order_by("pk")],
+            )
+
+    def test_nested_filter_args_fall_back_to_queryset(self):
+        result = execute("""
+        {
+          allOrders(first: 1) {
+            edges { node { products(name: "Product 0") { edges { node { name } } } } }
+          }
+        }
+        """)
+        self.assertIsNone(result.errors)
+        products = result.data["allOrders"]["edges"][0]["node"]["products"]["edges"]
+        self.assertEqual([p["node"]["name"] for p in products], ["Product 0"])
+
+
+class QueryOptimizerTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        product = Product.objects.create(name="Laptop", price=999, stock=3)
+        for i in range(5):
+            customer = Customer.objects.create(
+                name=f"Customer {i}", email=f"c{i}@example.com", phone="+1234567890"
+            )
+            order = Order.objects.create(customer=customer)
+            order.products.set([product])
+
+    def test_only_selected_columns_are_loaded(self):
+        with CaptureQueriesContext(connection) as ctx:
+            result = execute("{ allCustomers { edges { node { id email } } } }")
+        self.assertIsNone(result.errors)
+        select = ctx.captured_queries[-1]["sql"]
+        self.assertIn('"email"', select)
+        self.assertNotIn('"phone"', select)
+        self.assertNotIn('"created_at"', select)
+
+    def test_foreign_key_is_joined(self):
+        with CaptureQueriesContext(connection) as ctx:
+            result = execute("""
+            { allOrders { edges { node { totalAmount customer { email } } } } }
+            """)
+        self.assertIsNone(result.errors)
+        self.assertEqual(len(ctx.captured_queries), 2)  # COUNT + joined page
+        self.assertIn("JOIN", ctx.captured_queries[-1]["sql"])
+        self.assertEqual(
+            result.data["allOrders"]["edges"][0]["node"]["customer"]["email"], "c0@example.com"
+        )
+
+    def test_nested_relations_are_prefetched(self):
+        query = """
+        fragment productFields on ProductType { name }
+        {
+          allCustomers {
+            edges { node { orders { edges { node { products { edges { node { ...productFields } } } } } } } }
+          }
+        }
+        """
+        with CaptureQueriesContext(connection) as ctx:
+            result = execute(query)
+        self.assertIsNone(result.errors)
+        self.assertEqual(len(ctx.captured_queries), 4)  # COUNT, page, orders, products
+        names = {
+            product["node"]["name"]
+            for customer in result.data["allCustomers"]["edges"]
+            for order in customer["node"]["orders"]["edges"]
+            for product in order["node"]["products"]["edges"]
+        }
+        self.assertEqual(names, {"Laptop"})
+
+
+class BulkCreateCustomersTests(TestCase):
+    MUTATION = """
+    mutation ($input: [JSONString]!, $chunkSize: Int) {
+      bulkCreateCustomers(input: $input, chunkSize: $chunkSize) {
+        customers { email }
+        errors
+      }
+    }
+    """
+
+    def run_mutation(self, entries, chunk_size=None):
+        variables = {"input": [json.dumps(entry) for entry in entries]}
+        if chunk_size is not None:
+            variables["chunkSize"] = chunk_size
+        result = execute(self.MUTATION, variables)
+        self.assertIsNone(result.errors)
+        return result.data["bulkCreateCustomers"]
+
+    def test_reports_errors_per_entry(self):
+        Customer.objects.create(name="Existing", email="taken@example.com")
+        data = self.run_mutation([
+            {"name": "A", "email": "a@example.com", "phone": "+1234567890"},
+            {"name": "B", "email": "taken@example.com"},
+            {"name": "C", "email": "a@example.com"},
+            {"name": "D", "email": "d@example.com", "phone": "nope"},
+        ], chunk_size=2)
+        self.assertEqual([c["email"] for c in data["customers"]], ["a@example.com"])
+        self.assertEqual(data["errors"], [
+            "Duplicate email: taken@example.com",
+            "Duplicate email: a@example.com",
+            "Invalid phone: nope",
+        ])
+
+    def test_one_lookup_and_one_insert_per_chunk(self):
+        entries = [{"name": f"C{i}", "email": f"c{i}@example.com"} for i in range(10)]
+        with CaptureQueriesContext(connection) as ctx:
+            data = self.run_mutation(entries, chunk_size=5)
+        self.assertEqual(len(data["customers"]), 10)
+        sql = [q["sql"] for q in ctx.captured_queries]
+        selects = [q for q in sql if q.startswith('SELECT "crm_customer"."email"')]
+        inserts = [q for q in sql if q.startswith('INSERT INTO "crm_customer"')]
+        self.assertEqual((len(selects), len(inserts)), (2, 2))
+
+
+class UpdateLowStockProductsTests(TestCase):
+    MUTATION = """
+    mutation ($threshold: Int, $increment: Int, $rules: [RestockRuleInput!], $dryRun: Boolean) {
+      updateLowStockProducts(threshold: $threshold, increment: $increment, rules: $rules, dryRun: $dryRun) {
+        updatedProducts { name stock }
+        message
+      }
+    }
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.low = Product.objects.create(name="Low", price=10, stock=2)
+        cls.mid = Product.objects.create(name="Mid", price=10, stock=12)
+        cls.high = Product.objects.create(name="High", price=10, stock=50)
+
+    def run_mutation(self, **variables):
+        result = execute(self.MUTATION, variables)
+        self.assertIsNone(result.errors)
+        return result.data["updateLowStockProducts"]
+
+    def stock(self):
+        return dict(Product.objects.values_list("name", "stock"))
+
+    def test_defaults_restock_below_ten_in_one_statement(self):
+        with CaptureQueriesContext(connection) as ctx:
+            data = self.run_mutation()
+        self.assertEqual(data["updatedProducts"], [{"name": "Low", "stock": 12}])
+        self.assertEqual(data["message"], "1 products restocked.")
+        updates = [q for q in ctx.captured_queries if q["sql"].startswith("UPDATE")]
+        self.assertEqual(len(updates), 1)
+        self.assertEqual(self.stock(), {"Low": 12, "Mid": 12, "High": 50})
+
+    def test_threshold_increment_and_rules(self):
+        rules = [{"productId": str(self.high.pk), "threshold": 100, "increment": 1}]
+        data = self.run_mutation(threshold=20, increment=5, rules=rules)
+        self.assertEqual(
+            sorted((p["name"], p["stock"]) for p in data["updatedProducts"]),
+            [("High", 51), ("Low", 7), ("Mid", 17)],
+        )
+        self.assertEqual(self.stock(), {"Low": 7, "Mid": 17, "High": 51})
+
+    def test_dry_run_does_not_write(self):
+        data = self.run_mutation(threshold=20, dryRun=True)
+        self.assertEqual(
+            sorted((p["name"], p["stock"]) for p in data["updatedProducts"]),
+            [("Low", 12), ("Mid", 22)],
+        )
+        self.assertEqual(data["message"], "2 products would be restocked.")
+        self.assertEqual(self.stock(), {"Low": 2, "Mid": 12, "High": 50})
+
+    def test_restock_across_a_relation(self):
+        customer = Customer.objects.create(name="Alice", email="alice@example.com")
+        order = Order.objects.create(customer=customer)
+        order.products.add(self.low, self.high)
+        updated = Product.objects.filter(orders__customer=customer).low_stock(20).restock(3)
+        self.assertEqual([(p.name, p.stock) for p in updated], [("Low", 5)])
+        self.assertEqual(self.stock(), {"Low": 5, "Mid": 12, "High": 50})
+
+    def test_zero_increment_or_negative_threshold_in_rules_is_rejected(self):
+        for rule in ({"increment": 0}, {"threshold": -1}):
+            rules = [{"productId": str(self.low.pk), **rule}]
+            result = execute(self.MUTATION, {"rules": rules})
+            self.assertIsNotNone(result.errors, rule)
+        self.assertEqual(self.stock(), {"Low": 2, "Mid": 12, "High": 50})
+
+
+class OrderTotalTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer = Customer.objects.create(name="Alice", email="alice@example.com")
+        cls.laptop = Product.objects.create(name="Laptop", price="999.99", stock=10)
+        cls.mouse = Product.objects.create(name="Mouse", price="25.50", stock=10)
+
+    def total(self, order):
+        return Order.objects.get(pk=order.pk).total_amount
+
+    def test_total_follows_product_changes(self):
+        order = Order.objects.create(customer=self.customer)
+        order.products.set([self.laptop, self.mouse])
+        self.assertEqual(str(order.total_amount), "1025.49")
+        self.assertEqual(str(self.total(order)), "1025.49")
+
+        order.products.remove(self.laptop)
+        self.assertEqual(str(self.total(order)), "25.50")
+        self.mouse.orders.add(order)  # already linked: no double counting
+        self.assertEqual(str(self.total(order)), "25.50")
+        self.laptop.orders.add(order)
+        self.assertEqual(str(self.total(order)), "1025.49")
+        self.laptop.orders.clear()
+        self.assertEqual(str(self.total(order)), "25.50")
+        order.products.clear()
+        self.assertEqual(str(self.total(order)), "0.00")
+
+    def test_create_order_mutation_sets_total(self):
+        result = execute("""
+        mutation ($customerId: ID!, $productIds: [ID]!) {
+          createOrder(customerId: $customerId, productIds: $productIds) { order { totalAmount } }
+        }
+        """, {"customerId": self.customer.pk, "productIds": [self.laptop.pk, self.mouse.pk]})
+        self.assertIsNone(result.errors)
+        self.assertEqual(result.data["createOrder"]["order"]["totalAmount"], "1025.49")
+
+    def test_recompute_command_after_price_change(self):
+        orders = []
+        for _ in range(3):
+            order = Order.objects.create(customer=self.customer)
+            order.products.set([self.laptop, self.mouse])
+            orders.append(order)
+        other = Order.objects.create(customer=self.customer)
+        other.products.set([self.mouse])
+
+        Product.objects.filter(pk=self.laptop.pk).update(price="899.99")
+        with CaptureQueriesContext(connection) as ctx:
+            call_command("recompute_order_totals", product=[self.laptop.pk], stdout=io.StringIO())
+        # The totals are one UPDATE; the rest refreshes the sales rollups.
+        updates = [q for q in ctx.captured_queries if q["sql"].startswith('UPDATE "crm_order"')]
+        self.assertEqual(len(updates), 1)
+        for order in orders:
+            self.assertEqual(str(self.total(order)), "925.49")
+        self.assertEqual(str(self.total(other)), "25.50")
+
+
+class KeysetPaginationTests(TestCase):
+    QUERY = """
+    query ($first: Int, $after: String, $last: Int, $before: String) {
+      allOrdersKeyset(first: $first, after: $after, last: $last, before: $before) {
+        edges { cursor node { id } }
+        pageInfo { hasNextPage hasPreviousPage startCursor endCursor }
+      }
+    }
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        customer = Customer.objects.create(name="Alice", email="alice@example.com")
+        orders = [Order.objects.create(customer=customer) for _ in range(7)]
+        # Ties on order_date must be broken by id.
+        same_day = orders[0].order_date
+        Order.objects.filter(pk__in=[o.pk for o in orders[2:5]]).update(order_date=same_day)
+        cls.expected = list(
+            Order.objects.order_by("-order_date", "-pk").values_list("pk", flat=True)
+        )
+
+    def page(self, **variables):
+        result = execute(self.QUERY, variables)
+        self.assertIsNone(result.errors)
+        return result.data["allOrdersKeyset"]
+
+    def ids(self, page):
+        return [int(from_global_id(edge["node"]["id"]).id) for edge in page["edges"]]
+
+    def test_pages_forward_without_gaps_or_count(self):
+        seen, after = [], None
+        with CaptureQueriesContext(connection) as ctx:
+            while True:
+                page = self.page(first=2, after=after)
+                seen.extend(self.ids(page))
+                if not page["pageInfo"]["hasNextPage"]:
+                    break
+                after = page["pageInfo"]["endCursor"]
+        self.assertEqual(seen, self.expected)
+        self.assertFalse(any("COUNT" in q["sql"] for q in ctx.captured_queries))
+        self.assertEqual(len(ctx.captured_queries), 4)  # one query per page
+
+    def test_pages_backward(self):
+        first_page = self.page(first=4)
+        page = self.page(last=2, before=first_page["pageInfo"]["endCursor"])
+        self.assertEqual(self.ids(page), self.expected[1:3])
+        self.assertTrue(page["pageInfo"]["hasPreviousPage"])
+
+    def test_total_count_only_when_selected(self):
+        result = execute("{ allOrdersKeyset(first: 1) { totalCount } }")
+        self.assertIsNone(result.errors)
+        self.assertEqual(result.data["allOrdersKeyset"]["totalCount"], 7)
+
+    def test_page_size_bounds(self):
+        result = execute(self.QUERY, {"first": -1})
+        self.assertEqual(result.errors[0].message, "`first` must be between 0 and 100.")
+        # Without a max limit only the lower bound is stated.
+        with mock.patch.object(CRMQuery.all_orders_keyset, "max_limit", None):
+            result = execute(self.QUERY, {"last": -1})
+        self.assertEqual(result.errors[0].message, "`last` must not be negative.")
+
+    def test_default_page_size_without_max_limit(self):
+        with mock.patch.object(CRMQuery.all_orders_keyset, "max_limit", None):
+            with mock.patch("crm.fields.DEFAULT_PAGE_SIZE", 3):
+                page = self.page()
+        self.assertEqual(self.ids(page), self.expected[:3])
+        self.assertTrue(page["pageInfo"]["hasNextPage"])
+
+    def test_invalid_cursor(self):
+        result = execute(self.QUERY, {"first": 1, "after": "bogus"})
+        self.assertIn("Invalid cursor", str(result.errors[0]))
+
+
+class IndexPlanTests(TestCase):
+    def test_explain_filters_uses_indexes_for_range_filters(self):
+        out = io.StringIO()
+        call_command("explain_filters", stdout=out)
+        lines = out.getvalue().splitlines()
+        for label in ("OrderFilter.order_date__gte", "ProductFilter.stock__lte",
+                      "CustomerFilter.phone_pattern", "OrderFilter order_by('-order_date', '-id')"):
+            self.assertIn(f"ok         {label}", lines)
+
+    def test_phone_pattern_is_a_prefix_match(self):
+        Customer.objects.create(name="A", email="a@example.com", phone="+1555000")
+        Customer.objects.create(name="B", email="b@example.com", phone="+2555000")
+        result = execute('{ allCustomers(phonePattern: "+1") { edges { node { email } } } }')
+        self.assertIsNone(result.errors)
+        self.assertEqual(
+            [e["node"]["email"] for e in result.data["allCustomers"]["edges"]], ["a@example.com"]
+        )
+
+
+class SearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice = Customer.objects.create(name="Alice Johnson", email="alice@example.com")
+        cls.bob = Customer.objects.create(name="Bob Alison", email="bob@example.com")
+        laptop = Product.objects.create(name="Gaming Laptop", price=999, stock=3)
+        mouse = Product.objects.create(name="Wireless Mouse", price=20, stock=3)
+        cls.order = Order.objects.create(customer=cls.alice)
+        cls.order.products.set([laptop, mouse])
+
+    def search(self, field, text):
+        result = execute(
+            f'query ($q: String) {{ {field}(search: $q) {{ edges {{ node {{ id }} }} }} }}',
+            {"q": text},
+        )
+        self.assertIsNone(result.errors)
+        return [int(from_global_id(e["node"]["id"]).id) for e in result.data[field]["edges"]]
+
+    def test_ranked_customer_search(self):
+        # "alice" is in both of Alice's columns but only a prefix of Bob's surname.
+        self.assertEqual(self.search("allCustomers", "ali"), [self.alice.pk, self.bob.pk])
+        self.assertEqual(self.search("allCustomers", "johnson"), [self.alice.pk])
+
+    def test_order_documents_follow_related_changes(self):
+        self.assertEqual(self.search("allOrders", "laptop"), [self.order.pk])
+        self.assertEqual(self.search("allOrders", "alice"), [self.order.pk])
+
+        self.alice.name = "Alicia Keys"
+        self.alice.save()
+        self.assertEqual(self.search("allOrders", "keys"), [self.order.pk])
+
+        Product.objects.get(name="Gaming Laptop").delete()
+        self.assertEqual(self.search("allOrders", "laptop"), [])
+        self.order.products.clear()
+        self.assertEqual(self.search("allOrders", "mouse"), [])
+
+    def test_rank_follows_the_queryset_alias(self):
+        # As a correlated subquery the customer table is aliased (U0).
+        customers = get_search_backend().search(Customer.objects.filter(pk=OuterRef("customer_id")), "alice")
+        order = Order.objects.annotate(rank=Subquery(customers.values("search_rank")[:1])).get()
+        self.assertIsNotNone(order.rank)
+
+    def test_bulk_created_customers_are_searchable(self):
+        execute(BulkCreateCustomersTests.MUTATION, {
+            "input": [json.dumps({"name": "Carol Danvers", "email": "carol@example.com"})],
+        })
+        self.assertEqual(len(self.search("allCustomers", "danvers")), 1)
+
+    def test_icontains_filters_still_work(self):
+        result = execute('{ allCustomers(name: "lison") { edges { node { email } } } }')
+        self.assertEqual(
+            [e["node"]["email"] for e in result.data["allCustomers"]["edges"]], ["bob@example.com"]
+        )
+
+
+class DocumentCacheTests(TestCase):
+    QUERY = "{ allProducts { edges { node { name } } } }"
+
+    def setUp(self):
+        document_cache.clear()
+        cache.clear()
+
+    def post(self, payload):
+        response = self.client.post("/graphql", payload, content_type="application/json")
+        return response.json()
+
+    def test_documents_are_parsed_once(self):
+        for _ in range(3):
+            self.assertIn("data", self.post({"query": self.QUERY}))
+        stats = document_cache.stats()
+        self.assertEqual((stats["misses"], stats["hits"]), (1, 2))
+
+    def test_lru_eviction(self):
+        small = DocumentCache(maxsize=2)
+        schema_ = schema.graphql_schema
+        for query in ("{ hello }", "{ __typename }", "{ hello }", "{ allProducts { edges { cursor } } }"):
+            small.get(schema_, query)
+        self.assertEqual(small.stats()["evictions"], 1)
+        small.get(schema_, "{ hello }")  # most recently used survived
+        self.assertEqual(small.stats()["hits"], 2)
+
+    def test_invalid_documents_are_cached_as_errors(self):
+        body = self.post({"query": "{ nope }"})
+        self.assertIn("Cannot query field 'nope'", body["errors"][0]["message"])
+        self.post({"query": "{ nope }"})
+        self.assertEqual(document_cache.stats()["hits"], 1)
+
+    def test_automatic_persisted_queries(self):
+        extensions = {"persistedQuery": {"version": 1, "sha256Hash": query_hash(self.QUERY)}}
+        body = self.post({"extensions": extensions})
+        self.assertEqual(body["errors"][0]["extensions"]["code"], "PERSISTED_QUERY_NOT_FOUND")
+
+        self.assertIn("data", self.post({"query": self.QUERY, "extensions": extensions}))
+        body = self.post({"extensions": extensions})
+        self.assertEqual(body["data"], {"allProducts": {"edges": []}})
+
+        response = self.client.get("/graphql", {"extensions": json.dumps(extensions)},
+                                   HTTP_ACCEPT="application/json")
+        self.assertEqual(response.json()["data"], {"allProducts": {"edges": []}})
+
+    def test_persisted_query_hash_mismatch(self):
+        extensions = {"persistedQuery": {"version": 1, "sha256Hash": "0" * 64}}
+        body = self.post({"query": self.QUERY, "extensions": extensions})
+        self.assertEqual(body["errors"][0]["extensions"]["code"], "INVALID_SHA256_HASH")
+
+
+@override_settings(CRM_RESPONSE_CACHE={"ENABLED": True, "MAX_AGE": {"allProducts": 300, "allCustomers": 60}})
+class ResponseCacheTests(TestCase):
+    PRODUCTS = "{ allProducts { edges { node { name stock } } } }"
+
+    def setUp(self):
+        cache.clear()
+        self.product = Product.objects.create(name="Laptop", price=999, stock=3)
+
+    def post(self, query):
+        return self.client.post("/graphql", {"query": query}, content_type="application/json")
+
+    def test_hit_after_miss(self):
+        first = self.post(self.PRODUCTS)
+        self.assertEqual(first["X-CRM-Cache"], "MISS")
+        self.assertEqual(first["Cache-Control"], "private, max-age=300")
+        with CaptureQueriesContext(connection) as ctx:
+            second = self.post(self.PRODUCTS)
+        self.assertEqual(second["X-CRM-Cache"], "HIT")
+        self.assertEqual(len(ctx.captured_queries), 0)
+        self.assertEqual(first.json(), second.json())
+        self.assertEqual(
+            second.json()["extensions"]["cacheControl"]["hints"],
+            [{"path": ["allProducts"], "maxAge": 300}],
+        )
+
+    def test_max_age_is_smallest_root_hint(self):
+        response = self.post("{ allProducts { edges { cursor } } allCustomers { edges { cursor } } }")
+        self.assertEqual(response["Cache-Control"], "private, max-age=60")
+
+    def test_writes_invalidate_by_model(self):
+        self.post(self.PRODUCTS)
+        Customer.objects.create(name="Alice", email="alice@example.com")
+        self.assertEqual(self.post(self.PRODUCTS)["X-CRM-Cache"], "HIT")
+
+        Product.objects.low_stock(10).restock(5)
+        response = self.post(self.PRODUCTS)
+        self.assertEqual(response["X-CRM-Cache"], "MISS")
+        self.assertEqual(response.json()["data"]["allProducts"]["edges"][0]["node"]["stock"], 8)
+
+    def test_bulk_created_customers_invalidate(self):
+        customers = "{ allCustomers { edges { node { email } } } }"
+        self.post(customers)
+        self.assertEqual(self.post(customers)["X-CRM-Cache"], "HIT")
+        execute(BulkCreateCustomersTests.MUTATION, {
+            "input": [json.dumps({"name": "Carol", "email": "carol@example.com"})],
+        })
+        response = self.post(customers)
+        self.assertEqual(response["X-CRM-Cache"], "MISS")
+        emails = [e["node"]["email"] for e in response.json()["data"]["allCustomers"]["edges"]]
+        self.assertEqual(emails, ["carol@example.com"])
+
+    def test_mutations_and_unhinted_fields_are_not_cached(self):
+        response = self.post("{ allOrders { edges { cursor } } }")
+        self.assertFalse(response.has_header("X-CRM-Cache"))
+        response = self.post('mutation { updateLowStockProducts { message } }')
+        self.assertFalse(response.has_header("X-CRM-Cache"))
+
+
+class QueryCostTests(TestCase):
+    def setUp(self):
+        document_cache.clear()
+        cost_cache.clear()
+
+    def post(self, query, **kwargs):
+        return self.client.post("/graphql", {"query": query, **kwargs}, content_type="application/json")
+
+    def cost(self, query):
+        return operation_cost(schema.graphql_schema, parse(query)).cost
+
+    def test_cost_follows_page_sizes_and_fan_out(self):
+        self.assertEqual(self.cost("{ allProducts(first: 5) { edges { node { name } } } }"), 5)
+        # 10 orders, their customers, and 10 x 10 (FAN_OUT) customer orders.
+        query = "{ allOrders(first: 10) { edges { node { customer { orders { edges { node { id } } } } } } } }"
+        self.assertEqual(self.cost(query), 10 + 10 + 100)
+        query = "query ($n: Int = 3) { allProducts(first: $n) { ...P } } fragment P on ProductTypeConnection { edges { node { id } } }"
+        self.assertEqual(self.cost(query), 3)
+
+    def test_cost_is_reported_in_extensions(self):
+        body = self.post("{ allProducts(first: 5) { edges { node { name } } } }").json()
+        self.assertEqual(body["extensions"]["cost"]["requested"], 5)
+        self.assertEqual(body["extensions"]["cost"]["depth"], 4)
+
+    def test_expensive_documents_are_rejected_before_execution(self):
+        query = """
+        { allCustomers { edges { node { orders { edges { node {
+            products { edges { node { orders { edges { node { id } } } } } }
+        } } } } } } }
+        """
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.post(query)
+        self.assertEqual(len(ctx.captured_queries), 0)
+        self.assertEqual(response.status_code, 400)
+        error = response.json()["errors"][0]
+        self.assertEqual(error["extensions"]["code"], "QUERY_TOO_COSTLY")
+        self.assertGreater(error["extensions"]["cost"]["requested"], 50000)
+
+    def test_variable_page_sizes_are_costed_with_their_values(self):
+        query = """
+        query ($n: Int = 1) { allCustomers(first: $n) { edges { node { orders(first: $n) { edges { node {
+            products(first: $n) { edges { node { name } } }
+        } } } } } } }
+        """
+        # The default passes validation; the request's value must not.
+        self.assertEqual(self.post(query).status_code, 200)
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.post(query, variables={"n": 100})
+        self.assertEqual(len(ctx.captured_queries), 0)
+        self.assertEqual(response.status_code, 400)
+        error = response.json()["errors"][0]
+        self.assertEqual(error["extensions"]["code"], "QUERY_TOO_COSTLY")
+        self.assertEqual(error["extensions"]["cost"]["requested"], 100 + 100 * 100 + 100 * 100 * 100)
+
+    def test_unbounded_connections_use_the_default_page_size(self):
+        with mock.patch.object(graphene_settings, "RELAY_CONNECTION_MAX_LIMIT", None):
+            self.assertEqual(self.cost("{ allProducts { edges { node { name } } } }"), 100)
+            self.assertEqual(self.cost("{ allProducts(first: 500) { edges { node { name } } } }"), 500)
+
+    @override_settings(CRM_QUERY_COST={"MAX_DEPTH": 3})
+    def test_depth_limit(self):
+        response = self.post("{ allProducts { edges { node { name } } } }")
+        self.assertEqual(response.json()["errors"][0]["extensions"]["code"], "QUERY_TOO_DEEP")
+
+
+@override_settings(DEBUG=True)
+class TracingTests(TestCase):
+    QUERY = "query Products { allProducts { edges { node { name orders { edges { node { id } } } } } } }"
+
+    def setUp(self):
+        metrics.reset()
+        Product.objects.create(name="Laptop", price=999, stock=3)
+
+    def post(self, path="/graphql", **headers):
+        return self.client.post(path, {"query": self.QUERY}, content_type="application/json", **headers)
+
+    def test_tracing_extension_only_with_header(self):
+        self.assertNotIn("tracing", self.post().json()["extensions"])
+        tracing = self.post(HTTP_X_CRM_TRACE="1").json()["extensions"]["tracing"]
+        self.assertEqual(tracing["version"], 1)
+        resolvers = {tuple(entry["path"]): entry for entry in tracing["execution"]["resolvers"]}
+        root = resolvers[("allProducts",)]
+        self.assertEqual(root["sql"]["count"], tracing["sql"]["count"])
+        self.assertGreater(root["duration"], 0)
+        self.assertIn(("allProducts", "edges", 0, "node", "name"), resolvers)
+
+    @override_settings(DEBUG=False)
+    def test_tracing_needs_debug_or_staff(self):
+        self.assertNotIn("tracing", self.post(HTTP_X_CRM_TRACE="1").json()["extensions"])
+
+    def test_metrics_endpoint(self):
+        self.post()
+        self.post()
+        body = self.client.get("/metrics").content.decode()
+        self.assertIn('crm_graphql_operation_duration_seconds_count{operation="Products"} 2', body)
+        self.assertIn('crm_graphql_sql_queries_total{operation="Products"}', body)
+        self.assertIn('crm_graphql_document_cache_total{result="hit"}', body)
+
+    @override_settings(DEBUG=False)
+    def test_metrics_need_staff_or_token(self):
+        self.assertEqual(self.client.get("/metrics").status_code, 403)
+        with override_settings(CRM_TRACING={"METRICS_TOKEN": "s3cret"}):
+            self.assertEqual(self.client.get("/metrics", HTTP_AUTHORIZATION="Bearer nope").status_code, 403)
+            self.assertEqual(self.client.get("/metrics", HTTP_AUTHORIZATION="Bearer s3cret").status_code, 200)
+        self.client.force_login(User.objects.create_user("ops", is_staff=True))
+        self.assertEqual(self.client.get("/metrics").status_code, 200)
+
+
+class ExportOrdersTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice = Customer.objects.create(name="Alice", email="alice@example.com")
+        cls.old = Order.objects.create(customer=cls.alice)
+        Order.objects.filter(pk=cls.old.pk).update(order_date="2024-01-01T00:00:00Z")
+        cls.recent = [Order.objects.create(customer=cls.alice) for _ in range(3)]
+
+    def export(self, *args):
+        out = io.StringIO()
+        call_command("export_orders", *args, stdout=out)
+        return out.getvalue()
+
+    def test_ndjson_since(self):
+        lines = self.export("--since", "2024-06-01", "--chunk-size", "2").splitlines()
+        rows = [json.loads(line) for line in lines]
+        self.assertEqual([row["id"] for row in rows], [order.pk for order in self.recent])
+        self.assertEqual(rows[0]["customer_email"], "alice@example.com")
+
+    def test_csv(self):
+        lines = self.export("--format", "csv", "--until", "2024-06-01").splitlines()
+        self.assertEqual(lines[0], "id,order_date,total_amount,customer_id,customer_name,customer_email")
+        self.assertEqual(lines[1].split(",")[0], str(self.old.pk))
+        self.assertEqual(len(lines), 2)
+
+    def test_view_needs_permission(self):
+        self.assertEqual(self.client.get("/exports/orders.ndjson").status_code, 403)
+        user = User.objects.create_user("clerk", is_staff=True)
+        self.client.force_login(user)
+        self.assertEqual(self.client.get("/exports/orders.ndjson").status_code, 403)
+        user.user_permissions.add(Permission.objects.get(codename="view_order"))
+        self.assertEqual(self.client.get("/exports/orders.ndjson").status_code, 200)
+
+    def test_streaming_view(self):
+        self.client.force_login(User.objects.create_superuser("admin"))
+        response = self.client.get("/exports/orders.ndjson", {"since": "2024-06-01"})
+        self.assertTrue(response.streaming)
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+        body = b"".join(response.streaming_content).decode()
+        self.assertEqual(len(body.splitlines()), 3)
+        self.assertEqual(self.client.get("/exports/orders.ndjson", {"since": "soon"}).status_code, 400)
+        self.assertEqual(self.client.get("/exports/orders.xml").status_code, 404)
+
+
+class SendOrderRemindersTests(TestCase):
+    def setUp(self):
+        self.alice = Customer.objects.create(name="Alice", email="alice@example.com")
+        self.bob = Customer.objects.create(name="Bob", email="bob@example.com")
+        old = Order.objects.create(customer=self.bob)
+        Order.objects.filter(pk=old.pk).update(order_date="2024-01-01T00:00:00Z")
+        self.orders = [Order.objects.create(customer=c) for c in (self.alice, self.bob, self.alice)]
+        log = tempfile.NamedTemporaryFile("r", suffix=".log", delete=False)
+        log.close()
+        self.log_file = log.name
+        self.addCleanup(os.unlink, self.log_file)
+
+    def remind(self):
+        with CaptureQueriesContext(connection) as ctx:
+            call_command("send_order_reminders", log_file=self.log_file, stdout=io.StringIO())
+        with open(self.log_file, encoding="utf-8") as f:
+            return f.read().splitlines(), ctx.captured_queries
+
+    def test_groups_per_customer_with_one_select(self):
+        lines, queries = self.remind()
+        self.assertEqual(len(lines), 2)
+        first, _, third = self.orders
+        self.assertTrue(lines[0].endswith(f"alice@example.com | Orders: {first.pk}, {third.pk}"))
+        selects = [q for q in queries if "crm_order" in q["sql"] and q["sql"].startswith("SELECT")]
+        self.assertEqual(len(selects), 1)
+
+    def test_high_water_mark_skips_reminded_orders(self):
+        self.remind()
+        lines, _ = self.remind()
+        self.assertEqual(len(lines), 2)  # nothing new
+        new = Order.objects.create(customer=self.bob)
+        lines, _ = self.remind()
+        self.assertTrue(lines[-1].endswith(f"bob@example.com | Orders: {new.pk}"))
+
+
+class CleanupInactiveCustomersTests(TestCase):
+    def setUp(self):
+        long_ago = "2020-01-01T00:00:00Z"
+        self.product = Product.objects.create(name="Laptop", price=999, stock=3)
+        self.inactive = []
+        for i in range(3):
+            customer = Customer.objects.create(name=f"Old {i}", email=f"old{i}@example.com")
+            order = Order.objects.create(customer=customer)
+            order.products.add(self.product)
+            Order.objects.filter(pk=order.pk).update(order_date=long_ago)
+            self.inactive.append(customer)
+        self.active = Customer.objects.create(name="Active", email="active@example.com")
+        Order.objects.create(customer=self.active).products.add(self.product)
+        self.newcomer = Customer.objects.create(name="New", email="new@example.com")
+        Customer.objects.filter(pk__in=[c.pk for c in self.inactive] + [self.active.pk]).update(created_at=long_ago)
+
+    def cleanup(self, *args):
+        out = io.StringIO()
+        call_command("cleanup_inactive_customers", *args, stdout=out)
+        return out.getvalue()
+
+    def test_dry_run_only_counts(self):
+        self.assertIn("3 inactive customers would be deleted.", self.cleanup("--dry-run"))
+        self.assertEqual(Customer.objects.count(), 5)
+
+    def test_chunked_delete_cascades(self):
+        output = self.cleanup("--chunk-size", "2")
+        self.assertIn("Deleted 2 customers and 2 orders so far...", output)
+        self.assertIn("Deleted 3 inactive customers and 3 orders.", output)
+        self.assertEqual(set(Customer.objects.all()), {self.active, self.newcomer})
+        self.assertEqual(Order.objects.count(), 1)
+        self.assertEqual(Order.products.through.objects.count(), 1)
+        self.assertEqual(list(self.product.orders.values_list("customer", flat=True)), [self.active.pk])
+        if connection.vendor == "sqlite":
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT COUNT(*) FROM crm_customer_fts")
+                self.assertEqual(cursor.fetchone()[0], 2)
+                cursor.execute("SELECT COUNT(*) FROM crm_order_fts")
+                self.assertEqual(cursor.fetchone()[0], 1)
+
+
+@override_settings(CRM_JOBS={
+    "ok": {"callable": "crm.tests.job_ok", "interval": 300},
+    "broken": {"callable": "crm.tests.job_broken", "interval": 300},
+})
+class JobRunnerTests(TestCase):
+    def test_runs_once_per_interval_and_records_outcome(self):
+        run = run_job("ok")
+        self.assertEqual(run.status, JobRun.SUCCESS)
+        self.assertIsNotNone(run.duration_ms)
+        self.assertIsNone(run_job("ok"))  # not due again yet
+        self.assertEqual(run_job("ok", force=True).status, JobRun.SUCCESS)
+        self.assertEqual(JobRun.objects.filter(name="ok").count(), 2)
+
+    def test_failures_are_recorded(self):
+        with self.assertLogs("crm.jobs", "ERROR"):
+            run = run_job("broken")
+        self.assertEqual(run.status, JobRun.FAILED)
+        self.assertIn("RuntimeError: boom", run.error)
+
+    def test_running_row_is_a_lock(self):
+        JobRun.objects.create(name="ok")
+        self.assertIsNone(run_job("ok", force=True))
+        stale = timezone.now() - datetime.timedelta(hours=2)
+        JobRun.objects.filter(name="ok").update(started_at=stale)
+        self.assertEqual(run_job("ok", force=True).status, JobRun.SUCCESS)
+        self.assertEqual(JobRun.objects.get(started_at=stale).status, JobRun.ABANDONED)
+
+    def test_due_is_rechecked_under_the_lock(self):
+        # Another scheduler finishes a run between this one's due check and
+        # its lock.
+        real_is_due = jobs.is_due
+
+        def racing_is_due(name, job, now=None, exclude=None):
+            if exclude is None:
+                JobRun.objects.create(name=name, status=JobRun.SUCCESS)
+                return True
+            return real_is_due(name, job, now, exclude)
+
+        with mock.patch("crm.jobs.is_due", racing_is_due):
+            self.assertIsNone(run_job("ok"))
+        self.assertEqual(list(JobRun.objects.values_list("status", flat=True)), [JobRun.SUCCESS])
+
+    def test_run_jobs_command(self):
+        out = io.StringIO()
+        call_command("run_jobs", "--once", "--job", "ok", stdout=out)
+        self.assertIn("ok: success", out.getvalue())
+
+
+def job_ok():
+    pass
+
+
+def job_broken():
+    raise RuntimeError("boom")
+
+
+class GraphQLClientTests(TestCase):
+    def test_executes_strings_and_documents_through_the_cache(self):
+        Product.objects.create(name="Cable", price=3, stock=1)
+        client = GraphQLClient()
+        mutation = "mutation ($t: Int) { updateLowStockProducts(threshold: $t) { message } }"
+        document_cache.clear()
+        data = client.execute(mutation, {"t": 5})
+        self.assertEqual(data["updateLowStockProducts"]["message"], "1 products restocked.")
+        client.execute(parse(mutation), {"t": 5})
+        self.assertEqual(document_cache.stats()["hits"], 1)
+
+    def test_errors_raise(self):
+        with self.assertRaises(GraphQLClientError) as ctx:
+            GraphQLClient().execute("{ nope }")
+        self.assertIn("nope", str(ctx.exception))
+        with self.assertRaises(GraphQLClientError) as ctx:
+            GraphQLClient().execute('mutation { createProduct(name: "x", price: -1) { product { id } } }')
+        self.assertEqual(ctx.exception.data, {"createProduct": None})
+
+
+class BatchedRequestTests(TestCase):
+    QUERY = """
+    query ($email: String) {
+      allCustomers(email: $email) { edges { node { email orders { edges { node { id } } } } } }
+    }
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        for i in range(5):
+            Order.objects.create(customer=Customer.objects.create(name=f"Customer {i}", email=f"c{i}@example.com"))
+
+    def post_batch(self, entries):
+        return self.client.post("/graphql", entries, content_type="application/json")
+
+    def test_entries_run_in_order(self):
+        single = self.client.post("/graphql", {"query": self.QUERY}, content_type="application/json")
+        response = self.post_batch([{"id": i, "query": self.QUERY} for i in range(3)])
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn("X-CRM-Cache", response)
+        results = response.json()
+        self.assertEqual([(r["id"], r["status"]) for r in results], [(0, 200), (1, 200), (2, 200)])
+        self.assertTrue(all(r["data"] == single.json()["data"] for r in results))
+
+    def test_entries_share_loaders_but_not_operation_state(self):
+        view, loaders = CRMGraphQLView(), Loaders()
+        request = RequestFactory().post("/graphql")
+        first, second = (view.get_entry_request(request, loaders) for _ in range(2))
+        self.assertIs(get_loaders(first), get_loaders(second))
+        first.crm_query_cost = 1
+        self.assertFalse(hasattr(second, "crm_query_cost"))
+
+    def test_mutation_resets_loaders(self):
+        customer = Customer.objects.get(email="c0@example.com")
+        product = Product.objects.create(name="Cable", price=3, stock=1)
+        mutation = 'mutation { createOrder(customerId: "%s", productIds: ["%s"]) { order { id } } }'
+        before, created, after = self.post_batch([
+            {"query": self.QUERY, "variables": {"email": "c0@"}},
+            {"query": mutation % (customer.pk, product.pk)},
+            {"query": self.QUERY, "variables": {"email": "c0@"}},
+        ]).json()
+        self.assertNotIn("errors", created)
+        counts = [len(r["data"]["allCustomers"]["edges"][0]["node"]["orders"]["edges"]) for r in (before, after)]
+        self.assertEqual(counts, [1, 2])
+
+    def test_entry_errors_are_reported_per_entry(self):
+        response = self.post_batch([{"query": self.QUERY}, {"id": "x"}, "nope"])
+        self.assertEqual(response.status_code, 400)
+        ok, missing, invalid = response.json()
+        self.assertEqual(ok["status"], 200)
+        self.assertEqual((missing["id"], missing["status"]), ("x", 400))
+        self.assertEqual(missing["errors"][0]["message"], "Must provide query string.")
+        self.assertEqual(invalid["status"], 400)
+
+    @override_settings(CRM_GRAPHQL_BATCH={"MAX_SIZE": 2})
+    def test_max_size(self):
+        response = self.post_batch([{"query": self.QUERY}] * 3)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("maximum of 2", response.json()["errors"][0]["message"])
+
+    def test_cost_budget_spans_the_batch(self):
+        cost = self.client.post(
+            "/graphql", {"query": self.QUERY}, content_type="application/json"
+        ).json()["extensions"]["cost"]["requested"]
+        with override_settings(CRM_GRAPHQL_BATCH={"MAX_COST": cost * 2}):
+            with CaptureQueriesContext(connection) as ctx:
+                response = self.post_batch([{"query": self.QUERY}] * 2)
+            ran = len(ctx.captured_queries)
+            with CaptureQueriesContext(connection) as ctx:
+                response = self.post_batch([{"query": self.QUERY}] * 4)
+        self.assertEqual(len(ctx.captured_queries), ran)
+        self.assertEqual(response.status_code, 400)
+        statuses = [r["status"] for r in response.json()]
+        self.assertEqual(statuses, [200, 200, 400, 400])
+        error = response.json()[2]["errors"][0]
+        self.assertEqual(error["extensions"]["code"], "BATCH_TOO_COSTLY")
+
+    @override_settings(CRM_GRAPHQL_BATCH={"ENABLED": False})
+    def test_disabled(self):
+        self.assertEqual(self.post_batch([{"query": self.QUERY}]).status_code, 400)
+
+
+@override_settings(CRM_GRAPHQL_BATCH={"PARALLEL_READS": True, "PARALLEL_WORKERS": 2})
+class ParallelBatchReadTests(TransactionTestCase):
+    QUERY = BatchedRequestTests.QUERY
+
+    def setUp(self):
+        customer = Customer.objects.create(name="Customer 0", email="c0@example.com")
+        Order.objects.create(customer=customer)
+
+    def test_queries_run_in_worker_threads(self):
+        customer = Customer.objects.get()
+        product = Product.objects.create(name="Cable", price=3, stock=1)
+        mutation = 'mutation { createOrder(customerId: "%s", productIds: ["%s"]) { order { id } } }'
+        threads = []
+        get_entry_response = CRMGraphQLView.get_entry_response
+
+        def record(view, request, entry):
+            threads.append(threading.get_ident())
+            return get_entry_response(view, request, entry)
+
+        with mock.patch.object(CRMGraphQLView, "get_entry_response", record):
+            response = self.client.post("/graphql", [
+                {"id": 1, "query": self.QUERY},
+                {"id": 2, "query": self.QUERY},
+                {"id": 3, "query": mutation % (customer.pk, product.pk)},
+                {"id": 4, "query": self.QUERY},
+            ], content_type="application/json")
+        results = response.json()
+        self.assertEqual([r["id"] for r in results], [1, 2, 3, 4])
+        self.assertNotIn("errors", results[2])
+        counts = [len(r["data"]["allCustomers"]["edges"][0]["node"]["orders"]["edges"]) for r in results if r["id"] != 3]
+        # Reads after the mutation see its order.
+        self.assertEqual(counts, [1, 1, 2])
+        self.assertNotIn(threading.get_ident(), [threads[0], threads[1], threads[3]])
+        self.assertEqual(threads[2], threading.get_ident())
+
+
+class PlaceOrderTests(TestCase):
+    MUTATION = """
+    mutation ($customerId: ID!, $productIds: [ID]!) {
+      createOrder(customerId: $customerId, productIds: $productIds) { order { totalAmount } }
+    }
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer = Customer.objects.create(name="Alice", email="alice@example.com")
+        cls.cable = Product.objects.create(name="Cable", price="3.50", stock=2)
+        cls.lamp = Product.objects.create(name="Lamp", price="20.00", stock=0)
+
+    def test_reserves_stock(self):
+        result = execute(self.MUTATION, {"customerId": self.customer.pk, "productIds": [self.cable.pk]})
+        self.assertIsNone(result.errors)
+        self.assertEqual(result.data["createOrder"]["order"]["totalAmount"], "3.50")
+        self.cable.refresh_from_db()
+        self.assertEqual(self.cable.stock, 1)
+
+    def test_out_of_stock_rolls_back(self):
+        result = execute(self.MUTATION, {"customerId": self.customer.pk, "productIds": [self.cable.pk, self.lamp.pk]})
+        self.assertEqual(str(result.errors[0].message), "Out of stock: Lamp.")
+        self.cable.refresh_from_db()
+        self.assertEqual(self.cable.stock, 2)
+        self.assertFalse(Order.objects.exists())
+
+    def test_products_deleted_meanwhile_are_named(self):
+        gone = Product.objects.create(name="Gone", price="1.00", stock=5)
+        gone_pk = gone.pk
+        gone.delete()
+        message = unavailable_message([self.cable.pk, self.lamp.pk, gone_pk])
+        self.assertEqual(message, f"Out of stock: Lamp. Products no longer exist: {gone_pk}.")
+        self.assertEqual(unavailable_message([self.cable.pk]), "Out of stock; please try again.")
+
+
+class PlaceOrderConcurrencyTests(TransactionTestCase):
+    def test_concurrent_orders_never_oversell(self):
+        customer = Customer.objects.create(name="Alice", email="alice@example.com")
+        product = Product.objects.create(name="Cable", price="3.50", stock=5)
+        outcomes = []
+
+        def buy():
+            try:
+                place_order(customer.pk, [product.pk])
+                outcomes.append("ok")
+            except Exception as e:
+                outcomes.append(str(e))
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=buy) for _ in range(12)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        product.refresh_from_db()
+        self.assertEqual(outcomes.count("ok"), 5, outcomes)
+        self.assertEqual(product.stock, 0)
+        self.assertEqual(Order.objects.count(), 5)
+        self.assertEqual(Order.products.through.objects.count(), 5)
+
+
+class AnalyticsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice = Customer.objects.create(name="Alice", email="alice@example.com")
+        cls.bob = Customer.objects.create(name="Bob", email="bob@example.com")
+        cls.cable = Product.objects.create(name="Cable", price="3.50", stock=100)
+        cls.lamp = Product.objects.create(name="Lamp", price="20.00", stock=100)
+
+    def snapshot(self):
+        return (
+            list(DailySales.objects.order_by("day").values_list("day", "order_count", "revenue")),
+            list(ProductDailySales.objects.order_by("day", "product_id").values_list("day", "product_id", "units", "revenue")),
+            list(CustomerSales.objects.order_by("pk").values_list("pk", "order_count", "revenue", "last_order_at")),
+        )
+
+    def assertMatchesRebuild(self):
+        incremental = self.snapshot()
+        analytics.rebuild()
+        self.assertEqual(incremental, self.snapshot())
+        return incremental
+
+    def test_rollups_follow_order_changes(self):
+        place_order(self.alice.pk, [self.cable.pk, self.lamp.pk])
+        order = Order.objects.create(customer=self.bob)
+        order.products.set([self.cable])
+        self.lamp.orders.add(order)
+        days, products, customers = self.assertMatchesRebuild()
+        self.assertEqual([row[1:] for row in days], [(2, Decimal("47.00"))])
+        self.assertEqual([row[2:] for row in products], [(2, Decimal("7.00")), (2, Decimal("40.00"))])
+
+        order.products.remove(self.cable)
+        self.cable.orders.clear()
+        self.assertMatchesRebuild()
+        order.delete()
+        days, products, customers = self.assertMatchesRebuild()
+        self.assertEqual([row[:3] for row in customers], [(self.alice.pk, 1, Decimal("20.00"))])
+
+    def test_rollups_follow_order_edits(self):
+        order = place_order(self.alice.pk, [self.cable.pk, self.lamp.pk])
+        order.total_amount = Decimal("30.00")
+        order.save()
+        days, products, customers = self.assertMatchesRebuild()
+        self.assertEqual([row[1:] for row in days], [(1, Decimal("30.00"))])
+
+        order.customer = self.bob
+        order.save()
+        self.assertMatchesRebuild()
+        order.order_date -= datetime.timedelta(days=3)
+        order.save()
+        days, products, customers = self.assertMatchesRebuild()
+        self.assertEqual(len(days), 1)
+        self.assertEqual([row[:3] for row in customers], [(self.bob.pk, 1, Decimal("30.00"))])
+
+    def test_rollups_follow_price_changes(self):
+        place_order(self.alice.pk, [self.cable.pk, self.lamp.pk])
+        self.cable.price = "4.00"
+        with self.captureOnCommitCallbacks(execute=True):
+            self.cable.save()
+        self.assertEqual(
+            ProductDailySales.objects.get(product=self.cable).revenue, Decimal("4.00")
+        )
+        # Order revenue keeps the old price until the totals are recomputed.
+        self.assertEqual(DailySales.objects.get().revenue, Decimal("23.50"))
+        call_command("recompute_order_totals", product=[self.cable.pk], stdout=io.StringIO())
+        days, products, customers = self.assertMatchesRebuild()
+        self.assertEqual([row[1:] for row in days], [(1, Decimal("24.00"))])
+
+    def test_cleanup_keeps_rollups_consistent(self):
+        place_order(self.alice.pk, [self.cable.pk])
+        place_order(self.bob.pk, [self.lamp.pk])
+        delete_customers([self.bob.pk])
+        days, products, customers = self.assertMatchesRebuild()
+        self.assertEqual([row[0] for row in customers], [self.alice.pk])
+
+    def test_queries(self):
+        place_order(self.alice.pk, [self.cable.pk, self.lamp.pk])
+        place_order(self.alice.pk, [self.lamp.pk])
+        place_order(self.bob.pk, [self.cable.pk])
+        yesterday = timezone.localdate() - datetime.timedelta(days=1)
+        Order.objects.filter(customer=self.bob).update(order_date=timezone.now() - datetime.timedelta(days=1))
+        analytics.rebuild()
+
+        with CaptureQueriesContext(connection) as ctx:
+            result = execute("""
+            query ($since: Date, $customerId: ID!) {
+              revenueByDay(since: $since) { day orderCount revenue }
+              topProducts(first: 1) { product { name } units revenue }
+              yesterday: topProducts(until: $since) { product { name } units }
+              customerLifetimeValue(customerId: $customerId) { customer { email } orderCount revenue }
+            }
+            """, {"since": str(yesterday), "customerId": self.alice.pk})
+        self.assertIsNone(result.errors)
+        self.assertEqual(len(ctx.captured_queries), 6)
+        self.assertEqual(result.data["revenueByDay"], [
+            {"day": str(yesterday), "orderCount": 1, "revenue": "3.50"},
+            {"day": str(timezone.localdate()), "orderCount": 2, "revenue": "43.50"},
+        ])
+        self.assertEqual(result.data["topProducts"], [{"product": {"name": "Lamp"}, "units": 2, "revenue": "40.00"}])
+        self.assertEqual(result.data["yesterday"], [])
+        self.assertEqual(
+            result.data["customerLifetimeValue"],
+            {"customer": {"email": "alice@example.com"}, "orderCount": 2, "revenue": "43.50"},
+        )
+
+
+class SeedDbTests(TestCase):
+    def seed(self, **options):
+        out = io.StringIO()
+        call_command(
+            "seed_db", customers=50, products=20, orders=300, until="2025-01-01", chunk_size=64,
+            flush=True, stdout=out, **options,
+        )
+        return out.getvalue()
+
+    def snapshot(self):
+        return (
+            list(Product.objects.order_by("pk").values_list("name", "price", "stock")),
+            list(Order.objects.order_by("pk").values_list("customer__email", "order_date", "total_amount")),
+            list(Order.products.through.objects.order_by("order_id", "product_id")
+                 .values_list("order__order_date", "product__name")),
+        )
+
+    def test_deterministic_from_seed(self):
+        self.assertIn("Seeded 50 customers, 20 products, 300 orders", self.seed())
+        first = self.snapshot()
+        self.seed()
+        self.assertEqual(self.snapshot(), first)
+        self.seed(seed=1)
+        self.assertNotEqual(self.snapshot(), first)
+
+    def test_realistic_fan_out(self):
+        self.seed()
+        sizes = Counter(Order.objects.annotate(n=Count("products")).values_list("n", flat=True))
+        self.assertTrue(set(sizes) <= {1, 2, 3, 4, 5, 6, 8})
+        self.assertGreater(sizes[1], sizes[5])
+        popularity = sorted(Product.objects.annotate(n=Count("orders")).values_list("n", flat=True))
+        self.assertGreater(popularity[-1], 5 * max(1, popularity[len(popularity) // 2]))
+        # Totals, rollups and the search index are rebuilt after the bulk inserts.
+        self.assertFalse(Order.objects.filter(total_amount=0).exists())
+        self.assertEqual(DailySales.objects.aggregate(n=Sum("order_count"))["n"], 300)
+        self.assertEqual(get_search_backend().search(Product.objects.all(), "Product").count(), 20)
+
+    def test_existing_rows_and_flush(self):
+        alice = Customer.objects.create(name="Alice", email="alice@example.com")
+        order = Order.objects.create(customer=alice)
+        Order.objects.filter(pk=order.pk).update(total_amount="1.00")
+        seeding.generate(customers=5, products=5, orders=10)
+        # Totals are only recomputed for the generated orders.
+        self.assertEqual(Order.objects.get(pk=order.pk).total_amount, Decimal("1.00"))
+
+        seeding.flush()
+        with connection.cursor() as cursor:
+            for table in ("crm_customer_fts", "crm_product_fts", "crm_order_fts"):
+                self.assertEqual(cursor.execute(f"SELECT count(*) FROM {table}").fetchone()[0], 0)
+
+
+class SqlitePragmaTests(TestCase):
+    def pragma(self, name):
+        with connection.cursor() as cursor:
+            return cursor.execute(f"PRAGMA {name}").fetchone()[0]
+
+    def test_applied_to_new_connections(self):
+        # The in-memory test database cannot use WAL; the rest still applies.
+        self.assertEqual(self.pragma("busy_timeout"), 5000)
+        self.assertEqual(self.pragma("synchronous"), 1)  # NORMAL
+        self.assertEqual(self.pragma("cache_size"), -64 * 1024)
+
+    @override_settings(CRM_SQLITE_PRAGMAS={"busy_timeout": 100, "mmap_size": None})
+    def test_settings_override_single_pragmas(self):
+        pragmas = sqlite_pragmas()
+        self.assertEqual((pragmas["busy_timeout"], pragmas["synchronous"]), (100, "NORMAL"))
+        self.assertNotIn("mmap_size", pragmas)
+
+    def test_journal_mode_switched_once(self):
+        path = os.path.join(tempfile.mkdtemp(), "wal.sqlite3")
+        wrapper = connections.create_connection("default")
+        wrapper.settings_dict = {**wrapper.settings_dict, "NAME": path}
+        try:
+            # Connecting leaves the file's journal mode alone...
+            with wrapper.cursor() as cursor:
+                self.assertEqual(cursor.execute("PRAGMA journal_mode").fetchone()[0], "delete")
+            self.assertEqual(set_journal_mode(wrapper), "wal")
+            wrapper.close()
+            # ...and the switch persists for later connections.
+            with wrapper.cursor() as cursor:
+                self.assertEqual(cursor.execute("PRAGMA journal_mode").fetchone()[0], "wal")
+        finally:
+            wrapper.close()
+
+
+@override_settings(CRM_DB_ROUTING={"REPLICAS": ["replica"]})
+class ReplicaRoutingTests(TransactionTestCase):
+    PRODUCTS = "{ allProducts { edges { node { name stock } } } }"
+    CREATE = 'mutation { createCustomer(name: "Bob", email: "bob@example.com") { customer { id } } }'
+
+    @classmethod
+    def setUpClass(cls):
+        # A second SQLite file stands in for the replica. It is added here,
+        # after the test runner has set up the configured databases.
+        path = os.path.join(tempfile.mkdtemp(), "replica.sqlite3")
+        connections.settings["replica"] = {**connections.settings["default"], "NAME": path}
+        cls.databases = {"default", "replica"}
+        super().setUpClass()
+        call_command("migrate", database="replica", verbosity=0)
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        connections["replica"].close()
+        del connections["replica"]
+        del connections.settings["replica"]
+
+    def setUp(self):
+        # The replica lags behind the primary.
+        Product.objects.create(name="Cable", price="3.50", stock=5)
+        Product.objects.using("replica").create(name="Cable", price="3.50", stock=9)
+
+    def post(self, body):
+        return self.client.post("/graphql", body, content_type="application/json").json()
+
+    def stock(self, response):
+        return response["data"]["allProducts"]["edges"][0]["node"]["stock"]
+
+    def test_queries_read_from_replica(self):
+        self.assertEqual(self.stock(self.post({"query": self.PRODUCTS})), 9)
+        # Outside a GraphQL query, reads go to the primary.
+        self.assertEqual(Product.objects.get().stock, 5)
+
+    def test_mutations_write_primary_and_pin_later_reads(self):
+        create, products = self.post([{"query": self.CREATE}, {"query": self.PRODUCTS}])
+        self.assertNotIn("errors", create)
+        self.assertTrue(Customer.objects.filter(email="bob@example.com").exists())
+        self.assertFalse(Customer.objects.using("replica").exists())
+        self.assertEqual(self.stock(products), 5)
+        # The next request reads from the replica again.
+        self.assertEqual(self.stock(self.post({"query": self.PRODUCTS})), 9)
+
+    def test_reads_before_a_write_use_replica(self):
+        products, _ = self.post([{"query": self.PRODUCTS}, {"query": self.CREATE}])
+        self.assertEqual(self.stock(products), 9)
+
+    @override_settings(CRM_RESPONSE_CACHE={"ENABLED": True, "MAX_AGE": {"allProducts": 300}})
+    def test_replica_reads_are_not_cached(self):
+        cache.clear()
+        self.assertEqual(self.stock(self.post({"query": self.PRODUCTS})), 9)
+        # Once the replica catches up, the lagging answer is not served again.
+        Product.objects.using("replica").update(stock=5)
+        self.assertEqual(self.stock(self.post({"query": self.PRODUCTS})), 5)
+        # Responses read from the primary are still cached.
+        with override_settings(CRM_DB_ROUTING={"REPLICAS": []}):
+            self.post({"query": self.PRODUCTS})
+            response = self.client.post("/graphql", {"query": self.PRODUCTS}, content_type="application/json")
+        self.assertEqual(response["X-CRM-Cache"], "HIT")
+
+
+class TaskQueueTests(TestCase):
+    STATUS = "query ($id: ID!) { jobStatus(id: $id) { status attempts result error } }"
+
+    def work(self):
+        call_command("run_worker", processes=0, once=True, stdout=io.StringIO())
+
+    def test_mutation_returns_job_id(self):
+        alice = User.objects.create_user("alice")
+        result = execute(
+            'mutation { bulkCreateCustomers(input: ["{\\"name\\": \\"Bob\\", \\"email\\": \\"bob@example.com\\"}"],'
+            ' background: true) { jobId customers { id } } }',
+            user=alice,
+        )
+        self.assertIsNone(result.errors)
+        job_id = result.data["bulkCreateCustomers"]["jobId"]
+        self.assertIsNone(result.data["bulkCreateCustomers"]["customers"])
+        self.assertEqual(execute(self.STATUS, {"id": job_id}, alice).data["jobStatus"]["status"], "QUEUED")
+        self.assertFalse(Customer.objects.exists())
+
+        self.work()
+        status = execute(self.STATUS, {"id": job_id}, alice).data["jobStatus"]
+        bob = Customer.objects.get(email="bob@example.com")
+        self.assertEqual((status["status"], status["attempts"]), ("SUCCESS", 1))
+        self.assertEqual(json.loads(status["result"]), {"created": [bob.pk], "errors": []})
+
+    def test_job_status_is_for_the_owner_and_staff(self):
+        job = tasks.enqueue("restock_low_stock", owner=User.objects.create_user("alice"))
+        self.assertIsNone(execute(self.STATUS, {"id": job.pk}).data["jobStatus"])
+        self.assertIsNone(execute(self.STATUS, {"id": job.pk}, User.objects.create_user("eve")).data["jobStatus"])
+        staff = User.objects.create_user("ops", is_staff=True)
+        self.assertEqual(execute(self.STATUS, {"id": job.pk}, staff).data["jobStatus"]["status"], "QUEUED")
+
+    def test_cleanup_needs_delete_permission(self):
+        mutation = "mutation { cleanupInactiveCustomers(days: 30) { jobId } }"
+        clerk = User.objects.create_user("clerk", is_staff=True)
+        for user in (None, clerk):
+            result = execute(mutation, user=user)
+            self.assertEqual(result.errors[0].message, "You do not have permission to delete customers.")
+        self.assertFalse(Task.objects.exists())
+        clerk.user_permissions.add(Permission.objects.get(codename="delete_customer"))
+        clerk = User.objects.get(pk=clerk.pk)  # drop the cached permissions
+        result = execute(mutation, user=clerk)
+        self.assertIsNone(result.errors)
+        self.assertEqual(Task.objects.get().owner, clerk)
+
+    @override_settings(CRM_TASKS={
+        "bulk_create_customers": {"callable": "crm.tasks.bulk_create_customers", "max_attempts": 2, "backoff": 60},
+    })
+    def test_retries_with_backoff(self):
+        task = tasks.enqueue("bulk_create_customers", input=None)  # TypeError in the handler
+        with self.assertLogs("crm.tasks", "ERROR"):
+            self.work()
+        task.refresh_from_db()
+        self.assertEqual((task.status, task.attempts, task.slot), (Task.QUEUED, 1, None))
+        self.assertIn("TypeError", task.error)
+        self.assertGreater(task.run_after, timezone.now() + datetime.timedelta(seconds=55))
+        self.assertIsNone(tasks.claim())  # not due yet
+
+        Task.objects.filter(pk=task.pk).update(run_after=timezone.now())
+        with self.assertLogs("crm.tasks", "ERROR"):
+            self.work()
+        task.refresh_from_db()
+        self.assertEqual((task.status, task.attempts), (Task.FAILED, 2))
+
+    @override_settings(CRM_TASKS={"place_order": {"callable": "crm.orders.place_order", "max_attempts": 3}})
+    def test_validation_errors_are_not_retried(self):
+        task = tasks.enqueue("place_order", customer_id=0, product_ids=[])
+        with self.assertLogs("crm.tasks", "ERROR"):
+            self.work()
+        task.refresh_from_db()
+        self.assertEqual((task.status, task.attempts), (Task.FAILED, 1))
+        self.assertIn("Invalid customer ID.", task.error)
+
+        owner = User.objects.create_user("alice")
+        Task.objects.filter(pk=task.pk).update(owner=owner)
+        error = execute(self.STATUS, {"id": task.pk}, owner).data["jobStatus"]["error"]
+        self.assertEqual(error, "django.core.exceptions.ValidationError: ['Invalid customer ID.']")
+        staff = execute(self.STATUS, {"id": task.pk}, User.objects.create_user("ops", is_staff=True))
+        self.assertEqual(staff.data["jobStatus"]["error"], task.error)
+
+    def test_concurrency_limit_per_type(self):
+        first = tasks.enqueue("restock_low_stock")
+        second = tasks.enqueue("restock_low_stock")
+        bulk = tasks.enqueue("bulk_create_customers", input=[])
+        self.assertEqual(tasks.claim().pk, first.pk)
+        # restock_low_stock allows one running task; other types still run.
+        self.assertEqual(tasks.claim().pk, bulk.pk)
+        self.assertIsNone(tasks.claim())
+        tasks.run_task(first.pk)
+        self.assertEqual(tasks.claim().pk, second.pk)
+
+    def test_lost_tasks_are_requeued(self):
+        tasks.enqueue("restock_low_stock")
+        task = tasks.claim()
+        # A slow task whose worker still beats is left alone.
+        Task.objects.filter(pk=task.pk).update(started_at=timezone.now() - datetime.timedelta(hours=2))
+        self.assertEqual(tasks.heartbeat([task.pk]), 1)
+        tasks.requeue_lost(["restock_low_stock"])
+        task.refresh_from_db()
+        self.assertEqual(task.status, Task.RUNNING)
+
+        Task.objects.filter(pk=task.pk).update(heartbeat_at=timezone.now() - datetime.timedelta(minutes=10))
+        tasks.requeue_lost(["restock_low_stock"])
+        task.refresh_from_db()
+        self.assertEqual((task.status, task.slot, task.error), (Task.QUEUED, None, "Worker lost."))
+        self.assertEqual(tasks.claim().attempts, 2)
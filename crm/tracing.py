@@ -0,0 +1,247 @@
+"""Per-resolver tracing, SQL instrumentation and Prometheus metrics.
+
+Every GraphQL operation executed by crm.views is timed, and the SQL it runs is
+counted through a connection execute wrapper (installed in CrmConfig.ready).
+The totals feed per-operation histograms served at ``/metrics`` (to DEBUG,
+staff users, or scrapers sending the ``METRICS_TOKEN`` bearer token) and one
+structured ``crm.tracing`` log record per operation.
+
+When a request carries the trace header (``X-CRM-Trace: 1``) and tracing is
+allowed for it (DEBUG or a staff user), TracingMiddleware also records every
+resolver and the SQL it issued, returned as Apollo-tracing style
+``extensions.tracing``.
+"""
+import contextvars
+import hmac
+import logging
+import re
+import threading
+import time
+from datetime import datetime, timezone
+
+from django.conf import settings
+
+logger = logging.getLogger("crm.tracing")
+
+DEFAULTS = {
+    "HEADER": "HTTP_X_CRM_TRACE",
+    # Latency histogram buckets in seconds.
+    "BUCKETS": (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5),
+    # Distinct operation labels kept before the rest are reported as "other".
+    "MAX_OPERATIONS": 200,
+    # Bearer token letting a scraper read /metrics; None: DEBUG or staff only.
+    "METRICS_TOKEN": None,
+}
+
+
+def config():
+    return {**DEFAULTS, **getattr(settings, "CRM_TRACING", {})}
+
+
+current_trace = contextvars.ContextVar("crm_trace", default=None)
+current_path = contextvars.ContextVar("crm_trace_path", default=None)
+
+
+def wants_trace(request):
+    if request.META.get(config()["HEADER"]) in (None, "", "0"):
+        return False
+    user = getattr(request, "user", None)
+    return settings.DEBUG or bool(user is not None and user.is_staff)
+
+
+def can_scrape(request):
+    user = getattr(request, "user", None)
+    if settings.DEBUG or (user is not None and user.is_staff):
+        return True
+    token = config()["METRICS_TOKEN"]
+    header = request.META.get("HTTP_AUTHORIZATION", "")
+    return bool(token) and hmac.compare_digest(header.encode(), f"Bearer {token}".encode())
+
+
+class Trace:
+    """Timings of one operation; resolvers are kept only when ``detailed``."""
+
+    def __init__(self, operation_name, detailed=False):
+        self.operation_name = operation_name
+        self.detailed = detailed
+        self.start_time = datetime.now(timezone.utc)
+        self.start = time.perf_counter_ns()
+        self.end = None
+        self.resolvers = []
+        self.sql_count = 0
+        self.sql_duration = 0
+        self.sql_by_path = {}
+
+    @property
+    def duration(self):
+        return (self.end or time.perf_counter_ns()) - self.start
+
+    def record_sql(self, duration):
+        self.sql_count += 1
+        self.sql_duration += duration
+        if self.detailed:
+            path = current_path.get()
+            count, total = self.sql_by_path.get(path, (0, 0))
+            self.sql_by_path[path] = (count + 1, total + duration)
+
+    def extension(self):
+        resolvers = []
+        for entry in self.resolvers:
+            count, total = self.sql_by_path.get(tuple(entry["path"]), (0, 0))
+            if count:
+                entry = {**entry, "sql": {"count": count, "duration": total}}
+            resolvers.append(entry)
+        return {
+            "version": 1,
+            "startTime": self.start_time.isoformat(),
+            "endTime": datetime.now(timezone.utc).isoformat(),
+            "duration": self.duration,
+            "sql": {"count": self.sql_count, "duration": self.sql_duration},
+            "execution": {"resolvers": resolvers},
+        }
+
+
+def record_sql(execute, sql, params, many, context):
+    """Connection execute wrapper: attribute each query to the current trace."""
+    trace = current_trace.get()
+    if trace is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter_ns()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        trace.record_sql(time.perf_counter_ns() - start)
+
+
+def install_sql_wrapper(sender, connection, **kwargs):
+    if record_sql not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_sql)
+
+
+class TracingMiddleware:
+    """Graphene middleware recording each resolver's path and wall time."""
+
+    def resolve(self, next, root, info, **args):
+        trace = current_trace.get()
+        if trace is None or not trace.detailed:
+            return next(root, info, **args)
+        path = tuple(info.path.as_list())
+        entry = {
+            "path": list(path),
+            "parentType": str(info.parent_type),
+            "fieldName": info.field_name,
+            "returnType": str(info.return_type),
+            "startOffset": time.perf_counter_ns() - trace.start,
+        }
+        trace.resolvers.append(entry)
+        token = current_path.set(path)
+        try:
+            result = next(root, info, **args)
+        finally:
+            current_path.reset(token)
+        entry["duration"] = time.perf_counter_ns() - trace.start - entry["startOffset"]
+        return result
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+        self.count += 1
+        self.sum += value
+
+
+OPERATION_NAME_RE = re.compile(r"^[_A-Za-z][_0-9A-Za-z]{0,63}$")
+
+
+class Metrics:
+    """Per-process GraphQL metrics in the Prometheus text format."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latency = {}
+        self.sql_latency = {}
+        self.sql_queries = {}
+
+    def label(self, operation_name):
+        name = operation_name or "anonymous"
+        if not OPERATION_NAME_RE.match(name):
+            return "other"
+        if name not in self.latency and len(self.latency) >= config()["MAX_OPERATIONS"]:
+            return "other"
+        return name
+
+    def observe(self, trace):
+        buckets = config()["BUCKETS"]
+        with self._lock:
+            name = self.label(trace.operation_name)
+            self.latency.setdefault(name, Histogram(buckets)).observe(trace.duration / 1e9)
+            self.sql_latency.setdefault(name, Histogram(buckets)).observe(trace.sql_duration / 1e9)
+            self.sql_queries[name] = self.sql_queries.get(name, 0) + trace.sql_count
+
+    def reset(self):
+        with self._lock:
+            self.latency.clear()
+            self.sql_latency.clear()
+            self.sql_queries.clear()
+
+    def render(self, extra_counters=()):
+        lines = []
+        with self._lock:
+            for metric, histograms, help_text in (
+                ("crm_graphql_operation_duration_seconds", self.latency, "GraphQL operation wall time."),
+                ("crm_graphql_sql_duration_seconds", self.sql_latency, "SQL time per GraphQL operation."),
+            ):
+                lines += [f"# HELP {metric} {help_text}", f"# TYPE {metric} histogram"]
+                for name, histogram in sorted(histograms.items()):
+                    for bound, count in zip(histogram.buckets, histogram.counts):
+                        lines.append(f'{metric}_bucket{{operation="{name}",le="{bound}"}} {count}')
+                    lines.append(f'{metric}_bucket{{operation="{name}",le="+Inf"}} {histogram.count}')
+                    lines.append(f'{metric}_sum{{operation="{name}"}} {histogram.sum}')
+                    lines.append(f'{metric}_count{{operation="{name}"}} {histogram.count}')
+            metric = "crm_graphql_sql_queries_total"
+            lines += [f"# HELP {metric} SQL queries issued by GraphQL operations.", f"# TYPE {metric} counter"]
+            for name, count in sorted(self.sql_queries.items()):
+                lines.append(f'{metric}{{operation="{name}"}} {count}')
+        for metric, help_text, values in extra_counters:
+            lines += [f"# HELP {metric} {help_text}", f"# TYPE {metric} counter"]
+            for label, value in values.items():
+                lines.append(f'{metric}{{result="{label}"}} {value}')
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
+
+
+class trace_operation:
+    """Context manager timing one operation for metrics, logs and tracing."""
+
+    def __init__(self, request, operation_name):
+        self.trace = Trace(operation_name, detailed=wants_trace(request))
+        request.crm_trace = self.trace
+
+    def __enter__(self):
+        self.token = current_trace.set(self.trace)
+        return self.trace
+
+    def __exit__(self, *exc_info):
+        current_trace.reset(self.token)
+        trace = self.trace
+        trace.end = time.perf_counter_ns()
+        metrics.observe(trace)
+        logger.info(
+            "graphql operation",
+            extra={
+                "operation": trace.operation_name,
+                "duration_ms": round(trace.duration / 1e6, 3),
+                "sql_count": trace.sql_count,
+                "sql_ms": round(trace.sql_duration / 1e6, 3),
+            },
+        )
@@ -1,3 +1,439 @@
-from django.shortcuts import render
+import contextvars
+import copy
+import json
+from concurrent.futures import ThreadPoolExecutor
 
-# Create your views here.
+from django.conf import settings
+from django.contrib.auth.decorators import permission_required
+from django.db import connection, connections, transaction
+from django.http import (
+    Http404, HttpResponse, HttpResponseBadRequest, HttpResponseForbidden, HttpResponseNotAllowed,
+    StreamingHttpResponse,
+)
+from django.views.decorators.http import require_GET
+from graphene_django.constants import MUTATION_ERRORS_FLAG
+from graphene_django.settings import graphene_settings
+from graphene_django.utils.utils import set_rollback
+from graphene_django.views import GraphQLView, HttpError
+from graphql import ExecutionResult, OperationType, execute, get_operation_ast, specified_rules
+
+from . import response_cache
+from .documents import PersistedQueryError, document_cache, resolve_persisted_query
+from .export import FORMATS, export_lines, parse_moment
+from .loaders import Loaders
+from .query_cost import CostBudget, QueryCostRule, cost_error, operation_cost
+from .routing import current_request, replica_reads, routed_request
+from .tracing import TracingMiddleware, can_scrape, metrics, trace_operation
+
+BATCH_DEFAULTS = {
+    "ENABLED": True,
+    # Operations accepted in one batched POST.
+    "MAX_SIZE": 20,
+    # Total cost of a batch's operations; None: CRM_QUERY_COST["MAX_COST"].
+    "MAX_COST": None,
+    # Run consecutive query operations of a batch concurrently, in a pool of
+    # PARALLEL_WORKERS threads with one database connection each.
+    "PARALLEL_READS": False,
+    "PARALLEL_WORKERS": 4,
+}
+
+
+def batch_config():
+    return {**BATCH_DEFAULTS, **getattr(settings, "CRM_GRAPHQL_BATCH", {})}
+
+
+class CRMGraphQLView(GraphQLView):
+    """GraphQLView with a parsed-document cache, persisted queries and an
+    opt-in response cache.
+
+    Documents are parsed and validated once per distinct query text (see
+    crm.documents) instead of on every request; read-only responses may be
+    served from crm.response_cache. Validation includes the static cost and
+    depth limits of crm.query_cost, and the cost is reported in
+    ``extensions.cost``. Executed operations are timed by crm.tracing.
+
+    A POSTed JSON array is executed as a batch (see ``dispatch_batch``).
+    """
+
+    validation_rules = (*specified_rules, QueryCostRule)
+
+    def dispatch(self, request, *args, **kwargs):
+        with routed_request():
+            if self.is_batch_request(request):
+                return self.dispatch_batch(request)
+            response = super().dispatch(request, *args, **kwargs)
+        return self.add_cache_headers(request, response)
+
+    def is_batch_request(self, request):
+        return (
+            request.method == "POST"
+            and batch_config()["ENABLED"]
+            and self.get_content_type(request) == "application/json"
+            and request.body.lstrip()[:1] == b"["
+        )
+
+    def dispatch_batch(self, request):
+        """Execute a JSON array of operations and return an array of results.
+
+        Entries run in order against shallow copies of the request, so
+        per-operation state (cost, trace, cache status) stays separate while
+        the DataLoaders and the database connection are shared. Each result
+        carries the entry's ``id`` and ``status``; cache headers are not set,
+        ``extensions.cacheControl`` is reported per entry instead.
+
+        The entries' costs add up against one budget: the entry that takes the
+        total over ``MAX_COST``, and every entry after it, fails with
+        ``BATCH_TOO_COSTLY`` without executing.
+        """
+        try:
+            try:
+                data = json.loads(request.body.decode("utf-8"))
+            except (UnicodeDecodeError, ValueError):
+                raise HttpError(HttpResponseBadRequest("POST body sent invalid JSON."))
+            max_size = batch_config()["MAX_SIZE"]
+            if not data:
+                raise HttpError(HttpResponseBadRequest("Received an empty list in the batch request."))
+            if len(data) > max_size:
+                raise HttpError(HttpResponseBadRequest(
+                    f"Batch of {len(data)} operations exceeds the maximum of {max_size}."
+                ))
+        except HttpError as e:
+            response = e.response
+            response["Content-Type"] = "application/json"
+            response.content = self.json_encode(request, {"errors": [self.format_error(e)]})
+            return response
+
+        responses = self.get_batch_responses(request, data)
+        result = "[{}]".format(",".join(body for body, _ in responses))
+        status_code = max(status for _, status in responses)
+        return HttpResponse(status=status_code, content=result, content_type="application/json")
+
+    def get_batch_responses(self, request, data):
+        """Return ``(body, status)`` per entry, in order.
+
+        Loaders are replaced after any operation that is not a query, so later
+        entries never read rows cached before a mutation. With PARALLEL_READS,
+        each run of consecutive queries executes concurrently (see
+        ``get_parallel_responses``).
+        """
+        options = batch_config()
+        # Worker threads have their own connections, which cannot see the
+        # writes of an open transaction on this one.
+        parallel = options["PARALLEL_READS"] and not connection.in_atomic_block
+        responses, reads = [], []
+        loaders = Loaders()
+        budget = CostBudget(options["MAX_COST"])
+        for entry in data:
+            if parallel and self.is_read_operation(request, entry):
+                reads.append(entry)
+                continue
+            if reads:
+                responses += self.get_parallel_responses(request, reads, budget)
+                reads = []
+            entry_request = self.get_entry_request(request, loaders, budget)
+            responses.append(self.get_entry_response(entry_request, entry))
+            if getattr(entry_request, "crm_operation_type", None) != OperationType.QUERY:
+                loaders = Loaders()
+        if reads:
+            responses += self.get_parallel_responses(request, reads, budget)
+        return responses
+
+    def get_parallel_responses(self, request, entries, budget):
+        """Run query entries in a thread pool; return their responses in order.
+
+        Each entry gets its own DataLoaders (they are not thread-safe) and runs
+        in a copy of this thread's context, so the request's replica routing
+        and tracing apply. Workers close their connections when done. Which of
+        several concurrent entries exceeds the batch cost budget first is not
+        fixed.
+        """
+        def run(entry):
+            try:
+                entry_request = self.get_entry_request(request, Loaders(), budget)
+                return self.get_entry_response(entry_request, entry)
+            finally:
+                connections.close_all()
+
+        workers = min(len(entries), batch_config()["PARALLEL_WORKERS"])
+        with ThreadPoolExecutor(workers) as executor:
+            futures = [executor.submit(contextvars.copy_context().run, run, entry) for entry in entries]
+            return [future.result() for future in futures]
+
+    def is_read_operation(self, request, entry):
+        if not isinstance(entry, dict):
+            return False
+        try:
+            query, _, operation_name, _ = self.get_operation(request, entry)
+        except (HttpError, PersistedQueryError):
+            return False
+        if not query:
+            return False
+        document, errors = document_cache.get(self.schema.graphql_schema, query, self.validation_rules)
+        if document is None or errors:
+            return False
+        operation_ast = get_operation_ast(document, operation_name)
+        return operation_ast is not None and operation_ast.operation == OperationType.QUERY
+
+    def get_entry_request(self, request, loaders, budget=None):
+        entry_request = copy.copy(request)
+        entry_request.loaders = loaders
+        entry_request.crm_cost_budget = budget
+        return entry_request
+
+    def get_entry_response(self, request, entry):
+        if not isinstance(entry, dict):
+            errors = [{"message": "Batch entries must be JSON objects."}]
+            return self.batch_entry(request, {"errors": errors}, None, 400)
+        try:
+            body, status_code = self.get_response(request, entry)
+        except HttpError as e:
+            errors = [self.format_error(e)]
+            return self.batch_entry(request, {"errors": errors}, entry.get("id"), e.response.status_code)
+        return self.batch_entry(request, json.loads(body), entry.get("id"), status_code)
+
+    def batch_entry(self, request, response, id, status_code):
+        # Bodies are formatted (and response-cached) as for single requests;
+        # the batch fields are added here.
+        return self.json_encode(request, {**response, "id": id, "status": status_code}), status_code
+
+    def add_cache_headers(self, request, response):
+        status = getattr(request, "crm_cache_status", None)
+        if status is not None:
+            response["X-CRM-Cache"] = status
+            response["Cache-Control"] = f"private, max-age={request.crm_cache_max_age}"
+        return response
+
+    def get_response(self, request, data, show_graphiql=False):
+        try:
+            query, variables, operation_name, id = self.get_operation(request, data)
+        except PersistedQueryError as e:
+            return self.json_encode(request, {"errors": [e.as_error()]}), 200
+
+        cached, plan, key = self.get_cached_response(request, query, variables, operation_name)
+        if cached is not None:
+            return cached, 200
+        with trace_operation(request, operation_name):
+            execution_result = self.execute_graphql_request(
+                request, data, query, variables, operation_name, show_graphiql
+            )
+        return self.finish_response(request, execution_result, id, show_graphiql, plan, key)
+
+    def get_operation(self, request, data):
+        """Return ``(query, variables, operation_name, id)`` with APQ applied."""
+        query, variables, operation_name, id = self.get_graphql_params(request, data)
+        extensions = request.GET.get("extensions") or data.get("extensions")
+        try:
+            if isinstance(extensions, str):
+                extensions = json.loads(extensions)
+            query = resolve_persisted_query(query, extensions)
+        except (TypeError, ValueError):
+            raise HttpError(HttpResponseBadRequest("Extensions are invalid JSON."))
+        return query, variables, operation_name, id
+
+    def get_cached_response(self, request, query, variables, operation_name):
+        """Return ``(cached, plan, key)``; ``plan`` is None when not cacheable."""
+        if not query or not response_cache.config()["ENABLED"]:
+            return None, None, None
+        schema = self.schema.graphql_schema
+        document, errors = document_cache.get(schema, query, self.validation_rules)
+        if document is None or errors:
+            return None, None, None
+        plan = response_cache.plan_for(schema, document, operation_name)
+        if plan is None:
+            return None, None, None
+        key = response_cache.cache_key(request, document, variables, operation_name, plan)
+        cached = response_cache.get_cache().get(key)
+        request.crm_cache_max_age = plan.max_age
+        request.crm_cache_status = "HIT" if cached is not None else "MISS"
+        response_cache.stats.record("hits" if cached is not None else "misses")
+        return cached, plan, key
+
+    def finish_response(self, request, execution_result, id, show_graphiql, plan, key):
+        extensions = {}
+        cost = getattr(request, "crm_query_cost", None)
+        if cost is not None:
+            extensions["cost"] = cost.extension()
+        if plan is not None:
+            extensions["cacheControl"] = plan.extension()
+        trace = getattr(request, "crm_trace", None)
+        if trace is not None and trace.detailed:
+            extensions["tracing"] = trace.extension()
+            key = None  # A traced response must not be served to other clients.
+        routing = current_request.get()
+        if routing is not None and routing.read_replica:
+            key = None  # The replica may lag behind the bumped versions.
+        if extensions and execution_result is not None:
+            execution_result.extensions = {**(execution_result.extensions or {}), **extensions}
+        result, status_code = self.format_execution_result(
+            request, execution_result, id, show_graphiql
+        )
+        if key is not None and execution_result is not None and not execution_result.errors:
+            response_cache.get_cache().set(key, result, plan.max_age)
+            response_cache.stats.record("stores")
+        return result, status_code
+
+    def format_execution_result(self, request, execution_result, id=None, show_graphiql=False):
+        """GraphQLView.get_response's formatting, plus the ``extensions`` key."""
+        if getattr(request, MUTATION_ERRORS_FLAG, False) is True:
+            set_rollback()
+
+        if not execution_result:
+            return None, 200
+
+        status_code = 200
+        response = {}
+        if execution_result.errors:
+            set_rollback()
+            response["errors"] = [self.format_error(e) for e in execution_result.errors]
+
+        if execution_result.errors and any(
+            not getattr(e, "path", None) for e in execution_result.errors
+        ):
+            status_code = 400
+        else:
+            response["data"] = execution_result.data
+
+        if execution_result.extensions:
+            response["extensions"] = execution_result.extensions
+
+        if self.batch:
+            response["id"] = id
+            response["status"] = status_code
+
+        return self.json_encode(request, response, pretty=show_graphiql), status_code
+
+    def execute_graphql_request(
+        self, request, data, query, variables, operation_name, show_graphiql=False
+    ):
+        if not query:
+            if show_graphiql:
+                return None
+            raise HttpError(HttpResponseBadRequest("Must provide query string."))
+
+        schema = self.schema.graphql_schema
+        document, errors = document_cache.get(schema, query, self.validation_rules)
+        if document is None:
+            return ExecutionResult(errors=errors)
+
+        operation_ast = get_operation_ast(document, operation_name)
+        if (
+            request.method.lower() == "get"
+            and operation_ast is not None
+            and operation_ast.operation != OperationType.QUERY
+        ):
+            if show_graphiql:
+                return None
+            raise HttpError(
+                HttpResponseNotAllowed(
+                    ["POST"],
+                    "Can only perform a {} operation from a POST request.".format(
+                        operation_ast.operation.value
+                    ),
+                )
+            )
+
+        if errors:
+            return ExecutionResult(data=None, errors=errors)
+
+        error = self.record_operation(request, document, operation_ast, operation_name, variables)
+        if error is not None:
+            return ExecutionResult(errors=[error])
+        # Queries may read from a replica (see crm.routing); anything else
+        # pins the rest of the request to the primary.
+        with replica_reads(request.crm_operation_type == OperationType.QUERY):
+            try:
+                execute_options = self.get_execute_options(request, variables, operation_name)
+                if (
+                    operation_ast is not None
+                    and operation_ast.operation == OperationType.MUTATION
+                    and (
+                        graphene_settings.ATOMIC_MUTATIONS is True
+                        or connection.settings_dict.get("ATOMIC_MUTATIONS", False) is True
+                    )
+                ):
+                    with transaction.atomic():
+                        result = execute(schema, document, **execute_options)
+                        if getattr(request, MUTATION_ERRORS_FLAG, False) is True:
+                            transaction.set_rollback(True)
+                    return result
+
+                return execute(schema, document, **execute_options)
+            except Exception as e:
+                return ExecutionResult(errors=[e])
+
+    def record_operation(self, request, document, operation_ast, operation_name, variables=None):
+        """Record the operation on the request; return a cost error to fail it with, if any."""
+        # Recosted with the actual variables, which validation could not see.
+        cost = operation_cost(
+            self.schema.graphql_schema, document, operation_name,
+            variables if isinstance(variables, dict) else None,
+        )
+        request.crm_query_cost = cost
+        request.crm_operation_type = operation_ast.operation if operation_ast is not None else None
+        trace = getattr(request, "crm_trace", None)
+        if trace is not None and operation_ast is not None and operation_ast.name is not None:
+            trace.operation_name = operation_ast.name.value
+        if cost is None:
+            return None
+        error = cost_error(cost, operation_name)
+        budget = getattr(request, "crm_cost_budget", None)
+        if error is None and budget is not None:
+            error = budget.charge(cost, operation_name)
+        return error
+
+    def get_middleware(self, request):
+        middleware = super().get_middleware(request)
+        trace = getattr(request, "crm_trace", None)
+        if trace is None or not trace.detailed:
+            return middleware
+        return [*(middleware or ()), TracingMiddleware()]
+
+    def get_execute_options(self, request, variables, operation_name):
+        execute_options = {
+            "root_value": self.get_root_value(request),
+            "context_value": self.get_context(request),
+            "variable_values": variables,
+            "operation_name": operation_name,
+            "middleware": self.get_middleware(request),
+        }
+        if self.execution_context_class:
+            execute_options["execution_context_class"] = self.execution_context_class
+        return execute_options
+
+
+@require_GET
+def metrics_view(request):
+    """Prometheus scrape endpoint for the GraphQL metrics of this process."""
+    if not can_scrape(request):
+        return HttpResponseForbidden()
+    documents = document_cache.stats()
+    body = metrics.render(extra_counters=[
+        ("crm_graphql_document_cache_total", "Parsed-document cache lookups.",
+         {"hit": documents["hits"], "miss": documents["misses"]}),
+        ("crm_graphql_response_cache_total", "Response cache lookups and stores.",
+         response_cache.stats.as_dict()),
+    ])
+    return HttpResponse(body, content_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+EXPORT_CONTENT_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv; charset=utf-8"}
+
+
+@require_GET
+@permission_required("crm.view_order", raise_exception=True)
+def export_orders_view(request, fmt):
+    """Stream orders placed in ``[since, until)`` as NDJSON or CSV.
+
+    The rows carry customer names and emails, so the view needs the
+    ``crm.view_order`` permission (403 otherwise).
+    """
+    if fmt not in FORMATS:
+        raise Http404(f"Unknown export format: {fmt}")
+    try:
+        since = parse_moment(request.GET.get("since"))
+        until = parse_moment(request.GET.get("until"))
+    except ValueError as e:
+        return HttpResponseBadRequest(str(e))
+    response = StreamingHttpResponse(export_lines(fmt, since, until), content_type=EXPORT_CONTENT_TYPES[fmt])
+    response["Content-Disposition"] = f'attachment; filename="orders.{fmt}"'
+    return response
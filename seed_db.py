@@ -1,5 +1,11 @@
+"""Seed the database.
+
+    python seed_db.py                  # the two-customer demo data
+    python seed_db.py --orders 100000  # generated data, see `manage.py seed_db --help`
+"""
 import django
 import os
+import sys
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'alx_backend_graphql.settings')
 django.setup()
@@ -24,4 +30,8 @@ def seed():
     print("✅ Seed complete!")
 
 if __name__ == "__main__":
-    seed()
+    if len(sys.argv) > 1:
+        from django.core.management import call_command
+        call_command("seed_db", *sys.argv[1:])
+    else:
+        seed()
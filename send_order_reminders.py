@@ -1,9 +1,7 @@
 # crm/cron_jobs/send_order_reminders.py
 
 import os
-import datetime
-from gql import gql, Client
-from gql.transport.requests import RequestsHTTPTransport
+import sys
 
 # === Windows-safe log path ===
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -12,45 +10,18 @@ os.makedirs(LOG_DIR, exist_ok=True)
 LOG_FILE = os.path.join(LOG_DIR, 'order_reminders_log.txt')
 
 def main():
-    # DISABLE schema fetching
-    transport = RequestsHTTPTransport(
-        url='http://localhost:8000/graphql',
-        # No use_schema, no fetch_schema
-    )
-
-    # CRITICAL: Set fetch_schema=False
-    client = Client(
-        transport=transport,
-        fetch_schema=False  # This stops the error
-    )
-
-    today = datetime.date.today()
-    week_ago = today - datetime.timedelta(days=7)
-
-    query = gql(f'''
-    query {{
-      allOrders(orderDate_Gte: "{week_ago}", orderDate_Lte: "{today}") {{
-        edges {{
-          node {{
-            id
-            customer {{ email }}
-          }}
-        }}
-      }}
-    }}
-    ''')
-
+    # In-process: the send_order_reminders command reads the 7-day window
+    # with one indexed query instead of a GraphQL round-trip to localhost.
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'alx_backend_graphql.settings')
     try:
-        result = client.execute(query)
-        timestamp = datetime.datetime.now().isoformat()
-
-        with open(LOG_FILE, 'a', encoding='utf-8') as f:
-            for edge in result['allOrders']['edges']:
-                order = edge['node']
-                f.write(f"{timestamp} - Order {order['id']} → {order['customer']['email']}\n")
+        import django
+        django.setup()
+        from django.core.management import call_command
+        call_command('send_order_reminders', log_file=LOG_FILE)
         print("Order reminders processed!")
     except Exception as e:
         print(f"Error: {e}")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()